@@ -0,0 +1 @@
+from genomedisco.scoring import score
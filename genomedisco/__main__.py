@@ -7,6 +7,7 @@ from genomedisco import concordance_utils
 def main():
     command_methods = {'preprocess': concordance_utils.preprocess,
                          'concordance': concordance_utils.concordance,
+                         'report': concordance_utils.report,
                          'summary': concordance_utils.summary,
                          'cleanup':concordance_utils.clean_up,
                        'run_all': concordance_utils.run_all}
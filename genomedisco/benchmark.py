@@ -0,0 +1,217 @@
+from __future__ import print_function
+import argparse
+import gzip
+import os
+import sys
+import time
+import resource
+import multiprocessing
+from time import strftime
+import numpy as np
+
+from genomedisco import concordance_utils, data_operations, processing, instrumentation
+from genomedisco import simulations_from_real_data as simulations
+from genomedisco.comparison_types.disco_random_walks import DiscoRandomWalks
+
+#one row per (benchmark, dataset). n and nnz describe the chromosome used by the per-stage benchmarks
+columns=['benchmark','dataset','n','nnz','depth','resolution','wall_time','cpu_time','peak_rss_mb','baseline_wall_time','baseline_peak_rss_mb','status']
+all_benchmarks=['preprocess','nodes','parse','subsample','normalize','random_walks','run_all']
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the main steps of GenomeDISCO on synthetic contact maps and on the example data. Each benchmark runs in a fresh process, so that its peak memory is measured on its own.')
+    parser.add_argument('--outdir',default='benchmark',help='Directory for the benchmark data and results. DEFAULT: benchmark')
+    parser.add_argument('--benchmarks',default='all',help='Comma-delimited list of benchmarks to run, among '+','.join(all_benchmarks)+'. DEFAULT: all')
+    parser.add_argument('--bins',default='500,1000,2000',help='Comma-delimited list of numbers of bins for the synthetic contact maps. "NA" skips the synthetic data.')
+    parser.add_argument('--depths',default='100000,1000000',help='Comma-delimited list of sequencing depths for the synthetic contact maps, which set their density.')
+    parser.add_argument('--resolutions',default='50000',help='Comma-delimited list of bin sizes (in bp) for the synthetic contact maps.')
+    parser.add_argument('--examples',default=os.path.dirname(os.path.dirname(os.path.realpath(__file__)))+'/examples',help='Directory with the example data (HIC001.res50000.gz, HIC002.res50000.gz, Bins.w50000.bed.gz). "NA" skips the example data.')
+    parser.add_argument('--norms',default='uniform,sqrtvc,coverage_norm,fill_diagonal,ice')
+    parser.add_argument('--ts',default='1,2,3,4,5',help='Random walk lengths to benchmark.')
+    parser.add_argument('--seed',type=int,default=7)
+    parser.add_argument('--baseline',default='NA',help='Results file of an earlier run to compare against.')
+    parser.add_argument('--tolerance',type=float,default=0.25,help='A benchmark is reported as a regression if its wall time or peak memory exceeds the baseline by more than this fraction. DEFAULT: 0.25')
+    parser.add_argument('--min_time',type=float,default=0.1,help='Wall time differences below this many seconds are not reported as regressions, as they are within the noise of short benchmarks. DEFAULT: 0.1')
+    parser.add_argument('--out',default='NA',help='Results file. DEFAULT: outdir/benchmark.results.txt')
+    args = parser.parse_args()
+
+    args.outdir=os.path.abspath(args.outdir)
+    if args.out=='NA':
+        args.out=args.outdir+'/benchmark.results.txt'
+    benchmarks=all_benchmarks
+    if args.benchmarks!='all':
+        benchmarks=args.benchmarks.split(',')
+
+    datasets=[]
+    if args.bins!='NA':
+        for n in [int(x) for x in args.bins.split(',')]:
+            for depth in [int(x) for x in args.depths.split(',')]:
+                for resolution in [int(x) for x in args.resolutions.split(',')]:
+                    name='synthetic.n'+str(n)+'.depth'+str(depth)+'.res'+str(resolution)
+                    datasets.append({'name':name,'dir':args.outdir+'/data/'+name,'n':n,'depth':depth,'resolution':resolution,'seed':args.seed})
+    if args.examples!='NA':
+        datasets.append({'name':'examples','dir':args.outdir+'/data/examples','examples':os.path.abspath(args.examples),'depth':'NA','resolution':50000})
+
+    cases=[]
+    for benchmark in benchmarks:
+        if benchmark=='normalize':
+            cases+=[('normalize.'+norm,norm) for norm in args.norms.split(',')]
+        elif benchmark=='random_walks':
+            cases+=[('random_walks.t'+t,int(t)) for t in args.ts.split(',')]
+        elif benchmark!='preprocess':
+            cases.append((benchmark,None))
+
+    #each case runs in a new worker process
+    pool=multiprocessing.Pool(1,maxtasksperchild=1)
+    rows=[]
+    for dataset in datasets:
+        print("GenomeDISCO | "+strftime("%c")+" | Benchmark: preparing "+dataset['name'])
+        dataset.update(pool.apply(prepare_dataset,(dataset,)))
+        print("GenomeDISCO | "+strftime("%c")+" | Benchmark: preprocess on "+dataset['name'])
+        preprocess_measurement=pool.apply(run_case,('preprocess',None,dataset))
+        dataset.update(pool.apply(describe_dataset,(dataset,)))
+        if 'preprocess' in benchmarks:
+            rows.append(benchmark_row('preprocess',dataset,preprocess_measurement))
+        for case_name,param in cases:
+            print("GenomeDISCO | "+strftime("%c")+" | Benchmark: "+case_name+" on "+dataset['name'])
+            rows.append(benchmark_row(case_name,dataset,pool.apply(run_case,(case_name,param,dataset))))
+    pool.close()
+    pool.join()
+
+    regressions=compare_to_baseline(rows,args.baseline,args.tolerance,args.min_time)
+    out=open(args.out,'w')
+    out.write('#'+'\t'.join(columns)+'\n')
+    for row in rows:
+        out.write('\t'.join([str(x) for x in row])+'\n')
+    out.close()
+    print("GenomeDISCO | "+strftime("%c")+" | Benchmark results written to "+args.out)
+    if regressions>0:
+        print("GenomeDISCO | "+strftime("%c")+" | "+str(regressions)+" benchmarks are slower or use more memory than the baseline")
+        sys.exit(1)
+
+def measure(function,*function_args):
+    #wall time, CPU time and peak RSS of a call, including the subprocesses it runs (e.g. the scripts written by the pipeline)
+    wall_start=time.time()
+    cpu_start=instrumentation.cpu_time()+instrumentation.cpu_time(resource.RUSAGE_CHILDREN)
+    function(*function_args)
+    wall=time.time()-wall_start
+    cpu=instrumentation.cpu_time()+instrumentation.cpu_time(resource.RUSAGE_CHILDREN)-cpu_start
+    peak=max(instrumentation.peak_rss_mb(),instrumentation.peak_rss_mb(resource.RUSAGE_CHILDREN))
+    return [wall,cpu,peak]
+
+def benchmark_row(case_name,dataset,measurement):
+    wall,cpu,peak=measurement
+    return [case_name,dataset['name'],dataset['n'],dataset['nnz'],dataset['depth'],dataset['resolution'],'{:.4f}'.format(wall),'{:.4f}'.format(cpu),'{:.1f}'.format(peak),'NA','NA','NA']
+
+def write_synthetic_dataset(dataset):
+    #a pair of contact maps sampled with the simulator from a power-law distance dependence, on one chromosome
+    n,resolution=dataset['n'],dataset['resolution']
+    distance=np.abs(np.subtract.outer(np.arange(n),np.arange(n))).astype(float)
+    power_law=np.triu(1.0/np.maximum(distance,1.0),k=1)
+    prob_matrix=simulations.get_probability_matrix(power_law,power_law.copy(),0.0,0.0,0,n,np.random.RandomState(dataset['seed']))
+    node_names=np.arange(n)*resolution
+    samples=open(dataset['dir']+'/metadata.samples','w')
+    for sample_idx in range(2):
+        samplename='SIM'+str(sample_idx+1)
+        sampled=simulations.sample_interactions(prob_matrix,dataset['depth'],np.random.RandomState(dataset['seed']+1+sample_idx))
+        processing.write_sparse_matrix_text(sampled,dataset['dir']+'/'+samplename+'.gz',node_names,'chr1',1)
+        samples.write(samplename+'\t'+dataset['dir']+'/'+samplename+'.gz'+'\n')
+    samples.close()
+    bins=gzip.open(dataset['dir']+'/bins.bed.gz','w')
+    for i in range(n):
+        bins.write('chr1\t'+str(i*resolution)+'\t'+str((i+1)*resolution)+'\t'+str(i*resolution)+'\n')
+    bins.close()
+    return dataset['dir']+'/metadata.samples',dataset['dir']+'/bins.bed.gz'
+
+def write_examples_dataset(dataset):
+    samples=open(dataset['dir']+'/metadata.samples','w')
+    for samplename in ['HIC001','HIC002']:
+        samples.write(samplename+'\t'+dataset['examples']+'/'+samplename+'.res50000.gz'+'\n')
+    samples.close()
+    return dataset['dir']+'/metadata.samples',dataset['examples']+'/Bins.w50000.bed.gz'
+
+def prepare_dataset(dataset):
+    if not os.path.exists(dataset['dir']):
+        os.makedirs(dataset['dir'])
+    if 'examples' in dataset:
+        samples_file,bins=write_examples_dataset(dataset)
+    else:
+        samples_file,bins=write_synthetic_dataset(dataset)
+    samplenames=[line.split()[0] for line in open(samples_file,'r')]
+    pairs_file=dataset['dir']+'/metadata.pairs'
+    pairs=open(pairs_file,'w')
+    pairs.write(samplenames[0]+'\t'+samplenames[1]+'\n')
+    pairs.close()
+    return {'samples':samples_file,'pairs':pairs_file,'bins':bins,'samplenames':samplenames[:2]}
+
+def describe_dataset(dataset):
+    #the per-stage benchmarks use the first chromosome written by preprocess
+    preprocessed=dataset['dir']+'/preprocess'
+    chromo=sorted([line.strip() for line in gzip.open(preprocessed+'/data/metadata/chromosomes.gz','r')])[0]
+    nodefile=preprocessed+'/data/nodes/nodes.'+chromo+'.gz'
+    matrices=[preprocessed+'/data/edges/'+s+'/'+s+'.'+chromo+'.gz' for s in dataset['samplenames']]
+    nodes,nodes_idx,blacklisted_nodes=processing.read_nodes_from_bed(nodefile)
+    m1=processing.construct_csr_matrix_from_data_and_nodes(matrices[0],nodes)
+    return {'nodes':nodefile,'matrices':matrices,'n':len(nodes),'nnz':m1.nnz}
+
+def load_pair(dataset):
+    nodes,nodes_idx,blacklisted_nodes=processing.read_nodes_from_bed(dataset['nodes'])
+    return [processing.construct_csr_matrix_from_data_and_nodes(f,nodes) for f in dataset['matrices']]
+
+def score(m1,m2,t):
+    args=argparse.Namespace(tmin=t,tmax=t,transition=True,concise_analysis=True)
+    DiscoRandomWalks(args).compute_reproducibility(m1,m2,args)
+
+def run_case(case_name,param,dataset):
+    #runs in a worker process. Inputs are loaded before the measured call, but the peak RSS covers the whole process
+    if case_name=='preprocess':
+        return measure(concordance_utils.preprocess,dataset['samples'],dataset['bins'],False,'GenomeDISCO',dataset['dir']+'/preprocess','NA','NA','NA',False)
+    if case_name=='nodes':
+        return measure(processing.read_nodes_from_bed,dataset['nodes'])
+    if case_name=='parse':
+        nodes,nodes_idx,blacklisted_nodes=processing.read_nodes_from_bed(dataset['nodes'])
+        return measure(processing.construct_csr_matrix_from_data_and_nodes,dataset['matrices'][0],nodes)
+    if case_name=='run_all':
+        outdir=dataset['dir']+'/run_all'
+        return measure(concordance_utils.run_all,dataset['samples'],dataset['pairs'],dataset['bins'],False,'GenomeDISCO','NA',outdir,'NA',True,'NA',False)
+    m1,m2=load_pair(dataset)
+    if case_name=='subsample':
+        return measure(data_operations.subsample_to_depth,m1,0.5*m1.sum())
+    if case_name.startswith('normalize.'):
+        return measure(data_operations.process_matrix,m1,param)
+    if case_name.startswith('random_walks.'):
+        depth=min(m1.sum(),m2.sum())
+        if m1.sum()>depth:
+            m1=data_operations.subsample_to_depth(m1,depth)
+        if m2.sum()>depth:
+            m2=data_operations.subsample_to_depth(m2,depth)
+        return measure(score,data_operations.process_matrix(m1,'sqrtvc'),data_operations.process_matrix(m2,'sqrtvc'),param)
+
+def compare_to_baseline(rows,baseline,tolerance,min_time=0.1):
+    #fills in the baseline columns and the status of each row, and returns the number of regressions
+    baseline_rows={}
+    if baseline!='NA':
+        for line in open(baseline,'r'):
+            if line.startswith('#'):
+                continue
+            items=line.rstrip('\n').split('\t')
+            baseline_rows[(items[0],items[1])]=(float(items[columns.index('wall_time')]),float(items[columns.index('peak_rss_mb')]))
+    regressions=0
+    for row in rows:
+        key=(row[0],row[1])
+        if key not in baseline_rows:
+            row[-1]='new'
+            continue
+        baseline_wall,baseline_peak=baseline_rows[key]
+        row[-3]='{:.4f}'.format(baseline_wall)
+        row[-2]='{:.1f}'.format(baseline_peak)
+        wall=float(row[columns.index('wall_time')])
+        peak=float(row[columns.index('peak_rss_mb')])
+        if (wall>baseline_wall*(1.0+tolerance) and wall-baseline_wall>min_time) or peak>baseline_peak*(1.0+tolerance):
+            row[-1]='regression'
+            regressions+=1
+        else:
+            row[-1]='ok'
+    return regressions
+
+if __name__=="__main__":
+    main()
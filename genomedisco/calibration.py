@@ -0,0 +1,86 @@
+from __future__ import print_function
+import argparse
+import copy
+from time import strftime
+import numpy as np
+
+from genomedisco import processing, data_operations
+from genomedisco import simulations_from_real_data as simulations
+from genomedisco.scoring import score
+
+def main():
+    parser = argparse.ArgumentParser(description='Calibrate GenomeDISCO scores against simulated noise levels. Simulated pairs are generated and scored in memory, without writing them to disk.')
+    parser.add_argument('--matrices',required=True,help='Comma-delimited list of contact maps to simulate from, in the format "n1 n2 value".')
+    parser.add_argument('--matrix_names',required=True,help='Comma-delimited list of names for --matrices.')
+    parser.add_argument('--nodes',required=True)
+    parser.add_argument('--distDepData',default='NA',help='Comma-delimited list of contact maps whose distance dependence the simulations should follow. By default, each matrix uses its own distance dependence.')
+    parser.add_argument('--edgenoise',default='0.0')
+    parser.add_argument('--nodenoise',default='0.0')
+    parser.add_argument('--boundarynoise',default='0')
+    parser.add_argument('--depth',type=int,default=1000000)
+    parser.add_argument('--numsim',type=int,default=1,help='Number of simulated pairs per noise level.')
+    parser.add_argument('--seed',type=int,default=7)
+    parser.add_argument('--mini',type=int,default=-1)
+    parser.add_argument('--maxi',type=int,default=-1)
+    parser.add_argument('--m_subsample',type=str,default='lowest',help='"lowest" to subsample the deeper map to the depth of the other, a sequencing depth to subsample both maps to, or "NA". DEFAULT: lowest')
+    parser.add_argument('--norm',type=str,default='sqrtvc')
+    parser.add_argument('--tmin',type=int,default=3)
+    parser.add_argument('--tmax',type=int,default=3)
+    parser.add_argument('--transition',action='store_true')
+    parser.add_argument('--out',required=True,help='Output table, with one row per simulated pair.')
+    args = parser.parse_args()
+    args.subsample=data_operations.subsample_option(args.m_subsample)
+
+    nodes,nodes_idx,blacklisted_nodes=processing.read_nodes_from_bed(args.nodes)
+    if args.mini<=-1:
+        args.mini=0
+    if args.maxi<=-1:
+        args.maxi=len(nodes.keys())
+
+    matrices=args.matrices.split(',')
+    matrix_names=args.matrix_names.split(',')
+    ddfiles=matrices
+    if args.distDepData!='NA':
+        ddfiles=args.distDepData.split(',')
+    ddmats={}
+    for ddfile in ddfiles:
+        ddmats[ddfile]=simulations.read_in_data(ddfile,nodes)
+
+    out=open(args.out,'w')
+    out.write('#matrix\tdd\tedgenoise\tnodenoise\tboundarynoise\tsim\tdepth.a\tdepth.b\t'+'\t'.join(['t'+str(t) for t in range(args.tmin,args.tmax+1)])+'\tscore\n')
+    for m_idx in range(len(matrices)):
+        mname=matrix_names[m_idx]
+        if matrices[m_idx] in ddmats:
+            my_matrix_orig=ddmats[matrices[m_idx]]
+        else:
+            my_matrix_orig=simulations.read_in_data(matrices[m_idx],nodes)
+        for ddfile_idx in range(len(ddfiles)):
+            ddfile=ddfiles[ddfile_idx]
+            for row in calibrate(my_matrix_orig,ddmats[ddfile],args):
+                out.write(mname+'\t'+str(ddfile_idx)+'\t'+'\t'.join(row)+'\n')
+                out.flush()
+    out.close()
+    print("GenomeDISCO | "+strftime("%c")+" | Calibration table written to "+args.out)
+
+def calibrate(my_matrix_orig,ddmat,args):
+    #yields one row per simulated a/b pair: noise levels, simulation index, depths, scores by t and final score
+    seed=args.seed
+    for edgenoise in args.edgenoise.split(','):
+        for nodenoise in args.nodenoise.split(','):
+            for boundarynoise in args.boundarynoise.split(','):
+                my_matrix=simulations.shift_dataset(my_matrix_orig,int(boundarynoise))
+                for sim in range(args.numsim):
+                    print("GenomeDISCO | "+strftime("%c")+" | Calibration EN="+edgenoise+" NN="+nodenoise+" BN="+boundarynoise+" sim="+str(sim))
+                    prob_matrix=simulations.get_probability_matrix(copy.deepcopy(my_matrix),copy.deepcopy(ddmat),float(edgenoise),float(nodenoise),args.mini,args.maxi,np.random.RandomState(seed))
+                    a=simulations.sample_interactions(prob_matrix,args.depth,np.random.RandomState(seed+1))
+                    b=simulations.sample_interactions(prob_matrix,args.depth,np.random.RandomState(seed+2))
+                    seed+=3
+                    result=score_pair(a,b,args)
+                    yield [edgenoise,nodenoise,boundarynoise,str(sim),str(a.sum()),str(b.sum())]+[str('{:.3f}'.format(result['scores'][t])) for t in range(args.tmin,args.tmax+1)]+[str('{:.3f}'.format(result['score']))]
+
+def score_pair(m1,m2,args):
+    #scoring.score on in-memory upper triangular matrices, with the options of the command line. The simulated maps keep their diagonal
+    return score(m1,m2,args.tmin,args.tmax,args.norm,args.transition,remove_diagonal=False,subsample=args.subsample)
+
+if __name__=="__main__":
+    main()
@@ -1,26 +1,17 @@
+from __future__ import print_function
 import sys
-import matplotlib
-matplotlib.use('Agg')
 import gzip
 import numpy as np
-import matplotlib.pyplot as plt
 import os
 import re
 import copy
-from scipy.stats.mstats import mquantiles
-from scipy.spatial.distance import euclidean
-from sklearn import metrics
-from pylab import rcParams
 from time import gmtime, strftime
 from scipy.sparse import csr_matrix
 from scipy import sparse
-import psutil
 import scipy.sparse as sps
-from genomedisco import processing
-from mpl_toolkits.axes_grid1 import make_axes_locatable
-from matplotlib.ticker import MultipleLocator
-from decimal import Decimal
+from genomedisco import processing, instrumentation
 #from statsmodels import robust
+#plotting modules are imported when plots are made, so that concise runs don't pay for importing them
 
 def to_transition(mtogether):
     sums=mtogether.sum(axis=1)
@@ -29,200 +20,147 @@ def to_transition(mtogether):
     D = sps.spdiags(1.0/sums.flatten(), [0], mtogether.get_shape()[0], mtogether.get_shape()[1], format='csr')
     return D.dot(mtogether)
 
+def band(m,max_distance):
+    #keeps the contacts between nodes at most max_distance bins apart
+    return sps.triu(sps.tril(m,k=max_distance),k=-max_distance,format='csr')
+
+def chunked_walk_differences(m1,m2,tmin,tmax,chunk_rows):
+    #same differences as the full random walks, computed for a block of rows of the walk matrices at a time
+    n=m1.shape[0]
+    diffs=np.zeros(tmax-tmin+1)
+    diff_vector=np.zeros((n,1))
+    for start in range(0,n,chunk_rows):
+        stop=min(n,start+chunk_rows)
+        rw1=m1[start:stop,:]
+        rw2=m2[start:stop,:]
+        for t in range(1,tmax+1):
+            if t>1:
+                rw1=rw1.dot(m1)
+                rw2=rw2.dot(m2)
+            if t>=tmin:
+                row_diffs=abs(rw1-rw2).sum(axis=1)
+                diff_vector[start:stop]+=row_diffs
+                diffs[t-tmin]+=row_diffs.sum()
+    return diffs,diff_vector
+
 def random_walk(m_input,t):
     #return m_input.__pow__(t)
     #return np.linalg.matrix_power(m_input,t)
     return m_input.__pow__(t)
 
-def write_diff_vector_bedfile(diff_vector,nodes,nodes_idx,out_filename):
-    out=gzip.open(out_filename,'w')
-    for i in range(diff_vector.shape[0]):
-        node_name=nodes_idx[i]
-        node_dict=nodes[node_name]
-        out.write(str(node_dict['chr'])+'\t'+str(node_dict['start'])+'\t'+str(node_dict['end'])+'\t'+node_name+'\t'+str(diff_vector[i][0])+'\n')
-    out.close()
-
-class DiscoRandomWalks:
+def random_walk_differences(m1,m2,tmin,tmax,transition=True,engine='exact',band_bins=None,chunk_rows=None,timer=None,verbose=False):
+    #the random walks of GenomeDISCO on normalized symmetric matrices, with no file access
+    #returns the difference per nonzero node at each t from tmin to tmax ("scores"), the differences summed by node over these t ("diff_vector"),
+    #the number of nonzero nodes, and the matrices the walks ran on and the last walk matrices (none for the chunked engine, which never builds them)
+    if timer is None:
+        timer=instrumentation.StageTimer(False)
 
-    def __init__(self, args):
-        self.args = args
-    
-    def compute_reproducibility(self,m1_csr,m2_csr,args):
+    if engine=='banded':
+        m1=band(m1,band_bins)
+        m2=band(m2,band_bins)
 
-        #make symmetric
-        m1up=m1_csr
-        m1down=m1up.transpose()
-        m1down.setdiag(0)
-        m1=m1up+m1down
-
-        m2up=m2_csr
-        m2down=m2up.transpose()
-        m2down.setdiag(0)
-        m2=m2up+m2down
-
-        #convert to an actual transition matrix
-        if args.transition:
+    #convert to an actual transition matrix
+    if transition:
+        with timer.stage('transition'):
             m1=to_transition(m1)
             m2=to_transition(m2)
 
-        #count nonzero nodes (note that we take the average number of nonzero nodes in the 2 datasets)
-	rowsums_1=m1.sum(axis=1)                                                                          
-        nonzero_1=[i for i in range(rowsums_1.shape[0]) if rowsums_1[i]>0.0]
-	rowsums_2=m2.sum(axis=1)                                                                           
-        nonzero_2=[i for i in range(rowsums_2.shape[0]) if rowsums_2[i]>0.0]
-	nonzero_total=len(list(set(nonzero_1).union(set(nonzero_2))))
-        nonzero_total=0.5*(1.0*len(list(set(nonzero_1)))+1.0*len(list(set(nonzero_2))))
+    #count nonzero nodes (note that we take the average number of nonzero nodes in the 2 datasets)
+    nonzero_nodes=[int(np.count_nonzero(processing.nonzero_nodes(m1))),int(np.count_nonzero(processing.nonzero_nodes(m2)))]
+    nonzero_total=0.5*(nonzero_nodes[0]+nonzero_nodes[1])
 
-        scores=[]
-        if True:
-            diff_vector=np.zeros((m1.shape[0],1))
-            for t in range(1,args.tmax+1): #range(args.tmin,args.tmax+1):     
-                extra_text=' (not included in score calculation)'
+    if engine=='float32':
+        m1=m1.astype(np.float32)
+        m2=m2.astype(np.float32)
+
+    scores=[]
+    rw1,rw2=None,None
+    if engine=='chunked':
+        with timer.stage('walk_chunked'):
+            diffs,diff_vector=chunked_walk_differences(m1,m2,tmin,tmax,chunk_rows)
+        for t_idx in range(len(diffs)):
+            scores.append(difference_per_node(diffs[t_idx],nonzero_total))
+            if verbose:
+                print('GenomeDISCO | '+strftime("%c")+' | done t='+str(tmin+t_idx)+' | score='+str('{:.3f}'.format(1.0-scores[-1])))
+    else:
+        diff_vector=np.zeros((m1.shape[0],1))
+        for t in range(1,tmax+1):
+            extra_text=' (not included in score calculation)'
+            with timer.stage('walk_t'+str(t)):
                 if t==1:
                     rw1=copy.deepcopy(m1)
                     rw2=copy.deepcopy(m2)
                 else:
                     rw1=rw1.dot(m1)
                     rw2=rw2.dot(m2)
-                if t>=args.tmin:
+            if t>=tmin:
+                with timer.stage('diff_t'+str(t)):
                     diff_vector+=abs(rw1-rw2).sum(axis=1)
-                    diff=abs(rw1-rw2).sum()#+euclidean(rw1.toarray().flatten(),rw2.toarray().flatten()))
-                    scores.append(1.0*float(diff)/float(nonzero_total))
-                    extra_text=' | score='+str('{:.3f}'.format(1.0-float(diff)/float(nonzero_total)))
-                print 'GenomeDISCO | '+strftime("%c")+' | done t='+str(t)+extra_text
+                    diff=abs(rw1-rw2).sum()
+                scores.append(difference_per_node(diff,nonzero_total))
+                extra_text=' | score='+str('{:.3f}'.format(1.0-scores[-1]))
+            if verbose:
+                print('GenomeDISCO | '+strftime("%c")+' | done t='+str(t)+extra_text)
+    return {'scores':scores,'diff_vector':diff_vector,'nonzero_nodes':nonzero_nodes,'nonzero_total':nonzero_total,'m1':m1,'m2':m2,'rw1':rw1,'rw2':rw2}
+
+def difference_per_node(diff,nonzero_total):
+    #nan if neither matrix has a contact
+    if nonzero_total==0:
+        return float('nan')
+    return 1.0*float(diff)/float(nonzero_total)
+
+def final_score(scores,tmin,tmax):
+    #1 minus the area under the differences from tmin to tmax, normalized by tmax-tmin (or the difference at tmin if tmin==tmax)
+    if tmin==tmax:
+        return 1.0-scores[0]
+    return 1.0-np.trapz(scores,range(tmax-tmin+1))/(tmax-tmin)
+
+def final_differences(diff_vector,tmin,tmax):
+    #differences by node, averaged like the final score
+    if tmax>tmin:
+        return (1.0/(tmax-tmin))*diff_vector
+    return diff_vector
+
+class DiscoRandomWalks:
+
+    name='GenomeDISCO'
+    #set by the memory planner: "exact", "float32", "banded" (with band bins) or "chunked" (with chunk_rows rows at a time)
+    engine='exact'
+    band=None
+    chunk_rows=None
+
+    def __init__(self, args):
+        self.args = args
+        self.timer = instrumentation.StageTimer()
+    
+    def compute_reproducibility(self,m1_csr,m2_csr,args):
+
+        walks=random_walk_differences(m1_csr,m2_csr,args.tmin,args.tmax,args.transition,self.engine,self.band,self.chunk_rows,self.timer,True)
+        m1,m2,rw1,rw2=walks['m1'],walks['m2'],walks['rw1'],walks['rw2']
+        scores=walks['scores']
+        self.nonzero_nodes=walks['nonzero_nodes']
+        self.nonzero_total=walks['nonzero_total']
 
         #compute final score
-        ts=range(args.tmin,args.tmax+1)
-        denom=len(ts)-1
-        if args.tmin==args.tmax:
-            auc=scores[0]
-        else:
-            auc=metrics.auc(range(len(ts)),scores)/denom
-        reproducibility=1.0-auc
+        reproducibility=final_score(scores,args.tmin,args.tmax)
 
         
         #compute final diff vector
         if not args.concise_analysis:
-            #save the difference vector (then the main method will convert it to a bed file)
-            final_diff_vector=diff_vector
-            if denom>0:
-                final_diff_vector=(1.0/denom)*diff_vector
-            #write difference vector as a bed file
-            diff_vector_file=args.outdir+'/'+args.outpref+'.'+args.m1name+'.vs.'+args.m2name+'.diffScore.bed.gz'
-            #nodes,nodes_idx,blacklist_nodes=processing.read_nodes_from_bed(args.node_file,args.blacklist)
-            #write_diff_vector_bedfile(final_diff_vector,nodes,nodes_idx,diff_vector_file)
+            #save the difference vector (then the main method will write it as a track over the nodes)
+            final_diff_vector=final_differences(walks['diff_vector'],args.tmin,args.tmax)
+            self.diff_vector=final_diff_vector
         
         #now, make 1 plot
-        if not args.concise_analysis:
-            originals=np.triu(m1.toarray())-np.triu(m2.toarray()).T
-            rw=np.triu(rw1.toarray())-np.triu(rw2.toarray()).T
-            diff_mat=(rw1-rw2).toarray()
-            diff_vector=final_diff_vector
-            #==================
-            figwidth=40
-            figheight=8
-            #read in resolution
-            resolution_file=args.outdir+'/../../../data/metadata/resolution.txt'
-            resolution=0.000001*float(open(resolution_file,'r').readlines()[0].split()[0])
-            range_originals=[-0.01,0.01]
-            range_rw=[-0.01,0.01]
-            range_diff_mat=[-0.01,0.01]
-            #==================
-
-            #set ticks
-            nnodes=originals.shape[0]
-            start=0
-            ticklist=[]
-            ticknames=[]
-            ticksize=10.0
-            last_tick=-10.0
-            current_tick=0.0
-            while start<=nnodes:
-                if Decimal(str(current_tick))-Decimal(str(last_tick))==Decimal(ticksize) or start==nnodes:
-                    ticklist.append(start)
-                    ticknames.append(str(1.0*(start*resolution))+' Mb')
-                    last_tick+=1.0*ticksize
-                current_tick+=1.0*resolution
-                start+=1
-            
-            fig, plots = plt.subplots(1,3)
-            fig.set_size_inches(figwidth,figheight)
-            
-            #original data
-            #=============
-            colorbar_ticks=[range_originals[0],0,range_originals[1]]
-            im1 = plots[0].matshow(originals,vmin=range_originals[0],vmax=range_originals[1],cmap='bwr')
-            plots[0].set_title('Original data')
-            # Create divider for existing axes instance
-            divider = make_axes_locatable(plots[0])
-            cax = divider.append_axes("right", size="10%", pad=1.5)
-            cbar = plt.colorbar(im1, cax=cax, ticks=MultipleLocator(0.2), format="%.3f",orientation='vertical')
-            cax = divider.append_axes("right", size="20%", pad=0.7)
-            plt.yticks([])
-            plt.xticks([])
-            cax.spines['right'].set_visible(False)
-            cax.spines['top'].set_visible(False)
-            cax.spines['left'].set_visible(False)
-            cax.spines['bottom'].set_visible(False)
-            cbar.set_ticks(colorbar_ticks)
-            cbar.set_ticklabels(colorbar_ticks)
-            cbar.ax.tick_params(labelsize=15)
-            plots[0].set_xticks([])
-            plots[0].set_yticks(ticklist)
-            plots[0].set_xticklabels([],size=15)
-            plots[0].set_yticklabels(ticknames,size=15)
-            plots[0].yaxis.tick_right()
-            
-            #random walk data
-            #================
-            colorbar_ticks=[range_rw[0],0,range_rw[1]]
-            im1 = plots[1].matshow(rw,vmin=range_rw[0],vmax=range_rw[1],cmap='bwr')
-            plots[1].set_title('Smoothed data')
-            # Create divider for existing axes instance
-            divider = make_axes_locatable(plots[1])
-            cax = divider.append_axes("right", size="10%", pad=1.5)
-            cbar = plt.colorbar(im1, cax=cax, ticks=MultipleLocator(0.2), format="%.3f",orientation='vertical')
-            cax = divider.append_axes("right", size="20%", pad=0.7)
-            plt.yticks([])
-            plt.xticks([])
-            cax.spines['right'].set_visible(False)
-            cax.spines['top'].set_visible(False)
-            cax.spines['left'].set_visible(False)
-            cax.spines['bottom'].set_visible(False)
-            cbar.set_ticks(colorbar_ticks)
-            cbar.set_ticklabels(colorbar_ticks)
-            cbar.ax.tick_params(labelsize=15)
-            plots[1].set_xticks([])
-            plots[1].set_yticks(ticklist)
-            plots[1].set_xticklabels([],size=15)
-            plots[1].set_yticklabels(ticknames,size=15)
-            plots[1].yaxis.tick_right()
-            
-            #random walk data differences
-            #============================
-            colorbar_ticks=[range_diff_mat[0],0,range_diff_mat[1]]
-            im1 = plots[2].matshow(diff_mat,vmin=range_diff_mat[0],vmax=range_diff_mat[1],cmap='bwr')
-            plots[2].set_title('Diff matrix (smoothed data)')
-            # Create divider for existing axes instance
-            divider = make_axes_locatable(plots[2])
-            cax = divider.append_axes("right", size="20%", pad=1.5)
-            plt.plot(diff_vector,range(len(diff_vector)))
-            plt.ylim(0,len(diff_vector))
-            plt.xlim(0,1.5)
-            plt.gca().invert_yaxis()
-            plt.yticks(ticklist,[])
-            cax = divider.append_axes("right", size="10%", pad=0.7)
-            cbar = plt.colorbar(im1, cax=cax, ticks=MultipleLocator(0.2), format="%.3f",orientation='vertical')
-            cbar.set_ticks(colorbar_ticks)
-            cbar.set_ticklabels(colorbar_ticks)
-            cbar.ax.tick_params(labelsize=15)
-            plots[2].set_xticks([])
-            plots[2].set_yticks(ticklist)
-            plots[2].set_xticklabels([],size=15)
-            plots[2].set_yticklabels(ticknames,size=15)
-            plots[2].yaxis.tick_right()
-            fname=args.outdir+'/'+args.outpref+'.'+args.m1name+'.vs.'+args.m2name+'.GenomeDISCO.png'
-            plt.savefig(fname)
+        if not args.concise_analysis and self.engine!='chunked':
+            with self.timer.stage('plot'):
+                from genomedisco import visualization
+                #the figure is made from binned matrices saved next to the scores, so that it can also be rendered later by the report step
+                plotdata_file=args.outdir+'/'+args.outpref+'.'+args.m1name+'.vs.'+args.m2name+'.GenomeDISCO.plotdata.npz'
+                visualization.write_genomedisco_plotdata(plotdata_file,m1,m2,rw1,rw2,final_diff_vector,args.resolution,args.plot_region,args.plot_max_pixels)
+                if not args.defer_plots:
+                    fname=args.outdir+'/'+args.outpref+'.'+args.m1name+'.vs.'+args.m2name+'.GenomeDISCO.png'
+                    visualization.plot_genomedisco(plotdata_file,fname)
 
             
         #for the report
@@ -1,93 +1,96 @@
-import sys
-import matplotlib
-matplotlib.use('Agg')
-import gzip
+from __future__ import print_function
 import numpy as np
-import matplotlib.pyplot as plt
 import os
-import re
-import copy
-from scipy.stats.mstats import mquantiles
-from sklearn import metrics
+from time import gmtime, strftime
+import scipy.sparse as sps
+from genomedisco import normalization, processing, instrumentation
+#matplotlib is imported when plots are made
 
-def get_sqrtvc(m):
-    rowsums=m.sum(axis=1)
-    sqrt_rowsums=np.sqrt(rowsums)
-    normed=np.zeros(m.shape)
-    for r in range(m.shape[0]):
-        if sqrt_rowsums[r]==0.0:
-            continue
-        normed[r,:]=1.0*m[r,:]/sqrt_rowsums[r]
-    for r in range(m.shape[0]):
-        if sqrt_rowsums[r]==0.0:
-            continue
-        normed[:,r]=1.0*normed[:,r]/sqrt_rowsums[r]
-    return normed
+def quantile_with_zeros(data,total,q,alphap=0.4,betap=0.4):
+    #mquantiles(x,q) for x made of data plus (total-len(data)) zeros, for nonnegative data
+    #only the 2 order statistics around the quantile are selected, so x is never built or sorted
+    m=alphap+q*(1.0-alphap-betap)
+    aleph=total*q+m
+    k=int(np.floor(np.clip(aleph,1,total-1)))
+    gamma=np.clip(aleph-k,0.0,1.0)
+    zeros=total-len(data)
+    order_stats=[]
+    for position in [k-1,k]:
+        if position<zeros:
+            order_stats.append(0.0)
+        else:
+            order_stats.append(np.partition(data,position-zeros)[position-zeros])
+    return (1.0-gamma)*order_stats[0]+gamma*order_stats[1]
 
-def binarize_top(m,q):
-    threshold=mquantiles(np.triu(m).flatten(),q)
-    new_m=copy.deepcopy(m)
-    new_m[new_m<threshold]=0
-    new_m[new_m>=threshold]=1    
-    return get_sqrtvc(new_m)
-
-def random_walk(m_input,t):
-    transition=copy.deepcopy(m_input)
-    return np.linalg.matrix_power(transition,t)
+def binarize_top(m_sym,q):
+    #keeps the entries in the top quantile q of the upper triangular matrix (zeros included), set to 1, then normalizes with sqrtvc
+    upper=sps.triu(m_sym,format='coo')
+    threshold=quantile_with_zeros(upper.data,m_sym.shape[0]*m_sym.shape[1],q)
+    binary=sps.csr_matrix(m_sym,copy=True)
+    binary.data=(binary.data>=threshold).astype(float)
+    binary.eliminate_zeros()
+    return normalization.sqrtvc(binary)
 
 class DiscoRandomWalks_binarizedMatrices:
 
+    name='GenomeDISCO-binarized'
+
     def __init__(self, args):
         self.args = args
-    
-    def compute_reproducibility(self,m1_csr,m2_csr,args,q=0.99):
+        self.timer = instrumentation.StageTimer()
+
+    def compute_reproducibility(self,m1_csr,m2_csr,args):
+
+        #the matrices are symmetric, as returned by normalization.normalize
+        with self.timer.stage('binarize'):
+            m1=binarize_top(m1_csr,args.binarize_quantile)
+            m2=binarize_top(m2_csr,args.binarize_quantile)
+
+        #nonzero nodes in either dataset
+        nonzero_1=processing.nonzero_nodes(m1)
+        nonzero_2=processing.nonzero_nodes(m2)
+        self.nonzero_nodes=[int(np.count_nonzero(nonzero_1)),int(np.count_nonzero(nonzero_2))]
+        nonzero_total=np.count_nonzero(nonzero_1|nonzero_2)
+        self.nonzero_total=nonzero_total
 
-        #create numpy arrays
-        m1=m1_csr.toarray()
-        m1=m1+m1.T-np.diag(m1.diagonal())
-        m2=m2_csr.toarray()
-        m2=m2+m2.T-np.diag(m2.diagonal())
-        m1=binarize_top(m1,q)
-        m2=binarize_top(m2,q)
-        #TODO: fix this
-        #m1=m1_csr+m1_csr.transpose()
-        #m2=m2_csr+m2_csr.transpose()
-	rowsums_1=m1.sum(axis=1)                                                                                                                              
-	nonzero_1=[i for i in range(rowsums_1.shape[0]) if rowsums_1[i]>0.0]
-	rowsums_2=m2.sum(axis=1)                                                                                                                              
-	nonzero_2=[i for i in range(rowsums_2.shape[0]) if rowsums_2[i]>0.0]
-	nonzero_total=len(list(set(nonzero_1).union(set(nonzero_2))))
+        #sparse random walks, one step at a time
+        scores=[]
+        diff_vector=np.zeros((m1.shape[0],1))
+        for t in range(1,args.tmax+1):
+            with self.timer.stage('walk_t'+str(t)):
+                if t==1:
+                    rw1=m1.copy()
+                    rw2=m2.copy()
+                else:
+                    rw1=rw1.dot(m1)
+                    rw2=rw2.dot(m2)
+            if t>=args.tmin:
+                with self.timer.stage('diff_t'+str(t)):
+                    diff_vector+=abs(rw1-rw2).sum(axis=1)
+                    diff=abs(rw1-rw2).sum()
+                scores.append(1.0*float(diff)/float(max(nonzero_total,1)))
+                print('GenomeDISCO | '+strftime("%c")+' | done t='+str(t)+' | score='+str('{:.3f}'.format(1.0-scores[-1])))
 
-        #perform random walks and make a plot with them
-        rw1={}
-        rw2={}
-        reproducibility_text="<table>"+'\n'
-        reproducibility_text=reproducibility_text+'<tr>'+'\n'
-        for t in range(args.tmin,args.tmax+1):
-            reproducibility_text=reproducibility_text+'<td>'+'\n'
-            rw1[t]=random_walk(m1,t)
-            rw2[t]=random_walk(m2,t)
-            #plot these so that we can refer to them in the html
-            combined=np.triu(rw1[t])-np.triu(rw2[t]).T
-            np.fill_diagonal(combined,0.0)
-            x=mquantiles(abs(combined.flatten()),0.99)
-            plt.matshow(combined,vmin=-x,vmax=x,cmap='bwr')
-            plt.colorbar()
-	    plt.title('Random walk \nt='+str(t))
-            plt.show()
-            fname=args.outdir+'/'+args.outpref+'.'+args.m1name+'.vs.'+args.m2name+'.DiscoRandomWalks_binarizedMatrices.'+str(t)+'.png'
-	    print fname
-            plt.savefig(fname)
-            reproducibility_text=reproducibility_text+'<img src="'+os.path.basename(fname)+'" width="400" height="400"></td>'+'\n'
-        reproducibility_text=reproducibility_text+'</tr>'+'\n'
-        reproducibility_text=reproducibility_text+"</table>"+'\n'
+        #final score as for the main method
+        ts=range(args.tmin,args.tmax+1)
+        denom=len(ts)-1
+        if args.tmin==args.tmax:
+            auc=scores[0]
+        else:
+            auc=np.trapz(scores,range(len(ts)))/denom
+        reproducibility=1.0-auc
 
-	scores=[]
-	for t in range(args.tmin,args.tmax+1):
-            diff=abs(rw1[t]-rw2[t]).sum()
-            scores.append(diff)
-	ts=range(args.tmin,args.tmax+1)
-	denom=len(ts)
-	auc=metrics.auc(range(len(ts)),scores)/denom
+        if not args.concise_analysis:
+            self.diff_vector=diff_vector
+            if denom>0:
+                self.diff_vector=(1.0/denom)*diff_vector
+            #same plot as the main method, made from the binarized matrices
+            with self.timer.stage('plot'):
+                from genomedisco import visualization
+                plotdata_file=args.outdir+'/'+args.outpref+'.'+args.m1name+'.vs.'+args.m2name+'.GenomeDISCO.plotdata.npz'
+                visualization.write_genomedisco_plotdata(plotdata_file,m1,m2,rw1,rw2,self.diff_vector,args.resolution,args.plot_region,args.plot_max_pixels)
+                if not args.defer_plots:
+                    fname=args.outdir+'/'+args.outpref+'.'+args.m1name+'.vs.'+args.m2name+'.GenomeDISCO.png'
+                    visualization.plot_genomedisco(plotdata_file,fname)
 
-        return reproducibility_text,auc/nonzero_total
+        return ['',''],reproducibility,scores
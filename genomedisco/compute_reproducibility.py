@@ -1,18 +1,19 @@
-
+from __future__ import print_function
 import argparse
 import copy
 import re
 import os
+import sys
 from time import gmtime, strftime
 
-from genomedisco import data_operations, processing, visualization
+from genomedisco import data_operations, normalization, processing, visualization, results_table, instrumentation, planner
 from genomedisco.comparison_types.disco_random_walks import DiscoRandomWalks
 from genomedisco.comparison_types.disco_random_walks_binarized_matrices import DiscoRandomWalks_binarizedMatrices
 
 def main():
     parser = argparse.ArgumentParser(description='Compute reproducibility of 3D genome data')
     parser.add_argument('--datatype',default='hic')
-    parser.add_argument('--m1',type=str,default='/srv/gsfs0/projects/kundaje/users/oursu/3d/LA/merged_nodups/processed_data/HIC014.res40000.byChr.chr21.gz')
+    parser.add_argument('--m1',type=str,help='Contact map of the chromosome, as a gzipped "node1 node2 value" file, a .npz sparse matrix, or a cooler file ("file.cool" or "file.mcool::/resolutions/<resolution>") from which --chromosome is read.',default='/srv/gsfs0/projects/kundaje/users/oursu/3d/LA/merged_nodups/processed_data/HIC014.res40000.byChr.chr21.gz')
     parser.add_argument('--m2',type=str,default='/srv/gsfs0/projects/kundaje/users/oursu/3d/LA/merged_nodups/processed_data/HIC001.res40000.byChr.chr21.gz')
     parser.add_argument('--matrix_format',type=str,default='n1n2val',help='c1n1c2n2val')
     parser.add_argument('--node_file',type=str,default='/srv/gsfs0/projects/kundaje/users/oursu/3d/LA/merged_nodups/nodes/Nodes.w40000.chr21.gz')
@@ -23,60 +24,95 @@ def main():
     parser.add_argument('--outpref',type=str,default='outpref')
     parser.add_argument('--m_subsample',type=str,default='lowest')
     parser.add_argument('--concise_analysis',action='store_true',help='Add this flag to only output the reproducibility score, and not perform the distance dependence analyses.')
-    parser.add_argument('--norm',type=str,default='uniform')
-    parser.add_argument('--method',type=str,default='RandomWalks')
+    parser.add_argument('--norm',type=str,default='uniform',help='Normalization of the contact maps: "uniform", "sqrtvc", "coverage_norm", "fill_diagonal" or "ice" (iterative correction).')
+    parser.add_argument('--ice_tol',type=float,default=1e-5,help='For --norm ice, stop once all nonzero rows have a coverage within this tolerance of the mean coverage.')
+    parser.add_argument('--ice_maxiter',type=int,default=200,help='For --norm ice, maximum number of iterations.')
+    parser.add_argument('--bias_cache',default='NA',help='For --norm ice, directory where the bias of each sample and chromosome is cached, so that it is computed once and reused across comparisons.')
+    parser.add_argument('--method',type=str,default='RandomWalks',help='"RandomWalks" (GenomeDISCO), or "binarizedRandomWalks" to run the random walks on contact maps binarized at --binarize_quantile.')
+    parser.add_argument('--binarize_quantile',type=float,default=0.99,help='For --method binarizedRandomWalks, the quantile of the contact map entries above which they are set to 1.')
     parser.add_argument('--tmin',type=int,default=1)
     parser.add_argument('--tmax',type=int,default=3)
     parser.add_argument('--approximation',type=int,default=40000)
     parser.add_argument('--transition',action='store_true')
     parser.add_argument('--blacklist',default='NA')
     parser.add_argument('--scoresByStep',action='store_true')
+    parser.add_argument('--plot_region',default='NA',help='Region of the chromosome to plot, in the format "start-end" (in bp). DEFAULT: the whole chromosome')
+    parser.add_argument('--plot_max_pixels',type=int,default=2000,help='The matrices are binned down to at most this many pixels per side for plotting.')
+    parser.add_argument('--diffScore_format',default='bed',help='Format of the per-bin difference score track written when not running with --concise_analysis. "bed" writes a gzipped "chr start end name score" file, "npy" writes the scores as a NumPy array in the order of --node_file, "NA" skips the track. DEFAULT: bed')
+    parser.add_argument('--resolution',default='NA',help='Resolution of the contact maps (in bp), used to label the plots. DEFAULT: the median size of the regions in --node_file')
+    parser.add_argument('--defer_plots',action='store_true',help='Add this flag to only save the data behind the GenomeDISCO plots, to be rendered later by the report step.')
+    parser.add_argument('--stats_cache',default='NA',help='Directory in which the per-sample stats (depth, coverage, number of nonzero nodes) are stored, so that they are computed once per sample and chromosome, and reused by all its comparisons. DEFAULT: no cache')
+    parser.add_argument('--results_table',default='NA',help='Results table to which the scores for this comparison are written. The table is written to a temporary file and then renamed, so it is replaced, and never left incomplete, if the comparison is run again.')
+    parser.add_argument('--timing_table',default='NA',help='Table to which the wall time, CPU time and peak memory of each stage of this comparison are written.')
+    parser.add_argument('--memory_budget',default='NA',help='Memory available for this comparison (in MB). The memory needed by the random walks is estimated before running them, and the first engine that fits is used. If none fits, the comparison is not run. DEFAULT: no limit')
+    parser.add_argument('--engine',default='auto',help='How to run the random walks: "exact", "float32" (half the memory), "banded" (only contacts at most --band bins apart, which changes the score), "chunked" (exact, a block of rows at a time), or "auto" to choose given --memory_budget, in this order. "banded" is only considered if --band is given. DEFAULT: auto')
+    parser.add_argument('--band',default='NA',help='For the "banded" engine, the maximum distance (in bins) between nodes whose contacts are kept.')
+    parser.add_argument('--memory_plan_table',default='NA',help='Table to which the engine, the estimated peak memory and the measured peak memory of this comparison are written.')
+    parser.add_argument('--chromosome',default='NA',help='Chromosome name recorded in --results_table, and read from cooler inputs. DEFAULT: the value of --outpref')
     args = parser.parse_args()
 
     #write_arguments(args)
 
     os.system('mkdir -p '+args.outdir)
 
-    print "GenomeDISCO | "+strftime("%c")+" | :::::::::: Starting reproducibility analysis"
-    nodes,nodes_idx,blacklist_nodes=processing.read_nodes_from_bed(args.node_file,args.blacklist)
+    print("GenomeDISCO | "+strftime("%c")+" | :::::::::: Starting reproducibility analysis")
+    timer=instrumentation.StageTimer()
+    with timer.stage('nodes'):
+        nodes,nodes_idx,blacklist_nodes=processing.read_nodes_from_bed(args.node_file,args.blacklist)
+    if args.resolution=='NA':
+        args.resolution=processing.get_resolution(nodes)
+    args.resolution=int(args.resolution)
+
+    print("GenomeDISCO | "+strftime("%c")+" | Loading contact maps")
+    with timer.stage('parse'):
+        m1=processing.construct_csr_matrix_from_data_and_nodes(args.m1,nodes,blacklist_nodes,args.remove_diagonal,args.chromosome)
+        m2=processing.construct_csr_matrix_from_data_and_nodes(args.m2,nodes,blacklist_nodes,args.remove_diagonal,args.chromosome)
 
-    print "GenomeDISCO | "+strftime("%c")+" | Loading contact maps"
-    m1=processing.construct_csr_matrix_from_data_and_nodes(args.m1,nodes,blacklist_nodes,args.remove_diagonal)
-    m2=processing.construct_csr_matrix_from_data_and_nodes(args.m2,nodes,blacklist_nodes,args.remove_diagonal)
+    chromosome=args.chromosome
+    if chromosome=='NA':
+        chromosome=args.outpref
 
+    #per-sample stats (depth, coverage, number of nonzero nodes)
     stats={}
-    stats[args.m1name]={}
-    stats[args.m2name]={}
-    stats[args.m1name]['depth']=m1.sum()
-    stats[args.m2name]['depth']=m2.sum()
+    with timer.stage('stats'):
+        if args.stats_cache!='NA':
+            os.system('mkdir -p '+args.stats_cache)
+        signature=[args.remove_diagonal,len(blacklist_nodes)]
+        stats[args.m1name]=processing.cached_matrix_stats(m1,args.m1,stats_cache_file(args,args.m1name,chromosome),signature)
+        stats[args.m2name]=processing.cached_matrix_stats(m2,args.m2,stats_cache_file(args,args.m2name,chromosome),signature)
 
     m1_subsample=copy.deepcopy(m1)
     m2_subsample=copy.deepcopy(m2)
     if args.m_subsample!='NA':
-        if args.m_subsample=='lowest':
-            if stats[args.m1name]['depth']>=stats[args.m2name]['depth']:
-                m_subsample=copy.deepcopy(m2)
-            if stats[args.m1name]['depth']<stats[args.m2name]['depth']:
-                m_subsample=copy.deepcopy(m1)
-            desired_depth=m_subsample.sum()
-        else:
-            desired_depth=processing.construct_csr_matrix_from_data_and_nodes(args.m_subsample,nodes,blacklist_nodes,args.remove_diagonal).sum()
-        print "GenomeDISCO | "+strftime("%c")+" | Subsampling depth = "+str(desired_depth)
-        if m1.sum()>desired_depth:
-            m1_subsample=data_operations.subsample_to_depth(m1,desired_depth)
-        if m2.sum()>desired_depth:
-            m2_subsample=data_operations.subsample_to_depth(m2,desired_depth)
+        with timer.stage('subsample'):
+            if args.m_subsample=='lowest':
+                desired_depth=min(stats[args.m1name]['depth'],stats[args.m2name]['depth'])
+            else:
+                desired_depth=processing.construct_csr_matrix_from_data_and_nodes(args.m_subsample,nodes,blacklist_nodes,args.remove_diagonal,args.chromosome).sum()
+            print("GenomeDISCO | "+strftime("%c")+" | Subsampling depth = "+str(desired_depth))
+            if stats[args.m1name]['depth']>desired_depth:
+                m1_subsample=data_operations.subsample_to_depth(m1,desired_depth)
+            if stats[args.m2name]['depth']>desired_depth:
+                m2_subsample=data_operations.subsample_to_depth(m2,desired_depth)
 
     stats[args.m1name]['subsampled_depth']=m1_subsample.sum()   
     stats[args.m2name]['subsampled_depth']=m2_subsample.sum()
 
-    print "GenomeDISCO | "+strftime("%c")+' | Normalizing with '+args.norm
-    m1_norm=data_operations.process_matrix(m1_subsample,args.norm)
-    m2_norm=data_operations.process_matrix(m2_subsample,args.norm)
+    print("GenomeDISCO | "+strftime("%c")+' | Normalizing with '+args.norm)
+    bias1,bias2=None,None
+    with timer.stage('normalize'):
+        if args.norm=='ice':
+            #the bias is estimated on the full-depth matrices, and applied to the subsampled ones
+            if args.bias_cache!='NA':
+                os.system('mkdir -p '+args.bias_cache)
+            bias1=normalization.cached_ice_bias(normalization.symmetrize(m1),bias_cache_file(args,args.m1name,chromosome),args.ice_tol,args.ice_maxiter)
+            bias2=normalization.cached_ice_bias(normalization.symmetrize(m2),bias_cache_file(args,args.m2name,chromosome),args.ice_tol,args.ice_maxiter)
+        m1_norm=data_operations.process_matrix(m1_subsample,args.norm,bias1,args.ice_tol,args.ice_maxiter)
+        m2_norm=data_operations.process_matrix(m2_subsample,args.norm,bias2,args.ice_tol,args.ice_maxiter)
 
     if not args.concise_analysis:
         #distance dependence analysis
-        print "GenomeDISCO | "+strftime("%c")+" | Distance dependence analysis"
+        print("GenomeDISCO | "+strftime("%c")+" | Distance dependence analysis")
         '''
         if args.datatype=='hic':
             m1dd=data_operations.get_distance_dep(m1_subsample)
@@ -87,46 +123,83 @@ def main():
         dd_diff=get_dd_diff(m1dd,m2dd)
         visualization.plot_dds([m1dd,m2dd],[args.m1name,args.m2name],args.outdir+'/'+args.outpref+'.'+args.m1name+'.vs.'+args.m2name+'.distDep',args.approximation)
         '''
-    print "GenomeDISCO | "+strftime("%c")+" | Computing reproducibility score"
+    #choose how to run the random walks, given the memory budget
+    memory_plan={'engine':'exact','chunk_rows':'NA','walk_nnz':'NA','estimated_peak_mb':'NA'}
+    if args.method=='RandomWalks':
+        #the figure is made after the walks, unless the analysis is concise
+        memory_plan=planner.plan(m1_norm,m2_norm,args.tmax,args.memory_budget,args.engine,args.band,plots=not args.concise_analysis,max_pixels=args.plot_max_pixels,render=not args.defer_plots)
+        print("GenomeDISCO | "+strftime("%c")+" | Memory plan: engine="+memory_plan['engine']+", estimated peak memory="+format_mb(memory_plan['estimated_peak_mb'])+" MB, budget="+str(args.memory_budget)+" MB")
+        if memory_plan['engine']=='refused':
+            print("GenomeDISCO | "+strftime("%c")+" | Error: the random walks do not fit in the memory budget of "+str(args.memory_budget)+" MB with any engine. Increase the memory budget, or give a --band to allow the banded engine")
+            write_memory_plan(args,chromosome,memory_plan,m1_norm)
+            sys.exit(1)
+
+    print("GenomeDISCO | "+strftime("%c")+" | Computing reproducibility score")
     if args.method=='RandomWalks':
         comparer=DiscoRandomWalks(args)
+        comparer.engine=memory_plan['engine']
+        comparer.chunk_rows=memory_plan['chunk_rows']
+        if args.band!='NA':
+            comparer.band=int(args.band)
+    if args.method=='binarizedRandomWalks':
+        comparer=DiscoRandomWalks_binarizedMatrices(args)
+    #the comparer records the random walk steps, the differences and the plots as separate stages
+    comparer.timer=timer
     reproducibility_text,score,scores=comparer.compute_reproducibility(m1_norm,m2_norm,args)
 
     '''
     if not args.concise_analysis:
-        print "GenomeDISCO | "+strftime("%c")+" | Writing html report"
+        print("GenomeDISCO | "+strftime("%c")+" | Writing html report")
         write_html_report(stats,args,reproducibility_text,score)
     '''
     
-    out=open(args.outdir+'/'+args.outpref+'.'+args.m1name+'.vs.'+args.m2name+'.scores.txt','w')
-    out.write(args.m1name+'\t'+args.m2name+'\t'+str('{:.3f}'.format(score))+'\n')
-    out.close()
-
-    if args.scoresByStep:
-        out=open(args.outdir+'/'+args.outpref+'.'+args.m1name+'.vs.'+args.m2name+'.scoresByStep.txt','w')
-        t_strings=[]
-        score_strings=[]
-        t_counter=0
-        for t in range(1,(args.tmax+1)):
-            if t>=args.tmin:
-                score_strings.append(str('{:.3f}'.format(1.0-scores[t_counter])))
-                t_counter+=1
-            else:
-                score_strings.append('NA')
-            t_strings.append(str(t))
-        out.write('#m1'+'\t'+'m2'+'\t'+'\t'.join(t_strings)+'\n')
-        out.write(args.m1name+'\t'+args.m2name+'\t'+'\t'.join(score_strings)+'\n')
-        out.close()
-        
-    if not args.concise_analysis:
-        out=open(args.outdir+'/'+args.outpref+'.'+args.m1name+'.vs.'+args.m2name+'.datastats.txt','w')
-        out.write('#m1name'+'\t'+'m2name'+'\t'+'SeqDepth.m1'+'\t'+'SeqDepth.m2'+'\t'+'SubsampledSeqDepth.m1'+'\t'+'SubsampledSeqDepth.m2'+'\t'+'DistDepDiff'+'\n')
-        dd_value='NA'
-        #dd_value=str('{:.10f}'.format(dd_diff))
-        dd_value='00'
-        out.write(args.m1name+'\t'+args.m2name+'\t'+str(stats[args.m1name]['depth'])+'\t'+str(stats[args.m2name]['depth'])+'\t'+str(stats[args.m1name]['subsampled_depth'])+'\t'+str(stats[args.m2name]['subsampled_depth'])+'\t'+dd_value+'\n')
+    with timer.stage('write'):
+        if not args.concise_analysis and args.diffScore_format!='NA':
+            diffScore_file=args.outdir+'/'+args.outpref+'.'+args.m1name+'.vs.'+args.m2name+'.diffScore.'+{'bed':'bed.gz','npy':'npy'}[args.diffScore_format]
+            print("GenomeDISCO | "+strftime("%c")+" | Writing difference scores to "+diffScore_file)
+            processing.write_bins_track(comparer.diff_vector,nodes,nodes_idx,diffScore_file,args.diffScore_format)
+
+        out=open(args.outdir+'/'+args.outpref+'.'+args.m1name+'.vs.'+args.m2name+'.scores.txt','w')
+        out.write(args.m1name+'\t'+args.m2name+'\t'+str('{:.3f}'.format(score))+'\n')
         out.close()
 
+        if args.results_table!='NA':
+            stats_columns=[comparer.nonzero_total,stats[args.m1name]['depth'],stats[args.m2name]['depth'],stats[args.m1name]['subsampled_depth'],stats[args.m2name]['subsampled_depth']]
+            rows=[]
+            for t_idx in range(len(scores)):
+                rows.append([args.m1name,args.m2name,chromosome,comparer.name,args.tmin+t_idx,'{:.3f}'.format(1.0-scores[t_idx])]+stats_columns)
+            rows.append([args.m1name,args.m2name,chromosome,comparer.name,'final','{:.3f}'.format(score)]+stats_columns)
+            results_table.write_rows(args.results_table,rows)
+
+        if args.scoresByStep:
+            out=open(args.outdir+'/'+args.outpref+'.'+args.m1name+'.vs.'+args.m2name+'.scoresByStep.txt','w')
+            t_strings=[]
+            score_strings=[]
+            t_counter=0
+            for t in range(1,(args.tmax+1)):
+                if t>=args.tmin:
+                    score_strings.append(str('{:.3f}'.format(1.0-scores[t_counter])))
+                    t_counter+=1
+                else:
+                    score_strings.append('NA')
+                t_strings.append(str(t))
+            out.write('#m1'+'\t'+'m2'+'\t'+'\t'.join(t_strings)+'\n')
+            out.write(args.m1name+'\t'+args.m2name+'\t'+'\t'.join(score_strings)+'\n')
+            out.close()
+
+        if not args.concise_analysis:
+            out=open(args.outdir+'/'+args.outpref+'.'+args.m1name+'.vs.'+args.m2name+'.datastats.txt','w')
+            out.write('#m1name'+'\t'+'m2name'+'\t'+'SeqDepth.m1'+'\t'+'SeqDepth.m2'+'\t'+'SubsampledSeqDepth.m1'+'\t'+'SubsampledSeqDepth.m2'+'\t'+'DistDepDiff'+'\t'+'NonzeroNodes.m1'+'\t'+'NonzeroNodes.m2'+'\n')
+            dd_value='NA'
+            #dd_value=str('{:.10f}'.format(dd_diff))
+            dd_value='00'
+            out.write(args.m1name+'\t'+args.m2name+'\t'+str(stats[args.m1name]['depth'])+'\t'+str(stats[args.m2name]['depth'])+'\t'+str(stats[args.m1name]['subsampled_depth'])+'\t'+str(stats[args.m2name]['subsampled_depth'])+'\t'+dd_value+'\t'+str(stats[args.m1name]['nonzero_nodes'])+'\t'+str(stats[args.m2name]['nonzero_nodes'])+'\n')
+            out.close()
+
+    if args.timing_table!='NA':
+        results_table.write_rows(args.timing_table,timer.rows(args.m1name,args.m2name,chromosome,comparer.name),instrumentation.columns)
+    write_memory_plan(args,chromosome,memory_plan,m1_norm)
+
         
 def get_dd_diff(m1dd,m2dd):
     d=0.0
@@ -143,6 +216,27 @@ def get_dd_diff(m1dd,m2dd):
         d+=abs(m1val-m2val)
     return d
 
+def format_mb(mb):
+    if mb=='NA':
+        return mb
+    return '{:.1f}'.format(mb)
+
+def write_memory_plan(args,chromosome,memory_plan,m):
+    #the estimate is logged next to the measured peak memory, to check the estimates
+    if args.memory_plan_table!='NA':
+        row=[args.m1name,args.m2name,chromosome,memory_plan['engine'],memory_plan['chunk_rows'],m.shape[0],m.nnz,memory_plan['walk_nnz'],args.memory_budget,format_mb(memory_plan['estimated_peak_mb']),format_mb(instrumentation.peak_rss_mb())]
+        results_table.write_rows(args.memory_plan_table,[row],planner.columns)
+
+def stats_cache_file(args,mname,chromosome):
+    if args.stats_cache=='NA':
+        return 'NA'
+    return args.stats_cache+'/'+mname+'.'+chromosome+'.stats.npz'
+
+def bias_cache_file(args,mname,chromosome):
+    if args.bias_cache=='NA':
+        return 'NA'
+    return args.bias_cache+'/'+mname+'.'+chromosome+'.ice_bias.npz'
+
 def write_html_report(stats,args,reproducibility_text,score):
     header_col='"009900"'
     #header_col='"#000000"'
@@ -189,6 +283,12 @@ def write_html_report(stats,args,reproducibility_text,score):
         out.write('<td> '+str(1.0*stats[args.m2name]['subsampled_depth']/1000000)+' M</td>'+'\n')
         out.write('</tr>')
 
+    out.write('<tr>')
+    out.write('<td> <strong>Nonzero nodes</strong></td>'+'\n')
+    out.write('<td> '+str(stats[args.m1name]['nonzero_nodes'])+'</td>'+'\n')
+    out.write('<td> '+str(stats[args.m2name]['nonzero_nodes'])+'</td>'+'\n')
+    out.write('</tr>')
+
     out.write('</table>'+'\n')
 
     out.write('<br>'+'\n')
@@ -32,12 +32,7 @@ def main():
 
     m=processing.construct_csr_matrix_from_data_and_nodes(args.m,nodes,blacklist_nodes,args.remove_diagonal)
 
-    m_norm=data_operations.process_matrix(m,args.norm)
-
-    mup=m_norm
-    mdown=mup.transpose()
-    mdown.setdiag(0)
-    m_full=mup+mdown
+    m_full=data_operations.process_matrix(m,args.norm)
 
     if args.transition:
         m_full=to_transition(m_full)
@@ -9,11 +9,9 @@ from time import gmtime, strftime
 import sys
 import copy
 import fnmatch
-
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-from pylab import rcParams
+import hashlib
+import multiprocessing
+from genomedisco import results_table, instrumentation, planner, manifest, cooler_io, pairs_io, gzio, contact_index
 
 global repo_dir
 global replicateqc_path
@@ -34,7 +32,7 @@ def parse_args(genomedisco_or_replicateqc):
 
     #individual parsers
     metadata_samples_parser=argparse.ArgumentParser(add_help=False)
-    metadata_samples_parser.add_argument('--metadata_samples',required=True,help='required. A file where each row represents a sample, and the entries are "samplename samplefile". Each of these will be processed. Note: each samplename in the file MUST be unique. Each samplefile listed here should follow the format "chr1 bin1 chr2 bin2 value"')
+    metadata_samples_parser.add_argument('--metadata_samples',required=True,help='required. A file where each row represents a sample, and the entries are "samplename samplefile". Each of these will be processed. Note: each samplename in the file MUST be unique. Each samplefile listed here should follow the format "chr1 bin1 chr2 bin2 value", or be a cooler file, or a .pairs(.gz) file of read pairs, binned with --bins')
 
     metadata_pairs_parser=argparse.ArgumentParser(add_help=False)
     metadata_pairs_parser.add_argument('--metadata_pairs',required=True,help='required. Each row is a pair of sample names to be compared, in the format "samplename1 samplename2". Important: sample names used here need to correspond to the first column of the --metadata_samples file.')
@@ -45,6 +43,9 @@ def parse_args(genomedisco_or_replicateqc):
     re_fragments_parser=argparse.ArgumentParser(add_help=False)
     re_fragments_parser.add_argument('--re_fragments',action='store_true',help='Add this flag if the bins are not uniform bins in the genome (e.g. if they are restriction-fragment-based). By default, the code assumes the bins are of uniform length.')
 
+    index_contacts_parser=argparse.ArgumentParser(add_help=False)
+    index_contacts_parser.add_argument('--index_contacts',action='store_true',help='Add this flag to sort each sample into an indexed, block-compressed file (outdir/data/indexed), from which each chromosome is read directly. The sorted file is reused by later runs in the same outdir, e.g. with other --subset_chromosomes.')
+
     outdir_parser=argparse.ArgumentParser(add_help=False)
     outdir_parser.add_argument('--outdir',default='replicateQC',help='Name of output directory. DEFAULT: replicateQC')
     
@@ -61,7 +62,19 @@ def parse_args(genomedisco_or_replicateqc):
     subset_chromosomes_parser.add_argument('--subset_chromosomes',default='NA',help='Comma-delimited list of chromosomes for which you want to run the analysis. By default the analysis runs on all chromosomes for which there are data. This is useful for quick testing')
 
     timing_parser=argparse.ArgumentParser(add_help=False)
-    timing_parser.add_argument('--timing',action='store_true',help='Set this flag to time the analyses. Files detailing the running times of each method can be found in outdir/running_times')
+    timing_parser.add_argument('--timing',action='store_true',help='Set this flag to time the analyses. For GenomeDISCO, the wall time, CPU time and peak memory of each stage of each comparison are recorded in outdir/results/tables, and summarized by stage in outdir/scores/timing.hotspots.txt. For the other methods, files detailing the running times can be found in outdir/timing')
+
+    processes_parser=argparse.ArgumentParser(add_help=False)
+    processes_parser.add_argument('--processes',type=int,default=1,help='Number of processes used to render the plots in the report step. DEFAULT: 1')
+
+    weight_parser=argparse.ArgumentParser(add_help=False)
+    weight_parser.add_argument('--weight_by_nonzero_nodes',action='store_true',help='Set this flag to compute the genomewide score as the average of the chromosome scores weighted by the number of nonzero nodes in each chromosome. By default, chromosomes are weighted equally.')
+
+    strict_memory_parser=argparse.ArgumentParser(add_help=False)
+    strict_memory_parser.add_argument('--strict_memory_validation',action='store_true',help='Set this flag to exit with an error at the end of the summary step if a comparison used more memory than its memory plan estimated. By default, this is a warning, and the engine is marked as failed in outdir/scores/memory_plan.validation.txt')
+
+    resume_parser=argparse.ArgumentParser(add_help=False)
+    resume_parser.add_argument('--resume',action='store_true',help='Set this flag to continue an interrupted run in the same --outdir. Tasks that completed (listed as done in outdir/manifest.txt) are skipped, and the others are run again from scratch.')
 
     #TODO: jobs waiting for each other
     if genomedisco_or_replicateqc=='replicateqc':
@@ -77,30 +90,36 @@ def parse_args(genomedisco_or_replicateqc):
 
     #parsers for commands
     if genomedisco_or_replicateqc=='replicateqc':
-        all_parser=subparsers.add_parser('run_all',parents=[metadata_samples_parser,metadata_pairs_parser,bins_parser,re_fragments_parser,methods_parser,parameter_file_parser,outdir_parser,running_mode_parser,concise_analysis_parser,subset_chromosomes_parser,timing_parser],help='Run all steps in the reproducibility/QC analysis with this single command')
+        all_parser=subparsers.add_parser('run_all',parents=[metadata_samples_parser,metadata_pairs_parser,bins_parser,re_fragments_parser,methods_parser,parameter_file_parser,outdir_parser,running_mode_parser,concise_analysis_parser,subset_chromosomes_parser,timing_parser,weight_parser,strict_memory_parser,processes_parser,resume_parser,index_contacts_parser],help='Run all steps in the reproducibility/QC analysis with this single command')
     
     if genomedisco_or_replicateqc=='GenomeDISCO':
-        all_parser=subparsers.add_parser('run_all',parents=[metadata_samples_parser,metadata_pairs_parser,bins_parser,re_fragments_parser,parameter_file_parser,outdir_parser,running_mode_parser,concise_analysis_parser,subset_chromosomes_parser,timing_parser],help='Run all steps in the concordance analysis with this single command')
+        all_parser=subparsers.add_parser('run_all',parents=[metadata_samples_parser,metadata_pairs_parser,bins_parser,re_fragments_parser,parameter_file_parser,outdir_parser,running_mode_parser,concise_analysis_parser,subset_chromosomes_parser,timing_parser,weight_parser,strict_memory_parser,processes_parser,resume_parser,index_contacts_parser],help='Run all steps in the concordance analysis with this single command')
 
     if genomedisco_or_replicateqc=='replicateqc':
-        split_parser=subparsers.add_parser('preprocess',parents=[metadata_samples_parser,bins_parser,re_fragments_parser,methods_parser,outdir_parser,running_mode_parser,subset_chromosomes_parser,parameter_file_parser,timing_parser],help='(step 1) split files by chromosome')
+        split_parser=subparsers.add_parser('preprocess',parents=[metadata_samples_parser,bins_parser,re_fragments_parser,methods_parser,outdir_parser,running_mode_parser,subset_chromosomes_parser,parameter_file_parser,timing_parser,resume_parser,index_contacts_parser],help='(step 1) split files by chromosome')
     if genomedisco_or_replicateqc=='GenomeDISCO':
-        split_parser=subparsers.add_parser('preprocess',parents=[metadata_samples_parser,bins_parser,re_fragments_parser,outdir_parser,running_mode_parser,subset_chromosomes_parser,parameter_file_parser,timing_parser],help='(step 1) split files by chromosome')
+        split_parser=subparsers.add_parser('preprocess',parents=[metadata_samples_parser,bins_parser,re_fragments_parser,outdir_parser,running_mode_parser,subset_chromosomes_parser,parameter_file_parser,timing_parser,resume_parser,index_contacts_parser],help='(step 1) split files by chromosome')
 
     if genomedisco_or_replicateqc=='replicateqc':
         qc_parser=subparsers.add_parser('qc',parents=[metadata_samples_parser,methods_parser,outdir_parser,running_mode_parser,concise_analysis_parser,subset_chromosomes_parser,timing_parser],help='(step 2.a) compute QC per sample')
 
     if genomedisco_or_replicateqc=='replicateqc':
-        reproducibility_parser=subparsers.add_parser('concordance',parents=[metadata_pairs_parser,methods_parser,outdir_parser,running_mode_parser,concise_analysis_parser,subset_chromosomes_parser,timing_parser],help='(step 2.b) compute reproducibility of replicate pairs')
+        reproducibility_parser=subparsers.add_parser('concordance',parents=[metadata_pairs_parser,methods_parser,outdir_parser,running_mode_parser,concise_analysis_parser,subset_chromosomes_parser,timing_parser,resume_parser],help='(step 2.b) compute reproducibility of replicate pairs')
+
+    if genomedisco_or_replicateqc=='GenomeDISCO':
+        reproducibility_parser=subparsers.add_parser('concordance',parents=[metadata_pairs_parser,outdir_parser,running_mode_parser,concise_analysis_parser,subset_chromosomes_parser,timing_parser,resume_parser],help='(step 2) compute concordance of replicate pairs')
+
+    if genomedisco_or_replicateqc=='replicateqc':
+        summary_parser=subparsers.add_parser('summary',parents=[metadata_samples_parser,metadata_pairs_parser,bins_parser,re_fragments_parser,methods_parser,outdir_parser,running_mode_parser,concise_analysis_parser,subset_chromosomes_parser,weight_parser,strict_memory_parser],help='(step 3) create html report of the results')
 
     if genomedisco_or_replicateqc=='GenomeDISCO':
-        reproducibility_parser=subparsers.add_parser('concordance',parents=[metadata_pairs_parser,outdir_parser,running_mode_parser,concise_analysis_parser,subset_chromosomes_parser,timing_parser],help='(step 2) compute concordance of replicate pairs')
+        summary_parser=subparsers.add_parser('summary',parents=[metadata_samples_parser,metadata_pairs_parser,bins_parser,re_fragments_parser,outdir_parser,running_mode_parser,concise_analysis_parser,subset_chromosomes_parser,weight_parser,strict_memory_parser],help='(step 3) create html report of the results')
 
     if genomedisco_or_replicateqc=='replicateqc':
-        summary_parser=subparsers.add_parser('summary',parents=[metadata_samples_parser,metadata_pairs_parser,bins_parser,re_fragments_parser,methods_parser,outdir_parser,running_mode_parser,concise_analysis_parser,subset_chromosomes_parser],help='(step 3) create html report of the results')
+        report_parser=subparsers.add_parser('report',parents=[metadata_pairs_parser,methods_parser,outdir_parser,subset_chromosomes_parser,weight_parser,processes_parser],help='(step 2.c) render the plots of the concordance step')
 
     if genomedisco_or_replicateqc=='GenomeDISCO':
-        summary_parser=subparsers.add_parser('summary',parents=[metadata_samples_parser,metadata_pairs_parser,bins_parser,re_fragments_parser,outdir_parser,running_mode_parser,concise_analysis_parser,subset_chromosomes_parser],help='(step 3) create html report of the results')
+        report_parser=subparsers.add_parser('report',parents=[metadata_pairs_parser,outdir_parser,subset_chromosomes_parser,weight_parser,processes_parser],help='(step 2.c) render the plots of the concordance step')
 
     cleanup_parser=subparsers.add_parser('cleanup',parents=[outdir_parser,concise_analysis_parser],help='(step 4) clean up files')
     
@@ -118,7 +137,7 @@ def write_resolution(nodes,resolution_filename):
     resolution=int(np.median(np.array(node_sizes)))
     resolution_file.write(str(resolution)+'\n')
 
-def preprocess(metadata_samples,bins,re_fragments,methods,outdir,running_mode,subset_chromosomes,parameters_file,timing):
+def preprocess(metadata_samples,bins,re_fragments,methods,outdir,running_mode,subset_chromosomes,parameters_file,timing,resume=False,index_contacts=False):
     methods_list=methods.split(',')
 
     #change paths to absolute paths
@@ -155,41 +174,105 @@ def preprocess(metadata_samples,bins,re_fragments,methods,outdir,running_mode,su
     # Pre-process data for QuASAR
     #========================================
     if 'QuASAR-QC' in methods_list or 'QuASAR-Rep' in methods_list or "all" in methods_list:
-        quasar_preprocess(metadata_samples,outdir,subset_chromosomes,running_mode,timing,parameters,resolution,nodes)
+        quasar_preprocess(metadata_samples,outdir,subset_chromosomes,running_mode,timing,parameters,resolution,nodes,resume)
 
     #========================================
     # Pre-process data for the other methods
     #========================================
     if 'GenomeDISCO' in methods_list or 'HiCRep' in methods_list or 'HiC-Spector' in methods_list or "all" in methods_list:
-        nonquasar_preprocess(metadata_samples,outdir,subset_chromosomes,running_mode,timing,parameters,nodes)
-
-def nonquasar_preprocess(metadata_samples,outdir,subset_chromosomes,running_mode,timing,parameters,nodes):
+        nonquasar_preprocess(metadata_samples,outdir,subset_chromosomes,running_mode,timing,parameters,nodes,resume,re_fragments,index_contacts)
+
+def skip_task(outdir,task,resume):
+    #with --resume, completed tasks are skipped. Otherwise, the task is run again, and pending until it finishes
+    if resume and manifest.is_done(outdir,task):
+        return True
+    manifest.reset(outdir,task)
+    return False
+
+def nonquasar_preprocess(metadata_samples,outdir,subset_chromosomes,running_mode,timing,parameters,nodes,resume=False,re_fragments=False,index_contacts=False):
+        tasks=[]
+        chromos=[chromo_line.strip() for chromo_line in gzip.open(outdir+'/data/metadata/chromosomes.gz','r').readlines()]
+        if subset_chromosomes!='NA':
+            chromos=[chromo for chromo in chromos if chromo in subset_chromosomes.split(',')]
+
+        #the split files are intermediates, compressed with a fast level by default
+        level=parameters.get('IO',{}).get('compression_level','1')
+        #.pairs files and indexed contact maps are read once per sample, by a script that writes the edges of all pending chromosomes
+        single_pass_samples=[]
+        for line in open(metadata_samples,'r').readlines():
+            samplename,samplefile=line.strip().split()[:2]
+            if pairs_io.is_pairs(samplefile):
+                single_pass_samples.append((samplename,samplefile,'pairs'))
+            elif contact_index.is_indexed(samplefile) or (index_contacts and not cooler_io.is_cooler(samplefile)):
+                single_pass_samples.append((samplename,samplefile,'indexed'))
+        for samplename,samplefile,kind in single_pass_samples:
+            edges_tasks=['preprocess.edges.'+samplename+'.'+chromo for chromo in chromos]
+            tasks+=edges_tasks
+            pending=[chromos[c] for c in range(len(chromos)) if not skip_task(outdir,edges_tasks[c],resume)]
+            if len(pending)==0:
+                print('Step: preprocess | '+strftime("%c")+' | Skipping '+samplename+' (done)')
+                continue
+            print('Step: preprocess | '+strftime("%c")+' | Splitting '+samplename+' '+','.join(pending))
+            script_sample_file=outdir+'/scripts/split/'+samplename+'/'+samplename+'.split_files_by_chromosome.sh'
+            subp.check_output(['bash','-c','mkdir -p '+os.path.dirname(script_sample_file)+' '+outdir+'/data/edges/'+samplename])
+            script_sample=open(script_sample_file,'w')
+            script_sample.write("#!/bin/sh"+'\n')
+            script_sample.write('set -e'+'\n')
+            edges_prefix=outdir+'/data/edges/'+samplename+'/'+samplename
+            if kind=='pairs':
+                script_sample.write(sys.executable+' '+repo_dir+'/genomedisco/pairs_io.py --pairs '+samplefile+' --bins '+nodes+(' --re_fragments' if re_fragments else '')+' --chromosomes '+','.join(pending)+' --outpref '+edges_prefix+' --compression_level '+level+'\n')
+            else:
+                indexed_file=samplefile
+                if not contact_index.is_indexed(samplefile):
+                    #sorted once, and reused by later runs in this outdir as long as the sample does not change
+                    indexed_file=outdir+'/data/indexed/'+samplename+'.contacts.gz'
+                    script_sample.write('mkdir -p '+os.path.dirname(indexed_file)+'\n')
+                    script_sample.write(sys.executable+' '+repo_dir+'/genomedisco/contact_index.py index --contacts '+samplefile+' --bins '+nodes+' --out '+indexed_file+'\n')
+                script_sample.write(sys.executable+' '+repo_dir+'/genomedisco/contact_index.py split --contacts '+indexed_file+' --chromosomes '+','.join(pending)+' --outpref '+edges_prefix+' --compression_level '+level+'\n')
+            for chromo in pending:
+                script_sample.write(manifest.done_cmd(outdir,'preprocess.edges.'+samplename+'.'+chromo)+'\n')
+            script_sample.write('rm '+script_sample_file+'*'+'\n')
+            script_sample.close()
+            run_script(script_sample_file,running_mode,parameters)
+        single_pass_names=[sample[0] for sample in single_pass_samples]
 
         #split the data into chromosomes
-        for chromo_line in gzip.open(outdir+'/data/metadata/chromosomes.gz','r').readlines():
-            chromo=chromo_line.strip()
-            
-            if subset_chromosomes!='NA':
-                if chromo not in subset_chromosomes.split(','):
-                    continue
+        for chromo in chromos:
             #nodes ===============
-            script_nodes_file=outdir+'/scripts/split/nodes/'+chromo+'.nodes.split_files_by_chromosome.sh'
-            subp.check_output(['bash','-c','mkdir -p '+os.path.dirname(script_nodes_file)])
-            script_nodes=open(script_nodes_file,'w')
-            script_nodes.write("#!/bin/sh"+'\n')
+            #each file is written to a temporary file and renamed once complete
+            task='preprocess.nodes.'+chromo
+            tasks.append(task)
             nodefile=outdir+'/data/nodes/nodes.'+chromo+'.gz'
 
-            print('Step: preprocess | '+strftime("%c")+' | Splitting nodes '+chromo)
+            if skip_task(outdir,task,resume):
+                print('Step: preprocess | '+strftime("%c")+' | Skipping nodes '+chromo+' (done)')
+            else:
+                script_nodes_file=outdir+'/scripts/split/nodes/'+chromo+'.nodes.split_files_by_chromosome.sh'
+                subp.check_output(['bash','-c','mkdir -p '+os.path.dirname(script_nodes_file)])
+                script_nodes=open(script_nodes_file,'w')
+                script_nodes.write("#!/bin/sh"+'\n')
 
-            script_nodes.write("gunzip -c "+nodes+' | sort -k1,1 -k2,2n | awk \'{print "chr"$1"\\t"$2"\\t"$3"\\t"$4"\\tincluded"}\' | sed \'s/chrchr/chr/g\' | awk -v chromosome='+chromo+' \'{if ($1==chromosome) print $0}\' | gzip > '+nodefile+'\n')
-            script_nodes.write('rm '+script_nodes_file+'*'+'\n')
-            script_nodes.close()
-            run_script(script_nodes_file,running_mode,parameters)
+                print('Step: preprocess | '+strftime("%c")+' | Splitting nodes '+chromo)
+
+                script_nodes.write('set -e'+'\n')
+                script_nodes.write(gzio.gunzip_cmd()+" "+nodes+' | sort -k1,1 -k2,2n | awk \'{print "chr"$1"\\t"$2"\\t"$3"\\t"$4"\\tincluded"}\' | sed \'s/chrchr/chr/g\' | awk -v chromosome='+chromo+' \'{if ($1==chromosome) print $0}\' | '+gzio.gzip_cmd(level)+' > '+nodefile+'.tmp'+'\n')
+                script_nodes.write('mv '+nodefile+'.tmp '+nodefile+'\n')
+                script_nodes.write(manifest.done_cmd(outdir,task)+'\n')
+                script_nodes.write('rm '+script_nodes_file+'*'+'\n')
+                script_nodes.close()
+                run_script(script_nodes_file,running_mode,parameters)
 
             #edges =====================
             for line in open(metadata_samples,'r').readlines():
                 items=line.strip().split()
                 samplename=items[0]
+                if samplename in single_pass_names:
+                    continue
+                task='preprocess.edges.'+samplename+'.'+chromo
+                tasks.append(task)
+                if skip_task(outdir,task,resume):
+                    print('Step: preprocess | '+strftime("%c")+' | Skipping '+samplename+' '+chromo+' (done)')
+                    continue
                 
                 print('Step: preprocess | '+strftime("%c")+' | Splitting '+samplename+' '+chromo)
 
@@ -199,13 +282,26 @@ def nonquasar_preprocess(metadata_samples,outdir,subset_chromosomes,running_mode
                 script_edges=open(script_edges_file,'w')
                 script_edges.write("#!/bin/sh"+'\n')
                 edgefile=outdir+'/data/edges/'+samplename+'/'+samplename+'.'+chromo+'.gz'
+                script_edges.write('set -e'+'\n')
                 script_edges.write('mkdir -p '+os.path.dirname(edgefile)+'\n')
-                script_edges.write('gunzip -c '+samplefile+' | awk \'{print "chr"$1"\\t"$2"\\tchr"$3"\\t"$4"\\t"$5}\' | sed \'s/chrchr/chr/g\' | awk -v chromosome='+chromo+' \'{if ($1==chromosome && $3==chromosome) print $2"\\t"$4"\\t"$5}\' | gzip > '+edgefile+'\n')
+                if cooler_io.is_cooler(samplefile):
+                    #only the pixels of this chromosome are read from the cooler file
+                    script_edges.write(sys.executable+' '+repo_dir+'/genomedisco/cooler_io.py --cool '+samplefile+' --chromosome '+chromo+' --bins '+nodes+' --out '+edgefile+'.tmp'+' --compression_level '+level+'\n')
+                else:
+                    script_edges.write(gzio.gunzip_cmd()+' '+samplefile+' | awk \'{print "chr"$1"\\t"$2"\\tchr"$3"\\t"$4"\\t"$5}\' | sed \'s/chrchr/chr/g\' | awk -v chromosome='+chromo+' \'{if ($1==chromosome && $3==chromosome) print $2"\\t"$4"\\t"$5}\' | '+gzio.gzip_cmd(level)+' > '+edgefile+'.tmp'+'\n')
+                script_edges.write('mv '+edgefile+'.tmp '+edgefile+'\n')
+                script_edges.write(manifest.done_cmd(outdir,task)+'\n')
                 script_edges.write('rm '+script_edges_file+'*'+'\n')
                 script_edges.close()
                 run_script(script_edges_file,running_mode,parameters)
-
-def quasar_preprocess(metadata_samples,outdir,subset_chromosomes,running_mode,timing,parameters,resolution,nodes):
+        pending=manifest.write_manifest(outdir,tasks)
+        print('Step: preprocess | '+strftime("%c")+' | '+str(pending)+' tasks pending, see '+manifest.manifest_path(outdir))
+
+def quasar_preprocess(metadata_samples,outdir,subset_chromosomes,running_mode,timing,parameters,resolution,nodes,resume=False):
+    task='preprocess.QuASAR'
+    if skip_task(outdir,task,resume):
+        print('Step: preprocess | '+strftime("%c")+' | Skipping QuASAR data (done)')
+        return
     #setup parameters
     rebinning=parameters['QuASAR']['rebinning']
     if rebinning=='resolution':
@@ -223,6 +319,7 @@ def quasar_preprocess(metadata_samples,outdir,subset_chromosomes,running_mode,ti
     
 
     #go through each sample, and process it for QuASAR
+    quasar_transforms=[]
     for line in open(metadata_samples,'r').readlines():
         items=line.strip().split()
         samplename=items[0]
@@ -231,6 +328,7 @@ def quasar_preprocess(metadata_samples,outdir,subset_chromosomes,running_mode,ti
         quasar_output=quasar_data+'/'+samplename+'.quasar_data'
         quasar_project=quasar_data+'/'+samplename+'.quasar_project'
         quasar_transform=quasar_data+'/'+samplename+'.quasar_transform'
+        quasar_transforms.append(quasar_transform)
         if subset_chromosomes=='NA':
             #all chromosomes                                                                                
             script_forquasar.write('gunzip -c  '+samplefile+' | sed \'s/chr//g\' | awk \'{print "chr"$1"'+'\\'+'t'+'"$2"\\tchr"$3"\\t"$4"\\t"$5}\' | gzip > '+full_dataset+'\n')
@@ -255,12 +353,20 @@ def quasar_preprocess(metadata_samples,outdir,subset_chromosomes,running_mode,ti
 
         #remove intermediate files
         script_forquasar.write('rm '+quasar_output+' '+quasar_project+'\n')
+    #done once the transforms of all samples are there
+    script_forquasar.write(' && '.join(['[ -f '+quasar_transform+' ]' for quasar_transform in quasar_transforms]+[manifest.done_cmd(outdir,task)])+'\n')
     script_forquasar.close()
     run_script(script_forquasar_file,running_mode,parameters)
+    manifest.write_manifest(outdir,[task])
 
-def run_script(script_name,running_mode,parameters):
+def run_script(script_name,running_mode,parameters,memory_mb='NA'):
 
     subp.check_output(['bash','-c','chmod 755 '+script_name])
+    #a memory request computed for this job replaces the one in the parameters file
+    if memory_mb!='NA':
+        parameters=copy.deepcopy(parameters)
+        parameters['SGE']['text']=re.sub('-l h_vmem=\S+','',re.sub('"','',parameters['SGE']['text'])).strip()+' -l h_vmem='+str(memory_mb)+'M'
+        parameters['slurm']['text']=re.sub('--mem[= ]\S+','',re.sub('"','',parameters['slurm']['text'])).strip()+' --mem '+str(memory_mb)+'M'
     if running_mode=='NA':
         #print script_name+'.timed'
         output=subp.check_output(['bash','-c',script_name])
@@ -287,7 +393,10 @@ def read_parameters_file(parameters_file):
         parameters[method_name][param_name]=param_value
     return parameters
 
-def QuASAR_rep_wrapper(outdir,parameters,samplename1,samplename2,running_mode,timing):
+def QuASAR_rep_wrapper(outdir,parameters,samplename1,samplename2,running_mode,timing,resume=False):
+    task='concordance.QuASAR-Rep.'+samplename1+'.'+samplename2
+    if skip_task(outdir,task,resume):
+        return []
     script_comparison_file=outdir+'/scripts/QuASAR-Rep/'+samplename1+'.vs.'+samplename2+'/'+samplename1+'.vs.'+samplename2+'.QuASAR-Rep.sh'
     subp.check_output(['bash','-c','mkdir -p '+os.path.dirname(script_comparison_file)])
     script_comparison=open(script_comparison_file,'w')
@@ -310,8 +419,14 @@ def QuASAR_rep_wrapper(outdir,parameters,samplename1,samplename2,running_mode,ti
     script_comparison.write('sleep 10'+'\n')
     script_comparison.write(sys.executable+' '+replicateqc_path+"/wrappers/QuASAR/quasar_combine_by_chromosomes.py"+' '+outpath+' '+samplename1+' '+samplename2+'\n')
     script_comparison.write('rm '+outpath+'\n')
+    #the combined file has one "sample1 sample2 chromosome score" row per chromosome
+    combined_scores=os.path.dirname(outpath)+'/'+samplename1+'.vs.'+samplename2+'.txt'
+    scores_table=results_table.task_table_path(outdir,samplename1,samplename2,'genomewide','QuASAR-Rep')
+    rows_cmd='cat '+combined_scores+" | awk '{print "+'$1"\\t"$2"\\t"$3"\\tQuASAR-Rep\\tfinal\\t"$4"\\tNA\\tNA\\tNA\\tNA\\tNA"}\''
+    script_comparison.write('if [ -f '+combined_scores+' ]; then '+results_table_cmd(rows_cmd,scores_table)+' && '+manifest.done_cmd(outdir,task)+'; fi\n')
     script_comparison.close()
     run_script(script_comparison_file,running_mode,parameters)
+    return [task]
 
 def quasar_qc_wrapper(outdir,parameters,samplename,running_mode,timing):
     script_comparison_file=outdir+'/scripts/QuASAR-QC/'+samplename+'/'+samplename+'.QuASAR-QC.sh'
@@ -334,7 +449,15 @@ def quasar_qc_wrapper(outdir,parameters,samplename,running_mode,timing):
     script_comparison.close()
     run_script(script_comparison_file,running_mode,parameters)
 
-def HiCRep_wrapper(outdir,parameters,concise_analysis,samplename1,samplename2,chromo,running_mode,f1,f2,nodefile,resolution,all_scores,timing):
+def results_table_cmd(rows_cmd,scores_table):
+    #writes the rows printed by rows_cmd to a results table of a task, through a temporary file that is renamed once complete
+    return 'mkdir -p '+os.path.dirname(scores_table)+" && { printf '#"+'\\t'.join(results_table.columns)+"\\n'; "+rows_cmd+"; } > "+scores_table+'.tmp && mv '+scores_table+'.tmp '+scores_table
+
+def scores_to_results_table_cmd(scores_file,chromo,method,scores_table):
+    #converts a "sample1 sample2 score" file into rows of the results table
+    return results_table_cmd('cat '+scores_file+" | awk -v chromosome="+chromo+" -v method="+method+" '{print "+'$1"\\t"$2"\\t"chromosome"\\t"method"\\tfinal\\t"$3"\\tNA\\tNA\\tNA\\tNA\\tNA"}\'',scores_table)
+
+def HiCRep_wrapper(outdir,parameters,concise_analysis,samplename1,samplename2,chromo,running_mode,f1,f2,nodefile,resolution,scores_table,timing):
     cmdlist=[]
     cmdlist.append("#!/bin/sh")
     cmdlist.append('. '+bashrc_file)
@@ -352,10 +475,10 @@ def HiCRep_wrapper(outdir,parameters,concise_analysis,samplename1,samplename2,ch
                 timing_text2='; } 2> '+timing_file
             cmd=timing_text1+"${pathtor}script "+hicrepcode+' '+f1+' '+f2+' '+outpath+' '+parameters['HiCRep']['maxdist']+' '+str(resolution)+' '+nodefile+' '+parameters['HiCRep']['h']+' '+samplename1+' '+samplename2+' '+timing_text2
             cmdlist.append(cmd)
-            cmdlist.append('cat '+outpath+" | awk -v chromosome="+chromo+" '{print "+'$1"\\t"$2"\\t"chromosome"\\t"$3}\' >> '+all_scores)
+            cmdlist.append(scores_to_results_table_cmd(outpath,chromo,'HiCRep',scores_table))
     return cmdlist
     
-def HiCSpector_wrapper(outdir,parameters,concise_analysis,samplename1,samplename2,chromo,running_mode,f1,f2,nodefile,all_scores,timing,resolution):
+def HiCSpector_wrapper(outdir,parameters,concise_analysis,samplename1,samplename2,chromo,running_mode,f1,f2,nodefile,scores_table,timing,resolution):
     cmdlist=[]
     cmdlist.append("#!/bin/sh")
     if os.path.isfile(f1) and os.path.getsize(f1)>20:
@@ -376,10 +499,20 @@ def HiCSpector_wrapper(outdir,parameters,concise_analysis,samplename1,samplename
             cmdlist.append(timing_text1+sys.executable+" -W ignore "+replicateqc_path+"/wrappers/HiC-Spector/run_reproducibility_v1.py t "+f1+" "+f2+" "+outpath+".printout "+str(resolution)+" "+parameters['HiC-Spector']['n']+' '+timing_text2)
             cmdlist.append("cat "+outpath+".printout | tail -n1 | cut -f2 | awk '{print \""+samplename1+"\\t"+samplename2+"\\t\"$3}' > "+outpath)
             cmdlist.append("rm "+outpath+".printout")
-            cmdlist.append('cat '+outpath+" | awk -v chromosome="+chromo+" '{print "+'$1"\\t"$2"\\t"chromosome"\\t"$3}\' >> '+all_scores)
+            cmdlist.append(scores_to_results_table_cmd(outpath,chromo,'HiC-Spector',scores_table))
     return cmdlist
         
-def GenomeDISCO_wrapper(outdir,parameters,concise_analysis,samplename1,samplename2,chromo,running_mode,f1,f2,nodefile,all_scores,timing):
+def GenomeDISCO_memory(parameters,f1,f2,nodefile,concise_analysis=False):
+    #memory to request for a comparison (in MB): the estimated peak memory of the exact random walks and of the plot data, up to GenomeDISCO|memory_budget
+    #if that is not enough, compute_reproducibility.py falls back to an engine that fits
+    if 'memory_budget' not in parameters['GenomeDISCO'] or parameters['GenomeDISCO']['memory_budget']=='NA':
+        return 'NA'
+    if not (os.path.isfile(f1) and os.path.isfile(f2)):
+        return 'NA'
+    estimate=planner.estimate_job_mb(planner.count_entries(nodefile),planner.count_entries(f1),planner.count_entries(f2),int(parameters['GenomeDISCO']['tmax']),plots=not concise_analysis)
+    return int(min(float(parameters['GenomeDISCO']['memory_budget']),estimate))
+
+def GenomeDISCO_wrapper(outdir,parameters,concise_analysis,samplename1,samplename2,chromo,running_mode,f1,f2,nodefile,resolution,scores_table,timing,memory_mb='NA'):
 
     cmdlist=[]
     cmdlist.append("#!/bin/sh")
@@ -388,6 +521,10 @@ def GenomeDISCO_wrapper(outdir,parameters,concise_analysis,samplename1,samplenam
             concise_analysis_text=''                                                                  
             if concise_analysis:                                                                      
                 concise_analysis_text=' --concise_analysis'              
+            #plots are rendered by the report step
+            defer_plots_text=''
+            if not concise_analysis:
+                defer_plots_text=' --defer_plots'
             scoresByStep_text=''
             if parameters['GenomeDISCO']['scoresByStep']=='yes':
                 scoresByStep_text=' --scoresByStep'
@@ -397,6 +534,13 @@ def GenomeDISCO_wrapper(outdir,parameters,concise_analysis,samplename1,samplenam
             transition_text=''
             if parameters['GenomeDISCO']['transition']=='yes':
                 transition_text=' --transition'
+            #the ICE bias of each sample is computed once per chromosome and shared across comparisons
+            ice_text=''
+            if parameters['GenomeDISCO']['norm']=='ice':
+                ice_text=' --bias_cache '+outdir+'/data/bias'
+                for param in ['ice_tol','ice_maxiter']:
+                    if param in parameters['GenomeDISCO']:
+                        ice_text=ice_text+' --'+param+' '+parameters['GenomeDISCO'][param]
             #get the sample that goes for subsampling
             subsampling=parameters['GenomeDISCO']['subsampling']
             if parameters['GenomeDISCO']['subsampling']!='NA' and parameters['GenomeDISCO']['subsampling']!='lowest':
@@ -405,19 +549,19 @@ def GenomeDISCO_wrapper(outdir,parameters,concise_analysis,samplename1,samplenam
 
             outpath=outdir+'/results/reproducibility/GenomeDISCO'
             cmdlist.append('mkdir -p '+outpath)
-            #{ time ./testscript.sh; } 2> out.txt
-            timing_text1=''
-            timing_text2=''
             cmdlist.append('cd '+os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
             
+            #each stage is timed by compute_reproducibility.py itself
+            timing_text=''
             if timing:
-                cmdlist.append('mkdir -p '+outdir+'/timing/GenomeDISCO')
-                timing_file=outdir+'/timing/GenomeDISCO/GenomeDISCO.'+chromo+'.'+samplename1+'.'+samplename2+'.timing.txt'
-                timing_text1='{ time '
-                timing_text2='; } 2> '+timing_file
-            cmd=timing_text1+sys.executable+" "+repo_dir+"/genomedisco/compute_reproducibility.py"+" --m1 "+f1+" --m2 "+f2+" --m1name "+samplename1+" --m2name "+samplename2+" --node_file "+nodefile+" --outdir "+outpath+" --outpref "+chromo+" --m_subsample "+subsampling+" --approximation 10000000 --norm "+parameters['GenomeDISCO']['norm']+" --method RandomWalks "+" --tmin "+parameters['GenomeDISCO']['tmin']+" --tmax "+parameters['GenomeDISCO']['tmax']+concise_analysis_text+scoresByStep_text+removeDiag_text+transition_text+' '+timing_text2
+                timing_text=' --timing_table '+results_table.task_table_path(outdir,samplename1,samplename2,chromo,'GenomeDISCO','timing')
+            #engine for the random walks, chosen given the memory budget, and logged with the estimated and measured peak memory
+            memory_text=' --memory_budget '+str(memory_mb)+' --memory_plan_table '+results_table.task_table_path(outdir,samplename1,samplename2,chromo,'GenomeDISCO','memory_plan')
+            for param in ['engine','band']:
+                if param in parameters['GenomeDISCO']:
+                    memory_text=memory_text+' --'+param+' '+parameters['GenomeDISCO'][param]
+            cmd=sys.executable+" "+repo_dir+"/genomedisco/compute_reproducibility.py"+" --m1 "+f1+" --m2 "+f2+" --m1name "+samplename1+" --m2name "+samplename2+" --node_file "+nodefile+" --outdir "+outpath+" --outpref "+chromo+" --m_subsample "+subsampling+" --approximation 10000000 --norm "+parameters['GenomeDISCO']['norm']+" --method RandomWalks "+" --tmin "+parameters['GenomeDISCO']['tmin']+" --tmax "+parameters['GenomeDISCO']['tmax']+" --resolution "+resolution+ice_text+concise_analysis_text+defer_plots_text+scoresByStep_text+removeDiag_text+transition_text+" --stats_cache "+outdir+"/data/stats --results_table "+scores_table+timing_text+memory_text+" --chromosome "+chromo
             cmdlist.append(cmd)
-            cmdlist.append('cat '+outpath+'/'+chromo+'.'+samplename1+'.vs.'+samplename2+".scores.txt | awk -v chromosome="+chromo+" '{print "+'$1"\\t"$2"\\t"chromosome"\\t"$3}\' >> '+all_scores)
     return cmdlist
 
 def add_cmds_to_file(cmds,cmds_filename):
@@ -429,7 +573,7 @@ def add_cmds_to_file(cmds,cmds_filename):
         cmds_file.write(cmds[i]+'\n')
     cmds_file.close()
 
-def concordance(metadata_pairs,methods,outdir,running_mode,concise_analysis,subset_chromosomes,timing):
+def concordance(metadata_pairs,methods,outdir,running_mode,concise_analysis,subset_chromosomes,timing,resume=False):
     #todo: remove parameters file from the arguments here
     parameters_file=outdir+'/parameters.txt'
 
@@ -448,17 +592,16 @@ def concordance(metadata_pairs,methods,outdir,running_mode,concise_analysis,subs
     resolution=open(resolution_file,'r').readlines()[0].split()[0]
 
     scripts_to_run=set()
+    #memory to request for each script (the largest of its comparisons)
+    scripts_memory={}
+    #one task per (method, pair, chromosome), each writing its own results table
+    tasks=[]
 
     for line in open(metadata_pairs,'r').readlines():                                                     
         items=line.strip().split()                                                                       
         samplename1,samplename2=items[0],items[1]
         print('Step: concordance | '+strftime("%c")+' | '+'computing concordance between '+samplename1+' and '+samplename2)
 
-        #total scores per sample
-        GenomeDISCO_scores=outdir+'/results/reproducibility/GenomeDISCO/'+samplename1+'.vs.'+samplename2+'.txt'
-        HiCRep_scores=outdir+'/results/reproducibility/HiCRep/'+samplename1+'.vs.'+samplename2+'.txt'
-        HiCSpector_scores=outdir+'/results/reproducibility/HiC-Spector/'+samplename1+'.vs.'+samplename2+'.txt'
-
         #scripts for each method
         cmds_file={}
         for method in ['GenomeDISCO','HiCRep','HiC-Spector']:
@@ -467,23 +610,13 @@ def concordance(metadata_pairs,methods,outdir,running_mode,concise_analysis,subs
                 if os.path.exists(cmds_file[method]):
                     subp.check_output(['bash','-c','rm '+cmds_file[method]])
 
-        if os.path.exists(GenomeDISCO_scores):
-            if "GenomeDISCO" in methods_list or "all" in methods_list:
-                subp.check_output(['bash','-c','rm '+GenomeDISCO_scores])
-        if os.path.exists(HiCRep_scores):
-            if "HiCRep" in methods_list or "all" in methods_list:
-                subp.check_output(['bash','-c','rm '+HiCRep_scores])
-        if os.path.exists(HiCSpector_scores):
-            if "HiC-Spector" in methods_list or "all" in methods_list:
-                subp.check_output(['bash','-c','rm '+HiCSpector_scores])
-
         #scripts
         for method in ['GenomeDISCO','HiCRep','HiC-Spector','QuASAR-Rep','QuASAR-QC']:
             if not os.path.exists(outdir+'/scripts/'+method):
                 subp.check_output(['bash','-c','mkdir -p '+outdir+'/scripts/'+method])
 
         if "QuASAR-Rep" in methods_list or "all" in methods_list:
-            QuASAR_rep_wrapper(outdir,parameters,samplename1,samplename2,running_mode,timing)
+            tasks+=QuASAR_rep_wrapper(outdir,parameters,samplename1,samplename2,running_mode,timing,resume)
 
         for chromo_line in gzip.open(outdir+'/data/metadata/chromosomes.gz','r').readlines():               
             chromo=chromo_line.strip()
@@ -495,44 +628,44 @@ def concordance(metadata_pairs,methods,outdir,running_mode,concise_analysis,subs
             f2=outdir+'/data/edges/'+samplename2+'/'+samplename2+'.'+chromo+'.gz'
             nodefile=outdir+'/data/nodes/nodes.'+chromo+'.gz'
 
-            if "GenomeDISCO" in methods_list or "all" in methods_list:
-                scripts_to_run.add(cmds_file['GenomeDISCO'])
-                GenomeDISCO_cmds=GenomeDISCO_wrapper(outdir,parameters,concise_analysis,samplename1,samplename2,chromo,running_mode,f1,f2,nodefile,GenomeDISCO_scores,timing)
-                add_cmds_to_file(GenomeDISCO_cmds,cmds_file['GenomeDISCO'])           
-                
-
-            if "HiCRep" in methods_list or "all" in methods_list:
-                scripts_to_run.add(cmds_file['HiCRep'])
-                HiCRep_cmds=HiCRep_wrapper(outdir,parameters,concise_analysis,samplename1,samplename2,chromo,running_mode,f1,f2,nodefile,resolution,HiCRep_scores,timing)
-                add_cmds_to_file(HiCRep_cmds,cmds_file['HiCRep'])
-
-            if "HiC-Spector" in methods_list or "all" in methods_list:
-                scripts_to_run.add(cmds_file['HiC-Spector'])
-                HiCSpector_cmds=HiCSpector_wrapper(outdir,parameters,concise_analysis,samplename1,samplename2,chromo,running_mode,f1,f2,nodefile,HiCSpector_scores,timing,resolution)
-                add_cmds_to_file(HiCSpector_cmds,cmds_file['HiC-Spector'])
-
-        #remove files with scores for individual chromosomes
-        for chromo_line in gzip.open(outdir+'/data/metadata/chromosomes.gz','r').readlines():
-            chromo=chromo_line.strip()
-            if subset_chromosomes!='NA':
-                if chromo not in subset_chromosomes.split(','):
+            for method in ['GenomeDISCO','HiCRep','HiC-Spector']:
+                if method not in methods_list and "all" not in methods_list:
+                    continue
+                task='concordance.'+method+'.'+samplename1+'.'+samplename2+'.'+chromo
+                tasks.append(task)
+                if skip_task(outdir,task,resume):
+                    print('Step: concordance | '+strftime("%c")+' | '+chromo+' | '+method+' done')
                     continue
-            if "GenomeDISCO" in methods_list or "all" in methods_list:
-                thefile=outdir+'/results/reproducibility/GenomeDISCO/'+chromo+'.'+samplename1+'.vs.'+samplename2+'.scores.txt'
-                add_cmds_to_file(['if [ -f '+thefile+' ] ; then rm '+thefile+';fi'],cmds_file['GenomeDISCO'])
-            if "HiCRep" in methods_list or "all" in methods_list:
-                thefile=outdir+'/results/reproducibility/HiCRep/'+chromo+'.'+samplename1+'.vs.'+samplename2+'.scores.txt'
-                add_cmds_to_file(['if [ -f '+thefile+' ] ; then rm '+thefile+';fi'],cmds_file['HiCRep'])
-            if "HiC-Spector" in methods_list or "all" in methods_list:
-                thefile=outdir+'/results/reproducibility/HiC-Spector/'+chromo+'.'+samplename1+'.vs.'+samplename2+'.scores.txt'
-                add_cmds_to_file(['if [ -f '+thefile+' ] ; then rm '+thefile+';fi'],cmds_file['HiC-Spector'])
+                scores_table=results_table.task_table_path(outdir,samplename1,samplename2,chromo,method)
+                if method=='GenomeDISCO':
+                    memory_mb=GenomeDISCO_memory(parameters,f1,f2,nodefile,concise_analysis)
+                    if memory_mb!='NA':
+                        print('Step: concordance | '+strftime("%c")+' | '+chromo+' | requesting '+str(memory_mb)+' MB')
+                        scripts_memory[cmds_file[method]]=max(scripts_memory.get(cmds_file[method],0),memory_mb)
+                    cmds=GenomeDISCO_wrapper(outdir,parameters,concise_analysis,samplename1,samplename2,chromo,running_mode,f1,f2,nodefile,resolution,scores_table,timing,memory_mb)
+                if method=='HiCRep':
+                    cmds=HiCRep_wrapper(outdir,parameters,concise_analysis,samplename1,samplename2,chromo,running_mode,f1,f2,nodefile,resolution,scores_table,timing)
+                if method=='HiC-Spector':
+                    cmds=HiCSpector_wrapper(outdir,parameters,concise_analysis,samplename1,samplename2,chromo,running_mode,f1,f2,nodefile,scores_table,timing,resolution)
+                #remove the file with the score for this chromosome, now in the results table
+                thefile=outdir+'/results/reproducibility/'+method+'/'+chromo+'.'+samplename1+'.vs.'+samplename2+'.scores.txt'
+                cmds.append('if [ -f '+thefile+' ] ; then rm '+thefile+';fi')
+                scripts_to_run.add(cmds_file[method])
+                add_cmds_to_file(manifest.task_cmds(outdir,task,cmds),cmds_file[method])
+
+    pending=manifest.write_manifest(outdir,tasks)
+    print('Step: concordance | '+strftime("%c")+' | '+str(pending)+' tasks pending, see '+manifest.manifest_path(outdir))
 
     #run scripts ==========================
     scripts_to_run=list(scripts_to_run)
     scripts_to_run.sort()
     for f in scripts_to_run:
         #add_cmds_to_file(['rm '+f],f)
-        run_script(f,running_mode,parameters)
+        run_script(f,running_mode,parameters,scripts_memory.get(f,'NA'))
+    if running_mode=='NA':
+        pending=manifest.write_manifest(outdir,tasks)
+        if pending>0:
+            print('Step: concordance | '+strftime("%c")+' | '+str(pending)+' tasks did not complete, see '+manifest.manifest_path(outdir)+'. Rerun with --resume to run them again.')
 
 def get_qc(metadata_samples,methods,outdir,running_mode,concise_analysis,subset_chromosomes,timing):
     parameters_file=outdir+'/parameters.txt'
@@ -547,35 +680,104 @@ def get_qc(metadata_samples,methods,outdir,running_mode,concise_analysis,subset_
             print('Step: qc | '+strftime("%c")+' | '+'running QuASAR-QC | computing QC for '+samplename)
             quasar_qc_wrapper(outdir,parameters,samplename,running_mode,timing)
 
-def summary(metadata_samples,metadata_pairs,bins,re_fragments,methods,outdir,running_mode,concise_analysis,subset_chromosomes):
+def render_report_figure(figure_job):
+    #runs in a report worker. Each worker renders with its own Agg backend, and a figure is only rendered again if its inputs changed
+    from genomedisco import visualization
+    kind,inputs,fname=figure_job
+    if kind=='GenomeDISCO':
+        key=visualization.plotdata_key(inputs)
+    else:
+        key=hashlib.md5(repr(inputs).encode('utf-8')).hexdigest()
+    key_file=fname+'.key'
+    if os.path.isfile(fname) and os.path.isfile(key_file) and open(key_file,'r').read().strip()==key:
+        return False
+    if kind=='GenomeDISCO':
+        visualization.plot_genomedisco(inputs,fname)
+    if kind=='chrScores':
+        visualization.plot_chromosome_scores(inputs[0],inputs[1],fname)
+    out=open(key_file,'w')
+    out.write(key+'\n')
+    out.close()
+    return True
+
+def report(metadata_pairs,methods,outdir,subset_chromosomes,processes=1,weight_by_nonzero_nodes=False):
+    methods_list=methods.split(',')
+    if "GenomeDISCO" not in methods_list and "all" not in methods_list:
+        return
+    outdir=os.path.abspath(outdir)
+    print('Step: report | '+strftime("%c"))
+
+    pairs=[]
+    for line in open(metadata_pairs,'r').readlines():
+        items=line.strip().split()
+        pairs.append((items[0],items[1]))
+    sorted_chromos=[chromo_line.strip() for chromo_line in gzip.open(outdir+'/data/metadata/chromosomes.gz','r').readlines()]
+    if subset_chromosomes!='NA':
+        sorted_chromos=[chromo for chromo in sorted_chromos if chromo in subset_chromosomes.split(',')]
+    sorted_chromos.sort()
+    results=results_table.read_table(results_table.results_tables(outdir))
+    final_scores=results_table.select(results,method='GenomeDISCO',t='final')
+    chromosome_scores=results_table.chromosome_scores(results,'GenomeDISCO')
+    genomewide=results_table.genomewide_scores(results,'GenomeDISCO','final',sorted_chromos,weight_by_nonzero_nodes)
+
+    #the concordance step saves the binned data behind each contact map plot, and all figures are rendered here, in parallel
+    figures_dir=outdir+'/results/reproducibility/GenomeDISCO'
+    figure_jobs=[]
+    for samplename1,samplename2 in pairs:
+        for chromo in sorted_chromos:
+            pref=figures_dir+'/'+chromo+'.'+samplename1+'.vs.'+samplename2+'.GenomeDISCO'
+            if os.path.isfile(pref+'.plotdata.npz'):
+                figure_jobs.append(('GenomeDISCO',pref+'.plotdata.npz',pref+'.png'))
+        pair_scores=chromosome_scores.get((samplename1,samplename2),{})
+        chromos=[chromo for chromo in sorted_chromos if chromo in pair_scores]
+        if len(chromos)>0:
+            scores=[float(int(1000*pair_scores[chromo]))/1000.0 for chromo in chromos]
+            figure_jobs.append(('chrScores',(chromos,scores),figures_dir+'/'+samplename1+'.vs.'+samplename2+'.chrScores.png'))
+
+    if processes>1 and len(figure_jobs)>1:
+        pool=multiprocessing.Pool(min(processes,len(figure_jobs)))
+        rendered=pool.map(render_report_figure,figure_jobs)
+        pool.close()
+        pool.join()
+    else:
+        rendered=[render_report_figure(figure_job) for figure_job in figure_jobs]
+    print('Step: report | '+strftime("%c")+' | rendered '+str(sum(rendered))+' figures, '+str(len(rendered)-sum(rendered))+' unchanged')
+
+    #one page per pair, and an index page linking them
+    report_dir=outdir+'/results/summary/report'
+    if not os.path.exists(report_dir):
+        os.makedirs(report_dir)
+    for samplename1,samplename2 in pairs:
+        if (samplename1,samplename2) in genomewide:
+            chrscores=figures_dir+'/'+samplename1+'.vs.'+samplename2+'.chrScores.png'
+            write_pair_report(outdir,samplename1,samplename2,final_scores,sorted_chromos,genomewide[(samplename1,samplename2)],chrscores,report_dir,weight_by_nonzero_nodes)
+    write_report_index(report_dir,pairs,genomewide)
+    print('Step: report | '+strftime("%c")+' | '+report_dir+'/index.html')
+
+def summary(metadata_samples,metadata_pairs,bins,re_fragments,methods,outdir,running_mode,concise_analysis,subset_chromosomes,weight_by_nonzero_nodes=False,strict_memory_validation=False):
     methods_list=methods.split(',')
     
     print('Step: summary | '+strftime("%c"))
     #compile scores across methods per chromosome, + genomewide                                            
     #for reproducbility measures =============================================
-    scores={}
+    #all scores are queried from the results table written by the concordance step
     subp.check_output(['bash','-c','mkdir -p '+outdir+'/scores'])
     if methods_list==['all']:
         methods_list=['GenomeDISCO','HiCRep','HiC-Spector','QuASAR-Rep','QuASAR-QC']
+    #the tables written by each task are compiled into outdir/results/scores.table.txt
+    results_table.compile_table(outdir)
+    results=results_table.read_table(results_table.results_table_path(outdir))
+    chromosomes=None
+    if subset_chromosomes!='NA':
+        chromosomes=subset_chromosomes.split(',')
+    scores={}
     for method in methods_list:
         if method=="QuASAR-QC":
             continue
-        scores[method]={}
-        for line in open(metadata_pairs,'r').readlines():
-            items=line.strip().split()
-            samplename1,samplename2=items[0],items[1]
-            scores[method][samplename1+'.vs.'+samplename2]={}
-            #now, read in the scores
-            for line in open(outdir+'/results/reproducibility/'+method+'/'+samplename1+'.vs.'+samplename2+'.txt','r'):
-                items2=line.strip().split('\t')
-                s1,s2,chromo,current_score=items2[0],items2[1],items2[2],float(items2[3])
-                if subset_chromosomes!='NA':
-                    if chromo not in subset_chromosomes.split(','):
-                        continue
-                scores[method][samplename1+'.vs.'+samplename2][chromo]=[current_score]
-                if 'genomewide' not in scores[method][samplename1+'.vs.'+samplename2].keys():
-                    scores[method][samplename1+'.vs.'+samplename2]['genomewide']=[]
-                scores[method][samplename1+'.vs.'+samplename2]['genomewide'].append(current_score)
+        scores[method]=results_table.chromosome_scores(results,method)
+        genomewide=results_table.genomewide_scores(results,method,'final',chromosomes,weight_by_nonzero_nodes)
+        for pair in genomewide:
+            scores[method][pair]['genomewide']=genomewide[pair]
     
     #now, read quality scores
     scores_qc={}
@@ -627,7 +829,10 @@ def summary(metadata_samples,metadata_pairs,bins,re_fragments,methods,outdir,run
                 samplename1,samplename2=items[0],items[1]
                 to_write=[samplename1,samplename2]
                 for method_idx in range(len(methods_list_reproducibility)):
-                    cur_score=str(0.001*int(1000*np.mean(np.array(scores[methods_list_reproducibility[method_idx]][samplename1+'.vs.'+samplename2][chromo]))))
+                    pair_scores=scores[methods_list_reproducibility[method_idx]].get((samplename1,samplename2),{})
+                    cur_score='NA'
+                    if chromo in pair_scores:
+                        cur_score=str(0.001*int(1000*pair_scores[chromo]))
                     to_write.append(cur_score)
                 chromofile.write('\t'.join(to_write)+'\n')
             chromofile.close()
@@ -651,201 +856,175 @@ def summary(metadata_samples,metadata_pairs,bins,re_fragments,methods,outdir,run
                     chromofile.write('\t'.join(to_write)+'\n')
                 chromofile.close()
 
-    #todo: only if concise analysis is off
-    #visualize(outdir,metadata_pairs,methods_list)
-
-def visualize(outdir,metadata_pairs,methods_list):
+    #where the time went, by stage, if the comparisons were timed
+    timings=instrumentation.read_timings(results_table.task_tables(outdir,'timing'))
+    if len(timings)>0:
+        hotspots_file=outdir+'/scores/timing.hotspots.txt'
+        instrumentation.write_hotspots(timings,hotspots_file)
+        print('Step: summary | '+strftime("%c")+' | Running times by stage in '+hotspots_file)
+
+    #how the estimated peak memory of the comparisons compares to the measured one
+    validation_file=outdir+'/scores/memory_plan.validation.txt'
+    failed=planner.write_validation(results_table.task_tables(outdir,'memory_plan'),validation_file)
+    if failed is None:
+        return False
+    print('Step: summary | '+strftime("%c")+' | Estimated vs measured memory in '+validation_file)
+    if len(failed)==0:
+        return False
+    print('Step: summary | '+strftime("%c")+' | Warning: comparisons with the '+','.join(failed)+' engine used more memory than estimated. See '+validation_file)
+    #with --strict_memory_validation, the run fails. run_all exits itself, once the outputs are cleaned up
+    if strict_memory_validation:
+        sys.exit(1)
+    return True
+
+def write_pair_report(outdir,samplename1,samplename2,final_scores,sorted_chromos,genomewide_score,chrscores,report_dir,weight_by_nonzero_nodes=False):
     header_col='FF0000'
     picsize="200"
     topscores=0.85    
+    widthfactor=3
     #TODO: add input from the calibration tables
-
-    print(methods_list)
-    
-    for line in open(metadata_pairs,'r').readlines():
-
-        items=line.strip().split()
-        samplename1,samplename2=items[0],items[1]
-        
-        html_name=outdir+'/results/summary/report/'+samplename1+'.vs.'+samplename2+'.report.html'
-        if not os.path.exists(os.path.dirname(html_name)):
-            os.makedirs(os.path.dirname(html_name))
-        html=open(outdir+'/results/summary/report/'+samplename1+'.vs.'+samplename2+'.report.html','w')
+    figures_dir=os.path.relpath(outdir+'/results/reproducibility/GenomeDISCO',report_dir)
+
+    html=open(report_dir+'/'+samplename1+'.vs.'+samplename2+'.report.html','w')
+    html.write("<html>"+'\n')
+    html.write("<head>"+'\n')
+    html.write("<font color=\""+header_col+"\"> <strong>Genomewide report </font></strong>"+'\n')
+    html.write("<br>"+'\n')
+    html.write("Report generated on "+strftime("%c")+'\n')
+    html.write("<br>"+'\n')
+    html.write("Code: <a href=\"http://github.com/kundajelab/genomedisco\">http://github.com/kundajelab/genomedisco</a>."+"<a href=\"http://github.com/kundajelab/3DChromatin_ReplicateQC\">http://github.com/kundajelab/3DChromatin_ReplicateQC</a>."+'\n')
+    html.write("<br>"+'\n')
+    html.write("Contact: Oana Ursu oanamursu@gmail.com"+'\n')
+    html.write("<br>"+'\n')
+    html.write("<strong>"+samplename1+" vs "+samplename2+"</strong>"+'\n')
+    html.write("</head>"+'\n')
+    html.write("<body>"+'\n')
+    html.write("<a href=\"index.html\">All comparisons</a>"+'\n')
+    html.write("<br>"+'\n')
+    html.write("<br>"+'\n')
+
+    #==========================================
+
+    #genomewide score
+    html.write("<font color=\""+header_col+"\"> <strong>Reproducibility analysis</font></strong>"+'\n')
+    html.write("<br>"+'\n')
+    scoredict={}
+    statsdict={}
+    in_pair=(final_scores['sample1']==samplename1)&(final_scores['sample2']==samplename2)
+    for i in np.where(in_pair)[0]:
+        chromo=final_scores['chromosome'][i]
+        scoredict[chromo]=float(int(1000*final_scores['score'][i]))/1000.0
+        statsdict[chromo]=[final_scores[col][i] for col in ['depth1','depth2','subsampled_depth1','subsampled_depth2']]
+
+    html.write("<td> <strong>What is GenomeDISCO reproducibility?</strong></td>"+'\n')
+    html.write("<br>"+'\n')
+    html.write("GenomeDISCO (DIfferences between Smoothed COntact maps) computes reproducibility by comparing 2 contact maps at increasing levels of smoothing. The smoothing is done using random walks on graphs. For each dataset, we run random walks of increasing length, and ask what is the probability that we reach node j starting at node i, given a random walk through the network of t steps, or iterations. The key idea is that <strong>if 2 nodes are in contact, then there should be many high-confidence paths connecting them through the network</strong>, even if perhaps the direct edge between them was undersampled. Short random walks provide information about the local network structures, such as loop cliques and subdomains, whereas longer random walks shift the focus toward global structures such as compartments. For each random walk iteration we compare the 2 smoothed contact maps, obtaining an L1 difference in smoothed contact maps."+'\n')
+    html.write("<br>"+'\n')
+    html.write("In the end, we integrate information across all random walks by computing the area under the curve of L1 differences vs random walk iterations (see difference plot below), resulting in a dissimilarity score between the 2 contact maps of interest. We transform this dissimilarity into a reproducibility score using the formula \"Reproducibility = 1-d\". This yields a reproducibility score between -1 and 1, with higher values indicating similarity (in practice, the range of scores is [0.4,1])."+'\n')
+    html.write("<br>"+'\n')
+    average='the average across all chromosomes'
+    if weight_by_nonzero_nodes:
+        average='the average across all chromosomes, weighted by their number of nonzero nodes'
+    html.write("GenomeDISCO runs on each chromosome separately. The genomewide score reported below is "+average+". <strong> Higher scores are better</strong>.")
+    html.write("<br>"+'\n')
+    html.write("<br>"+'\n')
+    html.write("<font color=\""+header_col+"\"><strong> Your scores</strong></font>"+'\n')
+    html.write("<br>"+'\n')
+    html.write("<img src=\""+figures_dir+'/'+os.path.basename(chrscores)+"\" width=\""+str(int(1.3*int(picsize))*widthfactor)+"\" height=\""+str(1.3*int(picsize))+"\">"+'\n')
+    html.write("<br>"+'\n')
+    html.write("<br>"+'\n')
+    html.write("Reproducibility (genomewide) = "+str(float("{0:.3f}".format(float(genomewide_score))))+'\n')
     
-        html.write("<html>"+'\n')
-        html.write("<head>"+'\n')
-        html.write("<font color=\""+header_col+"\"> <strong>Genomewide report </font></strong>"+'\n')
-        html.write("<br>"+'\n')
-        html.write("Report generated on "+strftime("%c")+'\n')
-        html.write("<br>"+'\n')
-        html.write("Code: <a href=\"http://github.com/kundajelab/genomedisco\">http://github.com/kundajelab/genomedisco</a>."+"<a href=\"http://github.com/kundajelab/3DChromatin_ReplicateQC\">http://github.com/kundajelab/3DChromatin_ReplicateQC</a>."+'\n')
-        html.write("<br>"+'\n')
-        html.write("Contact: Oana Ursu oanamursu@gmail.com"+'\n')
-        html.write("<br>"+'\n')
-        html.write("<strong>"+samplename1+" vs "+samplename2+"</strong>"+'\n')
-        html.write("</head>"+'\n')
-        html.write("<body>"+'\n')
-        html.write("<br>"+'\n')
-        html.write("<br>"+'\n')
-
-        #==========================================
-
-        
-        #genomewide score
-        html.write("<font color=\""+header_col+"\"> <strong>Reproducibility analysis</font></strong>"+'\n')
-        html.write("<br>"+'\n')
-        score_sum=0.0
-        score_num=0
-        scores=[]
-        chromos=[]
-        scoredict={}
-        for chromo_line in gzip.open(outdir+'/data/metadata/chromosomes.gz','r').readlines():
-            chromo=chromo_line.strip()
-            f=outdir+'/results/reproducibility/GenomeDISCO/'+chromo+'.'+samplename1+".vs."+samplename2+'.scores.txt'
-            if os.path.isfile(f):
-                score_num+=1
-                score=float(open(f,'r').readlines()[0].split('\t')[2])
-                score=float(int(1000*score))/1000.0
-                score_sum+=score
-                scores.append(score)
-                chromos.append(chromo)
-                scoredict[chromo]=score
-        
-        plt.close("all")
-        widthfactor=3
-        rcParams['figure.figsize'] = 10*widthfactor,10
-        rcParams['xtick.labelsize'] = 20
-        rcParams['ytick.labelsize'] = 20
-        plt.scatter(range(len(chromos)),np.array(scores),s=100)
-        plt.xticks(range(len(chromos)),chromos,rotation='vertical')
-        plt.xlabel('chromosome',fontsize=30)
-        plt.ylim(0.4,1.0)
-        plt.axhline(topscores, color='r', linestyle='dashed',linewidth=2,label='threshold for high-quality datasets')
-        plt.axhline(np.array(scores).mean(), color='b', linewidth=2,label='genomewide reproducibility for these datasets')
-        plt.yticks([0.4,0.5,0.6,0.7,0.8,0.9,1.0])
-        plt.ylabel('reproducibility',fontsize=30)
-        plt.gcf().subplots_adjust(bottom=0.25)
-        plt.gcf().subplots_adjust(left=0.25)
-        plt.legend(loc=3,fontsize=25)
-        plt.show()
-        chrscores=outdir+'/results/reproducibility/GenomeDISCO/'+samplename1+'.vs.'+samplename2+'.chrScores.png'
-        plt.savefig(chrscores)
-        plt.close()
-
-        genomewide_score=score_sum/score_num
-        
-        html.write("<td> <strong>What is GenomeDISCO reproducibility?</strong></td>"+'\n')
-        html.write("<br>"+'\n')
-        html.write("GenomeDISCO (DIfferences between Smoothed COntact maps) computes reproducibility by comparing 2 contact maps at increasing levels of smoothing. The smoothing is done using random walks on graphs. For each dataset, we run random walks of increasing length, and ask what is the probability that we reach node j starting at node i, given a random walk through the network of t steps, or iterations. The key idea is that <strong>if 2 nodes are in contact, then there should be many high-confidence paths connecting them through the network</strong>, even if perhaps the direct edge between them was undersampled. Short random walks provide information about the local network structures, such as loop cliques and subdomains, whereas longer random walks shift the focus toward global structures such as compartments. For each random walk iteration we compare the 2 smoothed contact maps, obtaining an L1 difference in smoothed contact maps."+'\n')
-        html.write("<br>"+'\n')
-        html.write("In the end, we integrate information across all random walks by computing the area under the curve of L1 differences vs random walk iterations (see difference plot below), resulting in a dissimilarity score between the 2 contact maps of interest. We transform this dissimilarity into a reproducibility score using the formula \"Reproducibility = 1-d\". This yields a reproducibility score between -1 and 1, with higher values indicating similarity (in practice, the range of scores is [0.4,1])."+'\n')
-        html.write("<br>"+'\n')
-        html.write("GenomeDISCO runs on each chromosome separately. The genomewide score reported below is the average across all chromosomes. <strong> Higher scores are better</strong>.")
-        html.write("<br>"+'\n')
-        html.write("<br>"+'\n')
-        html.write("<font color=\""+header_col+"\"><strong> Your scores</strong></font>"+'\n')
-        html.write("<br>"+'\n')
-        html.write("<img src=\""+"../../reproducibility/"+samplename1+".vs."+samplename2+'/GenomeDISCO/'+os.path.basename(chrscores)+"\" width=\""+str(int(1.3*int(picsize))*widthfactor)+"\" height=\""+str(1.3*int(picsize))+"\">"+'\n')
-        html.write("<br>"+'\n')
-        html.write("<br>"+'\n')
-        html.write("Reproducibility (genomewide) = "+str(float("{0:.3f}".format(float(genomewide_score))))+'\n')
-        
-        if genomewide_score>=topscores:
-            outcome='Congratulations! These datasets are highly reproducible.'
-        else:
-            outcome='These datasets are less reproducible than our empirically defined threshold. This could be due to low sequencing depth, differences in distance dependence curves, noise. Please be cautious with these datasets.'
-        html.write("<br>"+'\n')
-        html.write("<br>"+'\n')
-        html.write("<font color=\"0033FF\"><strong>"+outcome+"</strong></font>"+'\n')
-        html.write("<br>"+'\n')
-        html.write("<br>"+'\n')
-        html.write("<font color=\""+header_col+"\"> <strong>Analysis by chromosome</font></strong>"+'\n')
-        html.write("<br>"+'\n')
-        '''
-        html.write("<td> <strong>The difference plot</strong></td>"+'\n')
-        html.write(" shows the L1 difference (normalized to the number of nodes) as a function of random walk iteration."+'\n')
-        html.write("<br>"+'\n')
-        '''
-        html.write("<td> <strong>The distance dependence plot</strong></td>"+'\n')
-        html.write(" shows the probability of contact as a function of linear genomic distance. If 2 datasets have very difference distance dependence curves, their reproducibility will be lower than if they have similar curves."+'\n')
-        html.write("<br>"+'\n')
-        html.write("<td> <strong>The remaining columns</strong></td>"+'\n')
-        html.write(" below show the contact maps after smoothing with random walks. The upper triangular part plotted in red is "+samplename1+", while the blue is "+samplename2+". The colorbar shows red values as positive and blue values as negative purely for visualization purposes (in reality all values are positive)."+'\n')
-        html.write("<br>"+'\n')
-        html.write("<br>"+'\n')
+    if genomewide_score>=topscores:
+        outcome='Congratulations! These datasets are highly reproducible.'
+    else:
+        outcome='These datasets are less reproducible than our empirically defined threshold. This could be due to low sequencing depth, differences in distance dependence curves, noise. Please be cautious with these datasets.'
+    html.write("<br>"+'\n')
+    html.write("<br>"+'\n')
+    html.write("<font color=\"0033FF\"><strong>"+outcome+"</strong></font>"+'\n')
+    html.write("<br>"+'\n')
+    html.write("<br>"+'\n')
+    html.write("<font color=\""+header_col+"\"> <strong>Analysis by chromosome</font></strong>"+'\n')
+    html.write("<br>"+'\n')
+    html.write("<td> <strong>The contact map plots</strong></td>"+'\n')
+    html.write(" show, from left to right, the original contact maps, the contact maps after smoothing with random walks, and the difference between the smoothed contact maps, together with the difference per genomic region. The upper triangular part plotted in red is "+samplename1+", while the blue is "+samplename2+". The colorbar shows red values as positive and blue values as negative purely for visualization purposes (in reality all values are positive)."+'\n')
+    html.write("<br>"+'\n')
+    html.write("<br>"+'\n')
+
+    #big table
+    html.write("<table border=\"1\" cellpadding=\"10\" cellspacing=\"0\" style=\"border-collapse:collapse;\">"+'\n')
+    html.write("<tr>"+'\n')
+    html.write("<td> </td>"+'\n')
+    html.write("<td> <strong><center>seq. depth, subs. seq. depth</center></strong></td>"+'\n')
+    html.write("<td> <strong><center>GenomeDISCO score</center></strong></td>"+'\n')
+    html.write("<td> <strong><center>contact maps</center></strong></td>"+'\n')
+    html.write("</tr>"+'\n')
+
+    for chromo in sorted_chromos:
+        if chromo in scoredict:
+            s1,s2,ssub1,ssub2=statsdict[chromo]
+            s1=str(float("{0:.2f}".format(float(float(s1)/1000000))))
+            s2=str(float("{0:.2f}".format(float(float(s2)/1000000))))
+            ssub1=str(float("{0:.2f}".format(float(float(ssub1)/1000000))))
+            ssub2=str(float("{0:.2f}".format(float(float(ssub2)/1000000))))
+            html.write("<tr>"+'\n')
+            html.write("<td> <strong> "+chromo+"</strong></td>"+'\n')
+            html.write("<td> "+samplename1+": "+str(s1)+', '+str(ssub1)+' M'+'\n')
+            html.write("<br>"+'\n')
+            html.write("<br>"+'\n')
+            html.write(samplename2+": "+str(s2)+', '+str(ssub2)+" M </td>"+'\n')
+            html.write("<td> "+str(float("{0:.3f}".format(float(scoredict[chromo]))))+" </td>"+'\n')
+            pic=chromo+"."+samplename1+".vs."+samplename2+".GenomeDISCO.png"
+            if os.path.isfile(outdir+'/results/reproducibility/GenomeDISCO/'+pic):
+                html.write("<td> <a href=\""+figures_dir+'/'+pic+"\"><img src=\""+figures_dir+'/'+pic+"\" width=\""+str(5*int(picsize))+"\" height=\""+picsize+"\"></a></td>"+'\n')
+            else:
+                html.write("<td> </td>"+'\n')
+            html.write("</tr>"+'\n')
     
-        #big table
-        html.write("<table border=\"1\" cellpadding=\"10\" cellspacing=\"0\" style=\"border-collapse:collapse;\">"+'\n')
-        html.write("<tr>"+'\n')
-        html.write("<td> </td>"+'\n')
-        html.write("<td> <strong><center>seq. depth, subs. seq. depth</center></strong></td>"+'\n')
-        html.write("<td> <strong><center>GenomeDISCO score</center></strong></td>"+'\n')
-        #html.write("<td> <strong><center>difference plot</center></strong></td>"+'\n')
-        html.write("<td> <strong><center>distance dependence</center></td>"+'\n')
-        
-        #======
-        tmin=3
-        tmax=3
+    html.write("</table>"+'\n')
+    html.write("<br>"+'\n')
+    html.write("</body>"+'\n')
+    html.write("</html>"+'\n')
+    html.close()
 
-        for t in range(tmin,tmax+1):
-            html.write("<td><center><strong>Random walk iteration "+str(t)+"</strong></center></td>"+'\n')
-        html.write("</tr>"+'\n')
-
-        
-        score_strings=[]
-        chromo_strings=[]
-        sorted_chromos=gzip.open(outdir+'/data/metadata/chromosomes.gz','r').readlines()
-        sorted_chromos.sort()
-        for chromo_idx in range(len(sorted_chromos)):
-            chromo=sorted_chromos[chromo_idx].strip()
-            f1=outdir+'/data/edges/'+samplename1+'/'+samplename2+'.'+chromo+'.gz'
-            f2=outdir+'/data/edges/'+samplename1+'/'+samplename2+'.'+chromo+'.gz'
-            f=outdir+'/results/reproducibility/'+samplename1+".vs."+samplename2+'/GenomeDISCO/'+chromo+'.'+samplename1+".vs."+samplename2+'.scores.txt'
-            sf=outdir+'/results/reproducibility/'+samplename1+".vs."+samplename2+'/GenomeDISCO/'+chromo+'.'+samplename1+".vs."+samplename2+'.datastats.txt'
-            
-            if os.path.isfile(f):
-                chromo_strings.append(chromo)
-                items=open(sf,'r').readlines()[1].strip().split('\t')
-                s1,s2,ssub1,ssub2=items[2:6]
-                s1=str(float("{0:.2f}".format(float(float(s1)/1000000))))
-                s2=str(float("{0:.2f}".format(float(float(s2)/1000000))))
-                ssub1=str(float("{0:.2f}".format(float(float(ssub1)/1000000))))
-                ssub2=str(float("{0:.2f}".format(float(float(ssub2)/1000000))))
-                html.write("<tr>"+'\n')
-                html.write("<td> <strong> "+chromo+"</strong></td>"+'\n')
-                score=scoredict[chromo]
-                html.write("<td> "+samplename1+": "+str(s1)+', '+str(ssub1)+' M'+'\n')
-                html.write("<br>"+'\n')
-                html.write("<br>"+'\n')
-                html.write(samplename2+": "+str(s2)+', '+str(ssub2)+" M </td>"+'\n')
-                score_strings.append(str(float("{0:.3f}".format(float(score)))))
-                html.write("<td> "+str(float("{0:.3f}".format(float(score))))+" </td>"+'\n')
-                '''
-                diffplot="../../reproducibility/"+samplename1+".vs."+samplename2+'/GenomeDISCO/'+chromo+"."+samplename1+".vs."+samplename2+".DiscoRandomWalks.Differences.png"
-                
-                html.write("<td> <img src=\""+diffplot+"\" width=\""+picsize+"\" height=\""+picsize+"\"> </td>"+'\n')
-                '''
-                dd="../../reproducibility/"+samplename1+".vs."+samplename2+'/GenomeDISCO/'+chromo+"."+samplename1+".vs."+samplename2+".distDep.png"
-                html.write("<td> <img src=\""+dd+"\" width=\""+picsize+"\" height=\""+picsize+"\"> </td>"+'\n')
-                for t in range(tmin,tmax+1):
-                    pic="../../reproducibility/"+samplename1+".vs."+samplename2+'/GenomeDISCO/'+chromo+"."+samplename1+".vs."+samplename2+".DiscoRandomWalks."+str(t)+".png"
-                    html.write("<td> <img src=\""+pic+"\" width=\""+picsize+"\" height=\""+picsize+"\"></td>"+'\n')
-                html.write("</tr>"+'\n')
-        
-        html.write("</table>"+'\n')
-        html.write("<br>"+'\n')
-        html.write("</body>"+'\n')
-        html.write("</html>"+'\n')
+def write_report_index(report_dir,pairs,genomewide):
+    header_col='FF0000'
+    html=open(report_dir+'/index.html','w')
+    html.write("<html>"+'\n')
+    html.write("<head>"+'\n')
+    html.write("<font color=\""+header_col+"\"> <strong>GenomeDISCO report </font></strong>"+'\n')
+    html.write("<br>"+'\n')
+    html.write("Report generated on "+strftime("%c")+'\n')
+    html.write("</head>"+'\n')
+    html.write("<body>"+'\n')
+    html.write("<br>"+'\n')
+    html.write("<table border=\"1\" cellpadding=\"10\" cellspacing=\"0\" style=\"border-collapse:collapse;\">"+'\n')
+    html.write("<tr><td> <strong>Sample1</strong></td><td> <strong>Sample2</strong></td><td> <strong>GenomeDISCO score (genomewide)</strong></td></tr>"+'\n')
+    for pair in pairs:
+        score='NA'
+        if pair in genomewide:
+            score=str(float("{0:.3f}".format(float(genomewide[pair]))))
+        html.write("<tr><td> "+pair[0]+" </td><td> "+pair[1]+" </td><td> <a href=\""+pair[0]+'.vs.'+pair[1]+".report.html\">"+score+"</a></td></tr>"+'\n')
+    html.write("</table>"+'\n')
+    html.write("</body>"+'\n')
+    html.write("</html>"+'\n')
+    html.close()
 
 def clean_up(outdir,concise_analysis):
     if concise_analysis:
         subp.check_output(['bash','-c','rm -r '+outdir+'/results'])
         subp.check_output(['bash','-c','rm -r '+outdir+'/data'])
+        #the tasks of the run have no outputs left
+        subp.check_output(['bash','-c','rm -rf '+manifest.marker_dir(outdir)+' '+manifest.manifest_path(outdir)])
     subp.check_output(['bash','-c','rm -r '+outdir+'/scripts'])
 
-def run_all(metadata_samples,metadata_pairs,bins,re_fragments,methods,parameters_file,outdir,running_mode,concise_analysis,subset_chromosomes,timing):
-    preprocess(metadata_samples,bins,re_fragments,methods,outdir,running_mode,subset_chromosomes,parameters_file,timing)
+def run_all(metadata_samples,metadata_pairs,bins,re_fragments,methods,parameters_file,outdir,running_mode,concise_analysis,subset_chromosomes,timing,weight_by_nonzero_nodes=False,processes=1,resume=False,index_contacts=False,strict_memory_validation=False):
+    preprocess(metadata_samples,bins,re_fragments,methods,outdir,running_mode,subset_chromosomes,parameters_file,timing,resume,index_contacts)
     get_qc(metadata_samples,methods,outdir,running_mode,concise_analysis,subset_chromosomes,timing)
-    concordance(metadata_pairs,methods,outdir,running_mode,concise_analysis,subset_chromosomes,timing)
-    summary(metadata_samples,metadata_pairs,bins,re_fragments,methods,outdir,running_mode,concise_analysis,subset_chromosomes)
+    concordance(metadata_pairs,methods,outdir,running_mode,concise_analysis,subset_chromosomes,timing,resume)
+    if not concise_analysis:
+        report(metadata_pairs,methods,outdir,subset_chromosomes,processes,weight_by_nonzero_nodes)
+    memory_failed=summary(metadata_samples,metadata_pairs,bins,re_fragments,methods,outdir,running_mode,concise_analysis,subset_chromosomes,weight_by_nonzero_nodes)
     clean_up(outdir,concise_analysis)
+    if strict_memory_validation and memory_failed:
+        sys.exit(1)
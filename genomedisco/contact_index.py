@@ -0,0 +1,277 @@
+from __future__ import print_function
+import argparse
+import heapq
+import itertools
+import os
+import shutil
+import sys
+from multiprocessing.pool import ThreadPool
+from time import strftime
+import numpy as np
+
+from genomedisco import gzio
+from genomedisco.processing import add_chr, read_bins
+
+#contact maps "chr1 n1 chr2 n2 value" sorted by chromosome pair, then by bin, and written as BGZF blocks that start on a line.
+#the index (<file>.idx) has one row per block: the chromosome pair, the start of the first bin of the block, and the byte range of the block,
+#so that the contacts of a chromosome pair, or of a region of it, are read by seeking to their blocks instead of reading the whole file.
+#the sorted file is still a gzipped contact map, and can be given as a sample to preprocess, which then reads only the chromosomes it needs
+
+def main():
+    parser = argparse.ArgumentParser(description='Sort a genome-wide contact map into an indexed, block-compressed file, and read the contacts of chromosomes from it.')
+    subparsers = parser.add_subparsers(dest='command')
+    index_parser=subparsers.add_parser('index',help='Write the sorted contact map and its index (<out>.idx). Nothing is done if the index is newer than --contacts.')
+    index_parser.add_argument('--contacts',required=True,help='Contact map in the format "chr1 n1 chr2 n2 value", as in the metadata_samples files.')
+    index_parser.add_argument('--bins',required=True,help='Bins in the format "chr start end name".')
+    index_parser.add_argument('--out',required=True)
+    index_parser.add_argument('--compression_level',type=int,default=6,help='gzip compression level of --out. DEFAULT: 6')
+    index_parser.add_argument('--chunk_lines',type=int,default=1000000,help='Number of contacts held in memory at a time while sorting. DEFAULT: 1000000')
+    split_parser=subparsers.add_parser('split',help='Write the contacts within each chromosome as a gzipped "node1 node2 value" file, as written by preprocess.')
+    split_parser.add_argument('--contacts',required=True,help='Contact map written by index.')
+    split_parser.add_argument('--chromosomes',required=True,help='Comma-delimited list of chromosomes.')
+    split_parser.add_argument('--outpref',required=True,help='The contacts of each chromosome are written to <outpref>.<chromosome>.gz')
+    split_parser.add_argument('--compression_level',type=int,default=6,help='gzip compression level of the outputs. DEFAULT: 6')
+    args = parser.parse_args()
+
+    if args.command=='index':
+        if is_fresh(args.out,args.contacts):
+            print("GenomeDISCO | "+strftime("%c")+" | "+args.out+" is up to date")
+            return
+        write_index(args.contacts,read_bins(args.bins),args.out,args.compression_level,args.chunk_lines)
+    if args.command=='split':
+        index=read_index(args.contacts)
+        for chromo in args.chromosomes.split(','):
+            write_chromosome(args.contacts,index,add_chr(chromo),args.outpref+'.'+add_chr(chromo)+'.gz',args.compression_level)
+        print("GenomeDISCO | "+strftime("%c")+" | Wrote "+str(len(args.chromosomes.split(',')))+" chromosomes to "+args.outpref+".<chromosome>.gz")
+
+def index_path(f):
+    return f+'.idx'
+
+def is_indexed(f):
+    return os.path.isfile(index_path(f))
+
+def is_fresh(f,source):
+    #the index is written last, so an index newer than the source means a complete file
+    return os.path.isfile(f) and is_indexed(f) and os.path.getmtime(index_path(f))>=os.path.getmtime(source)
+
+def write_index(f,bins,out,level=6,chunk_lines=1000000,fan_in=64):
+    print("GenomeDISCO | "+strftime("%c")+" | processing: Sorting "+f+" into "+out)
+    chromosomes=sorted(bins.keys())
+    rank=dict([(chromosomes[c],c) for c in range(len(chromosomes))])
+
+    #first pass: the contacts go to one temporary file per first chromosome, as "rank2 idx1 idx2 value", with (chromosome1, idx1)<=(chromosome2, idx2).
+    #they are buffered, and appended to the files chunk_lines at a time, so that a single file is open at a time
+    tmpdir=out+'.'+str(os.getpid())+'.tmpdir'
+    if not os.path.isdir(tmpdir):
+        os.makedirs(tmpdir)
+    buffers={}
+    buffered=0
+    skipped=0
+    for line in gzio.open_text(f):
+        items=line.strip().split()
+        chromo1=add_chr(items[0])
+        chromo2=add_chr(items[2])
+        if chromo1 not in rank or chromo2 not in rank or items[1] not in bins[chromo1]['idx'] or items[3] not in bins[chromo2]['idx']:
+            skipped+=1
+            continue
+        end1=(rank[chromo1],bins[chromo1]['idx'][items[1]])
+        end2=(rank[chromo2],bins[chromo2]['idx'][items[3]])
+        if end2<end1:
+            end1,end2=end2,end1
+        if end1[0] not in buffers:
+            buffers[end1[0]]=[]
+        buffers[end1[0]].append(str(end2[0])+'\t'+str(end1[1])+'\t'+str(end2[1])+'\t'+items[4]+'\n')
+        buffered+=1
+        if buffered>=chunk_lines:
+            flush_buckets(buffers,tmpdir)
+            buffered=0
+    flush_buckets(buffers,tmpdir)
+    if skipped>0:
+        print("GenomeDISCO | "+strftime("%c")+" | "+str(skipped)+" contacts of "+f+" are not on bins of the bins file, and are not indexed")
+
+    #second pass: the contacts of each first chromosome are sorted by chromosome2, then by bin, and written as blocks of lines that start on a line and hold a single chromosome pair
+    pool=ThreadPool(gzio.settings['threads']) if gzio.settings['threads']>1 else None
+    tmp=out+'.'+str(os.getpid())+'.tmp'
+    data_out=open(tmp,'wb')
+    index_out=open(index_path(out)+'.'+str(os.getpid())+'.tmp','w')
+    index_out.write('#chrom1\tchrom2\tstart1\toffset\tsize\n')
+    offset=0
+    pairs=0
+    last_pair=None
+    blocks=[]
+    for bucket in sorted(buffers.keys()):
+        chromo1=chromosomes[bucket]
+        current=[]
+        size=0
+        for rank2,idx1,idx2,value in sorted_records(bucket_path(tmpdir,bucket),chunk_lines,fan_in):
+            line=chromo1+'\t'+bins[chromo1]['names'][idx1]+'\t'+chromosomes[rank2]+'\t'+bins[chromosomes[rank2]]['names'][idx2]+'\t'+value+'\n'
+            if len(current)>0 and (rank2!=current_rank2 or size+len(line)>gzio.BLOCK_SIZE):
+                blocks.append((chromo1,chromosomes[current_rank2],start1,''.join(current)))
+                current=[]
+                size=0
+            if len(current)==0:
+                if (bucket,rank2)!=last_pair:
+                    pairs+=1
+                    last_pair=(bucket,rank2)
+                current_rank2=rank2
+                start1=bins[chromo1]['starts'][idx1]
+            current.append(line)
+            size+=len(line)
+            if len(blocks)>=gzio.BLOCKS_PER_THREAD*gzio.settings['threads']:
+                offset=write_blocks(blocks,level,pool,data_out,index_out,offset)
+                blocks=[]
+        if len(current)>0:
+            blocks.append((chromo1,chromosomes[current_rank2],start1,''.join(current)))
+    offset=write_blocks(blocks,level,pool,data_out,index_out,offset)
+    data_out.write(gzio.EOF_BLOCK)
+    data_out.close()
+    index_out.close()
+    if pool is not None:
+        pool.close()
+        pool.join()
+    shutil.rmtree(tmpdir)
+    os.rename(tmp,out)
+    os.rename(index_path(out)+'.'+str(os.getpid())+'.tmp',index_path(out))
+    print("GenomeDISCO | "+strftime("%c")+" | Indexed "+str(pairs)+" chromosome pairs in "+out)
+
+def bucket_path(tmpdir,bucket):
+    return tmpdir+'/'+str(bucket)+'.txt'
+
+def flush_buckets(buffers,tmpdir):
+    #appends the buffered lines of each bucket to its file, and empties the buffers
+    for bucket in buffers:
+        if len(buffers[bucket])==0:
+            continue
+        bucket_out=open(bucket_path(tmpdir,bucket),'a')
+        bucket_out.write(''.join(buffers[bucket]))
+        bucket_out.close()
+        buffers[bucket]=[]
+
+def sorted_records(f,chunk_lines,fan_in=64):
+    #(rank2, idx1, idx2, value) of the lines of a bucket file, sorted, with ties in the order of the file. The file is sorted chunk_lines lines at a time
+    #into runs (<f>.<run>), which are then merged fan_in runs at a time, so that only a chunk of the file is held in memory, and at most fan_in runs are open
+    runs=[]
+    handle=open(f,'r')
+    while True:
+        chunk=list(itertools.islice(handle,chunk_lines))
+        if len(chunk)==0:
+            break
+        items=[line.rstrip('\n').split('\t') for line in chunk]
+        rank2=np.array([x[0] for x in items],dtype=np.int64)
+        idx1=np.array([x[1] for x in items],dtype=np.int64)
+        idx2=np.array([x[2] for x in items],dtype=np.int64)
+        order=np.lexsort((idx2,idx1,rank2))
+        records=zip(rank2[order].tolist(),idx1[order].tolist(),idx2[order].tolist(),[items[i][3] for i in order])
+        if len(runs)==0 and len(chunk)<chunk_lines:
+            #the whole file fits in a chunk
+            handle.close()
+            return records
+        run=f+'.'+str(len(runs))
+        write_run(records,run,chunk_lines)
+        runs.append(run)
+    handle.close()
+    #each pass merges consecutive groups of fan_in runs into one, so that the runs stay in the order of the file
+    merge_pass=0
+    while len(runs)>fan_in:
+        merged=[]
+        for group_start in range(0,len(runs),fan_in):
+            run=f+'.merged'+str(merge_pass)+'.'+str(len(merged))
+            write_run(merge_runs(runs[group_start:group_start+fan_in]),run,chunk_lines)
+            for group_run in runs[group_start:group_start+fan_in]:
+                os.remove(group_run)
+            merged.append(run)
+        runs=merged
+        merge_pass+=1
+    return merge_runs(runs)
+
+def merge_runs(runs):
+    return (record[:3]+record[4:] for record in heapq.merge(*[read_run(runs[run_idx],run_idx) for run_idx in range(len(runs))]))
+
+def write_run(records,run,chunk_lines):
+    #writes the records, chunk_lines lines at a time
+    records=iter(records)
+    run_out=open(run,'w')
+    while True:
+        chunk=list(itertools.islice(records,chunk_lines))
+        if len(chunk)==0:
+            break
+        run_out.write(''.join([str(r)+'\t'+str(i)+'\t'+str(j)+'\t'+v+'\n' for r,i,j,v in chunk]))
+    run_out.close()
+
+def read_run(f,run_idx):
+    #the index of the run breaks ties between runs, so that contacts with the same bins stay in the order of the file
+    for line in open(f,'r'):
+        items=line.rstrip('\n').split('\t')
+        yield int(items[0]),int(items[1]),int(items[2]),run_idx,items[3]
+
+def write_blocks(blocks,level,pool,data_out,index_out,offset):
+    #compresses the blocks (chromosome1, chromosome2, start1, lines), writes them and their index rows, and returns the offset after them
+    if pool is not None:
+        compressed=pool.map(gzio.compress_block,[(block[3],level) for block in blocks])
+    else:
+        compressed=[gzio.compress_block((block[3],level)) for block in blocks]
+    for block_idx in range(len(blocks)):
+        chromo1,chromo2,start1,lines=blocks[block_idx]
+        index_out.write(chromo1+'\t'+chromo2+'\t'+str(start1)+'\t'+str(offset)+'\t'+str(len(compressed[block_idx]))+'\n')
+        data_out.write(compressed[block_idx])
+        offset+=len(compressed[block_idx])
+    return offset
+
+def read_index(f):
+    #{(chromosome1, chromosome2): (start1 of each block, offset of each block, size of each block)}
+    if not is_indexed(f):
+        print("GenomeDISCO | "+strftime("%c")+" | Error: "+f+" has no index. Write it with: python genomedisco/contact_index.py index")
+        sys.exit()
+    rows={}
+    for line in open(index_path(f),'r'):
+        if line.startswith('#'):
+            continue
+        chromo1,chromo2,start1,offset,size=line.strip().split('\t')
+        if (chromo1,chromo2) not in rows:
+            rows[(chromo1,chromo2)]=([],[],[])
+        for values,value in zip(rows[(chromo1,chromo2)],(start1,offset,size)):
+            values.append(int(value))
+    return dict([(pair,tuple([np.array(values,dtype=np.int64) for values in rows[pair]])) for pair in rows])
+
+def read_lines(f,index,chromo1,chromo2,start=None,end=None):
+    #lines of the contacts between chromo1 and chromo2, in the blocks that can hold contacts whose first bin starts in [start, end).
+    #the blocks are whole, so the lines at the edges of the region still need to be filtered by the caller
+    lines=[]
+    for block_lines in read_blocks(f,index,chromo1,chromo2,start,end):
+        lines.extend(block_lines)
+    return lines
+
+def read_blocks(f,index,chromo1,chromo2,start=None,end=None,blocks_per_read=gzio.BLOCKS_PER_THREAD):
+    #the lines of the blocks of read_lines, blocks_per_read blocks at a time, so that a single batch of blocks is held in memory
+    chromo1,chromo2=add_chr(chromo1),add_chr(chromo2)
+    if (chromo1,chromo2) not in index:
+        chromo1,chromo2=chromo2,chromo1
+    if (chromo1,chromo2) not in index:
+        return
+    starts,offsets,sizes=index[(chromo1,chromo2)]
+    first,last=0,len(starts)
+    if start is not None:
+        #the last block starting before start can still hold bins starting at start
+        first=max(0,int(np.searchsorted(starts,start,'right'))-1)
+    if end is not None:
+        last=int(np.searchsorted(starts,end,'left'))
+    handle=open(f,'rb')
+    for batch_start in range(first,last,blocks_per_read):
+        batch_end=min(last,batch_start+blocks_per_read)
+        handle.seek(offsets[batch_start])
+        data=handle.read(int(offsets[batch_end-1]+sizes[batch_end-1]-offsets[batch_start]))
+        positions=offsets[batch_start:batch_end]-offsets[batch_start]
+        yield ''.join([gzio.decompress_block(data[position:position+size]) for position,size in zip(positions,sizes[batch_start:batch_end])]).splitlines()
+    handle.close()
+
+def write_chromosome(f,index,chromo,outname,level=6):
+    #"node1 node2 value" file with the contacts within chromo, written to a temporary file and renamed once complete
+    tmp=outname+'.'+str(os.getpid())+'.tmp'
+    out=gzio.open_text(tmp,'w',level)
+    for lines in read_blocks(f,index,chromo,chromo):
+        out.write(''.join([items[1]+'\t'+items[3]+'\t'+items[4]+'\n' for items in [line.split('\t') for line in lines]]))
+    out.close()
+    os.rename(tmp,outname)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,138 @@
+from __future__ import print_function
+import argparse
+import sys
+from time import strftime
+import numpy as np
+
+from genomedisco import gzio
+from genomedisco.processing import add_chr, read_bins
+
+#contact maps in the cooler HDF5 layout (https://github.com/open2c/cooler), read one chromosome at a time without converting the whole file to text.
+#a file is given as "file.cool", or "file.mcool::/resolutions/50000" for one resolution of a multi-resolution file.
+#the pixels of a chromosome are found with the indexes of the file (chrom_offset, then bin1_offset), and only those rows of the pixel table are read
+
+def main():
+    parser = argparse.ArgumentParser(description='Write the contacts of a chromosome from a cooler file as a gzipped "node1 node2 value" file, as written by preprocess.')
+    parser.add_argument('--cool',required=True,help='Cooler file, as "file.cool" or "file.mcool::/resolutions/<resolution>".')
+    parser.add_argument('--chromosome',required=True)
+    parser.add_argument('--bins',required=True,help='Bins in the format "chr start end name". The bins of the cooler file are matched to them by chromosome and start.')
+    parser.add_argument('--out',required=True)
+    parser.add_argument('--compression_level',type=int,default=6,help='gzip compression level of --out. DEFAULT: 6')
+    args = parser.parse_args()
+
+    starts1,starts2,counts=read_chromosome(args.cool,args.chromosome)
+    bins=read_bins(args.bins)
+    if add_chr(args.chromosome) not in bins:
+        print("GenomeDISCO | "+strftime("%c")+" | Error: "+args.bins+" has no bins on "+args.chromosome)
+        sys.exit()
+    chromo_bins=bins[add_chr(args.chromosome)]
+    names=chromo_bins['names']
+    idx1=match_starts(starts1,chromo_bins['starts'],args.cool,args.chromosome)
+    idx2=match_starts(starts2,chromo_bins['starts'],args.cool,args.chromosome)
+    out=gzio.open_text(args.out,'w',args.compression_level)
+    chunk_size=500000
+    for chunk_start in range(0,len(counts),chunk_size):
+        chunk=slice(chunk_start,chunk_start+chunk_size)
+        out.write(''.join([n1+'\t'+n2+'\t'+format_count(v)+'\n' for n1,n2,v in zip(names[idx1[chunk]],names[idx2[chunk]],counts[chunk])]))
+    out.close()
+
+def parse_uri(uri):
+    if '::' in uri:
+        path,group=uri.split('::',1)
+        return path,group
+    return uri,'/'
+
+def is_cooler(f):
+    return parse_uri(f)[0].endswith('.cool') or parse_uri(f)[0].endswith('.mcool')
+
+def open_cooler(uri):
+    #h5py is only needed for cooler files
+    try:
+        import h5py
+    except ImportError:
+        print("GenomeDISCO | "+strftime("%c")+" | Error: reading cooler files requires h5py. Install it with: pip install h5py")
+        sys.exit()
+    path,group=parse_uri(uri)
+    h5=h5py.File(path,'r')
+    if 'pixels' not in h5[group]:
+        resolutions=''
+        if 'resolutions' in h5[group]:
+            resolutions=' Available resolutions: '+','.join(sorted(h5[group]['resolutions'].keys(),key=int))
+        h5.close()
+        print("GenomeDISCO | "+strftime("%c")+" | Error: "+uri+" has no pixel table. For a multi-resolution file, give the resolution as "+path+"::/resolutions/<resolution>."+resolutions)
+        sys.exit()
+    return h5,h5[group]
+
+def chromosome_names(grp):
+    return [name.decode('utf-8') if isinstance(name,bytes) else str(name) for name in grp['chroms']['name'][:]]
+
+def read_chromosome(uri,chromo):
+    #(start of bin1, start of bin2, count) of the contacts within a chromosome, with bin1<=bin2
+    print("GenomeDISCO | "+strftime("%c")+" | processing: Loading interaction data for "+chromo+" from "+uri)
+    h5,grp=open_cooler(uri)
+    names=[add_chr(name) for name in chromosome_names(grp)]
+    if add_chr(chromo) not in names:
+        h5.close()
+        print("GenomeDISCO | "+strftime("%c")+" | Error: "+uri+" has no chromosome "+chromo+". Its chromosomes are "+','.join(names))
+        sys.exit()
+    chromo_idx=names.index(add_chr(chromo))
+    lo,hi=[int(x) for x in grp['indexes']['chrom_offset'][chromo_idx:chromo_idx+2]]
+    first_pixel,last_pixel=[int(x) for x in grp['indexes']['bin1_offset'][[lo,hi]]]
+    bin1=grp['pixels']['bin1_id'][first_pixel:last_pixel]
+    bin2=grp['pixels']['bin2_id'][first_pixel:last_pixel]
+    counts=grp['pixels']['count'][first_pixel:last_pixel].astype(float)
+    starts=grp['bins']['start'][lo:hi]
+    h5.close()
+    #the rows of the chromosome also hold its contacts with the chromosomes after it
+    cis=bin2<hi
+    return starts[bin1[cis]-lo],starts[bin2[cis]-lo],counts[cis]
+
+def match_starts(starts,bin_starts,uri,chromo):
+    #index of the bin starting at each of starts
+    idx=np.searchsorted(bin_starts,starts)
+    found=(idx<len(bin_starts))&(bin_starts[np.minimum(idx,len(bin_starts)-1)]==starts)
+    if not np.all(found):
+        print("GenomeDISCO | "+strftime("%c")+" | Error: "+str(np.count_nonzero(~found))+" bins of "+uri+" on "+chromo+" do not start where a bin of the bins file starts (e.g. "+str(starts[~found][0])+"). The cooler file and the bins file must have the same resolution.")
+        sys.exit()
+    return idx
+
+def format_count(v):
+    if v==int(v):
+        return str(int(v))
+    return str(v)
+
+def write_cooler(path,chromosomes,lengths,resolution,bin1,bin2,counts,group='/'):
+    #minimal cooler file, with pixels given as bin indices in the genome (bin1<=bin2), for tests and examples.
+    #with a group (e.g. "/resolutions/50000"), the cooler is added to that group of the file, to build a multi-resolution file
+    import h5py
+    starts=[]
+    ends=[]
+    chrom_ids=[]
+    chrom_offset=[0]
+    for chromo_idx in range(len(chromosomes)):
+        chromo_starts=np.arange(0,lengths[chromo_idx],resolution)
+        starts.append(chromo_starts)
+        ends.append(np.minimum(chromo_starts+resolution,lengths[chromo_idx]))
+        chrom_ids.append(np.repeat(chromo_idx,len(chromo_starts)))
+        chrom_offset.append(chrom_offset[-1]+len(chromo_starts))
+    order=np.lexsort((bin2,bin1))
+    bin1,bin2,counts=np.asarray(bin1)[order],np.asarray(bin2)[order],np.asarray(counts)[order]
+    h5=h5py.File(path,'w' if group=='/' else 'a')
+    grp=h5.require_group(group)
+    grp.attrs['format']='HDF5::Cooler'
+    grp.attrs['bin-type']='fixed'
+    grp.attrs['bin-size']=resolution
+    grp.create_dataset('chroms/name',data=np.array(chromosomes,dtype='S'))
+    grp.create_dataset('chroms/length',data=np.array(lengths,dtype=np.int32))
+    grp.create_dataset('bins/chrom',data=np.concatenate(chrom_ids).astype(np.int32))
+    grp.create_dataset('bins/start',data=np.concatenate(starts).astype(np.int32))
+    grp.create_dataset('bins/end',data=np.concatenate(ends).astype(np.int32))
+    grp.create_dataset('pixels/bin1_id',data=bin1.astype(np.int64))
+    grp.create_dataset('pixels/bin2_id',data=bin2.astype(np.int64))
+    grp.create_dataset('pixels/count',data=counts.astype(np.int32))
+    grp.create_dataset('indexes/chrom_offset',data=np.array(chrom_offset,dtype=np.int64))
+    grp.create_dataset('indexes/bin1_offset',data=np.searchsorted(bin1,np.arange(chrom_offset[-1]+1)).astype(np.int64))
+    h5.close()
+
+if __name__=="__main__":
+    main()
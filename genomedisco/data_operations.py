@@ -1,3 +1,4 @@
+from __future__ import print_function
 import sys
 import copy
 import random
@@ -13,6 +14,7 @@ import scipy.sparse as sps
 import warnings
 from scipy.sparse import SparseEfficiencyWarning
 warnings.simplefilter('ignore', SparseEfficiencyWarning)
+from genomedisco import normalization
 
 np.random.seed(7)
 #todo: add bait vs not bait information
@@ -68,49 +70,19 @@ def get_distance_dep(m):
         pcounts[di]=1.0*dcounts[di]/((m.shape[0]-di)*total_reads)
     return pcounts
 
+#the normalizations live in genomedisco.normalization, and these return their upper triangular part
 def sqrtvc(m):
-    mup=m
-    mdown=mup.transpose()
-    mdown.setdiag(0)
-    mtogether=mup+mdown
-    sums_sq=np.sqrt(mtogether.sum(axis=1)) 
-    #make the ones that are 0, so that we don't divide by 0
-    sums_sq[sums_sq==0.0]=1.0
-    D_sq = sps.spdiags(1.0/sums_sq.flatten(), [0], mtogether.get_shape()[0], mtogether.get_shape()[1], format='csr')
-    return sps.triu(D_sq.dot(mtogether.dot(D_sq)))
+    return sps.triu(normalization.sqrtvc(normalization.symmetrize(m)))
 
 def hichip_add_diagonal(m):
-    mup=m
-    mdown=mup.transpose()
-    mdown.setdiag(0)
-    mtogether=mup+mdown
-    sums=mtogether.sum(axis=1)
-    max_sum=np.max(sums)
-    to_add=1.0*max_sum-1.0*sums
-    to_add_values=[]
-    for i in range(m.shape[0]):
-        to_add_values.append(to_add[i,0])
-    mtogether.setdiag(np.array(to_add_values))
-    D = sps.spdiags(1.0/sums.flatten(), [0], mtogether.get_shape()[0], mtogether.get_shape()[1], format='csr')
-    return sps.triu(D.dot(mtogether))
+    return sps.triu(normalization.fill_diagonal(normalization.symmetrize(m)))
 
 def coverage_norm(m):
-    mup=m
-    mdown=mup.transpose()
-    mdown.setdiag(0)
-    mtogether=mup+mdown
-    sums=mtogether.sum(axis=1)
-    D = sps.spdiags(1.0/sums.flatten(), [0], mtogether.get_shape()[0], mtogether.get_shape()[1], format='csr')
-    return sps.triu(D.dot(mtogether.dot(D)))
+    return sps.triu(normalization.coverage_norm(normalization.symmetrize(m)))
 
 #assumes matrix is upper triangular
 def matrix_2_coverageVector(m):
-    mup=m
-    mdown=mup.transpose()
-    mdown.setdiag(0)
-    mtogether=mup+mdown
-    sums=mtogether.sum(axis=1)
-    return sums
+    return normalization.symmetrize(m).sum(axis=1)
 
 def array_2_coverageVector(m):
     assert np.allclose(m, np.triu(m))
@@ -120,19 +92,28 @@ def array_2_coverageVector(m):
 def uniform_processing(m):
     return m
 
-def process_matrix(m,matrix_processing):
-    if matrix_processing=='uniform':
-        return uniform_processing(m)
-    if matrix_processing=='coverage_norm':
-        return coverage_norm(m)
-    if matrix_processing=='sqrtvc':
-        return sqrtvc(m)
-    if matrix_processing=='fill_diagonal':
-        return hichip_add_diagonal(m)
+def process_matrix(m,matrix_processing,bias=None,tol=1e-5,maxiter=200):
+    #returns the normalized symmetric matrix, ready for the random walks
+    return normalization.normalize(m,matrix_processing,bias,tol,maxiter)
+
+def subsample_option(m_subsample):
+    #the --m_subsample option of the scripts, as taken by scoring.score: "lowest", None for "NA" (no subsampling), or a depth
+    if m_subsample=='lowest':
+        return 'lowest'
+    if m_subsample=='NA':
+        return None
+    try:
+        depth=float(m_subsample)
+    except ValueError:
+        depth=0.0
+    if not depth>0:
+        print("GenomeDISCO | "+strftime("%c")+" | Error: --m_subsample should be lowest, NA or a sequencing depth, got "+m_subsample)
+        sys.exit()
+    return depth
 
-def subsample_to_depth(m,seq_depth):
+def subsample_to_depth(m,seq_depth,random_state=np.random):
     if type(m) is csr_matrix:
-        return subsample_to_depth_csr_upperTri(m,seq_depth)
+        return subsample_to_depth_csr_upperTri(m,seq_depth,random_state)
     if type(m) is np.ndarray:
         return subsample_to_depth_array_upperTri(m,seq_depth)
 
@@ -150,18 +131,13 @@ def subsample_to_depth_array_upperTri(m,seq_depth):
             subsampled_data[i,j]=np.random.binomial(n,subsampling_prob,1)[0]
     return subsampled_data
 
-def subsample_to_depth_csr_upperTri(m,seq_depth):
+def subsample_to_depth_csr_upperTri(m,seq_depth,random_state=np.random):
     depthm=m.sum()
     assert seq_depth<=depthm
     subsampling_prob=seq_depth/depthm
 
     m.eliminate_zeros()
-    vals=m.data
-    num_elts=len(vals)
-    m_subsampled_data=[]#np.random.binomial(value,subsampling_prob)
-    elt=0
-    while elt<num_elts:
-        m_subsampled_data.append(np.random.binomial(vals[elt],subsampling_prob,1)[0])
-        elt+=1
+    #one binomial draw per entry, in the order of m.data (the same draws as drawing them one at a time)
+    m_subsampled_data=random_state.binomial(m.data.astype(np.int64),subsampling_prob)
     return csr_matrix((m_subsampled_data, m.indices, m.indptr), dtype=float,shape=m.shape)
     
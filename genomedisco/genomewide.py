@@ -0,0 +1,190 @@
+from __future__ import print_function
+import argparse
+import multiprocessing
+from time import strftime
+import numpy as np
+import scipy.sparse as sps
+
+from genomedisco import data_operations
+from genomedisco.comparison_types.disco_random_walks import to_transition, final_score, difference_per_node
+from genomedisco.processing import add_chr, read_bins
+from genomedisco import processing, gzio
+
+#genome-wide GenomeDISCO, with the contacts between chromosomes. The genome matrix has one block of rows and columns per chromosome,
+#and the random walks are run one block of rows at a time (a chromosome, or --chunk_rows rows of it), so that only these rows of the
+#walk matrices are in memory. The differences are summed by block (chromosome pair)
+
+def main():
+    parser = argparse.ArgumentParser(description='Score a pair of genome-wide contact maps, including the contacts between chromosomes. Reports the genome-wide score, a score per chromosome, and the share of the difference in each chromosome pair.')
+    parser.add_argument('--m1',required=True,help='Contact map in the format "chr1 n1 chr2 n2 value", as in the metadata_samples files. Contacts between chromosomes are kept.')
+    parser.add_argument('--m2',required=True)
+    parser.add_argument('--m1name',default='m1')
+    parser.add_argument('--m2name',default='m2')
+    parser.add_argument('--bins',required=True,help='Bins of --m1 and --m2, in the format "chr start end name".')
+    parser.add_argument('--chromosomes',default='NA',help='Comma-delimited list of chromosomes to include. DEFAULT: all chromosomes in --bins')
+    parser.add_argument('--m_subsample',type=str,default='lowest',help='"lowest" to subsample the deeper genome-wide map to the depth of the other, a sequencing depth to subsample both maps to, or "NA".')
+    parser.add_argument('--norm',type=str,default='sqrtvc')
+    parser.add_argument('--tmin',type=int,default=3)
+    parser.add_argument('--tmax',type=int,default=3)
+    parser.add_argument('--transition',action='store_true')
+    parser.add_argument('--remove_diagonal',action='store_true')
+    parser.add_argument('--chunk_rows',type=int,default=0,help='Maximum number of rows of the walk matrices in memory per process. DEFAULT: one chromosome at a time')
+    parser.add_argument('--processes',type=int,default=1,help='Number of processes running the walks of different blocks of rows. DEFAULT: 1')
+    parser.add_argument('--seed',type=int,default=7,help='Seed for the subsampling.')
+    parser.add_argument('--outpref',required=True,help='Prefix of the outputs: <outpref>.scores.txt (genome-wide score and score per chromosome) and <outpref>.blocks.txt (share of the difference in each chromosome pair).')
+    args = parser.parse_args()
+    subsample=data_operations.subsample_option(args.m_subsample)
+
+    bins=read_bins(args.bins)
+    chromosomes=sorted(bins.keys())
+    if args.chromosomes!='NA':
+        chromosomes=[add_chr(c) for c in args.chromosomes.split(',')]
+    offsets=chromosome_offsets(bins,chromosomes)
+
+    m1=read_genome_contacts(args.m1,bins,chromosomes,offsets,args.remove_diagonal)
+    m2=read_genome_contacts(args.m2,bins,chromosomes,offsets,args.remove_diagonal)
+    print("GenomeDISCO | "+strftime("%c")+" | Genome matrix of "+str(m1.shape[0])+" bins, "+str(m1.nnz)+" and "+str(m2.nnz)+" contacts, "+'{:.1%}'.format(trans_fraction(m1,offsets))+" and "+'{:.1%}'.format(trans_fraction(m2,offsets))+" between chromosomes")
+
+    if subsample is not None:
+        random_state=np.random.RandomState(args.seed)
+        desired_depth=subsample
+        if subsample=='lowest':
+            desired_depth=min(m1.sum(),m2.sum())
+        print("GenomeDISCO | "+strftime("%c")+" | Subsampling depth = "+str(desired_depth))
+        if m1.sum()>desired_depth:
+            m1=data_operations.subsample_to_depth(m1,desired_depth,random_state)
+        if m2.sum()>desired_depth:
+            m2=data_operations.subsample_to_depth(m2,desired_depth,random_state)
+
+    print("GenomeDISCO | "+strftime("%c")+' | Normalizing with '+args.norm)
+    m1=data_operations.process_matrix(m1,args.norm)
+    m2=data_operations.process_matrix(m2,args.norm)
+    if args.transition:
+        m1=to_transition(m1)
+        m2=to_transition(m2)
+
+    block_diffs=block_walk_differences(m1,m2,offsets,args.tmin,args.tmax,args.chunk_rows,args.processes)
+    write_scores(args,chromosomes,offsets,m1,m2,block_diffs)
+
+def chromosome_offsets(bins,chromosomes):
+    #index of the first bin of each chromosome in the genome matrix, and the total number of bins at the end
+    offsets=[0]
+    for chromo in chromosomes:
+        offsets.append(offsets[-1]+len(bins[chromo]['starts']))
+    return offsets
+
+def read_genome_contacts(f,bins,chromosomes,offsets,remove_diag=True):
+    #upper triangular csr genome matrix, with the bins of each chromosome in a consecutive block, starting at its offset
+    print("GenomeDISCO | "+strftime("%c")+" | processing: Loading interaction data from "+f)
+    first_bin=dict([(chromosomes[c],offsets[c]) for c in range(len(chromosomes))])
+    i=[]
+    j=[]
+    v=[]
+    for line in gzio.open_text(f):
+        items=line.strip().split()
+        chromo1=add_chr(items[0])
+        chromo2=add_chr(items[2])
+        if chromo1 not in first_bin or chromo2 not in first_bin:
+            continue
+        n1=first_bin[chromo1]+bins[chromo1]['idx'][items[1]]
+        n2=first_bin[chromo2]+bins[chromo2]['idx'][items[3]]
+        if remove_diag and n1==n2:
+            continue
+        i.append(min(n1,n2))
+        j.append(max(n1,n2))
+        v.append(float(items[4]))
+    n=offsets[-1]
+    return sps.csr_matrix((v,(i,j)),shape=(n,n),dtype=float)
+
+def block_of(idx,offsets):
+    #chromosome block of each bin index
+    return np.searchsorted(offsets,idx,'right')-1
+
+def trans_fraction(m,offsets):
+    #fraction of the contacts between different chromosomes
+    m=m.tocoo()
+    trans=block_of(m.row,offsets)!=block_of(m.col,offsets)
+    return m.data[trans].sum()/max(m.data.sum(),1e-12)
+
+def row_blocks(offsets,chunk_rows=0):
+    #(chromosome index, first row, last row+1) of the blocks of rows the walks are run on
+    blocks=[]
+    for chromo_idx in range(len(offsets)-1):
+        size=offsets[chromo_idx+1]-offsets[chromo_idx]
+        step=chunk_rows if chunk_rows>0 else max(size,1)
+        for start in range(offsets[chromo_idx],offsets[chromo_idx+1],step):
+            blocks.append((chromo_idx,start,min(offsets[chromo_idx+1],start+step)))
+    return blocks
+
+#matrices used by walk_block, set before the pool is created so that the worker processes inherit them instead of receiving copies
+shared={}
+
+def walk_block(block):
+    #differences between the walks started from the rows of the block, summed by chromosome block of columns, for each t from tmin to tmax
+    chromo_idx,start,stop=block
+    m1,m2,offsets,tmin,tmax=shared['m1'],shared['m2'],shared['offsets'],shared['tmin'],shared['tmax']
+    diffs=np.zeros((tmax-tmin+1,len(offsets)-1))
+    rw1=m1[start:stop,:]
+    rw2=m2[start:stop,:]
+    for t in range(1,tmax+1):
+        if t>1:
+            rw1=rw1.dot(m1)
+            rw2=rw2.dot(m2)
+        if t>=tmin:
+            col_diffs=np.asarray(abs(rw1-rw2).sum(axis=0)).flatten()
+            diffs[t-tmin]=np.add.reduceat(col_diffs,offsets[:-1])
+    return chromo_idx,diffs
+
+def block_walk_differences(m1,m2,offsets,tmin,tmax,chunk_rows=0,processes=1):
+    #summed absolute differences of the walks for each t and chromosome pair, as an array of shape (t, chromosome of the rows, chromosome of the columns)
+    shared.update({'m1':m1,'m2':m2,'offsets':offsets,'tmin':tmin,'tmax':tmax})
+    blocks=row_blocks(offsets,chunk_rows)
+    print("GenomeDISCO | "+strftime("%c")+" | Random walks on "+str(len(blocks))+" blocks of rows")
+    if processes>1:
+        pool=multiprocessing.Pool(processes)
+        results=pool.map(walk_block,blocks)
+        pool.close()
+        pool.join()
+    else:
+        results=[walk_block(block) for block in blocks]
+    block_diffs=np.zeros((tmax-tmin+1,len(offsets)-1,len(offsets)-1))
+    for chromo_idx,diffs in results:
+        block_diffs[:,chromo_idx,:]+=diffs
+    return block_diffs
+
+def write_scores(args,chromosomes,offsets,m1,m2,block_diffs):
+    nonzero1=processing.nonzero_nodes(m1)
+    nonzero2=processing.nonzero_nodes(m2)
+    nonzero_total=0.5*(np.count_nonzero(nonzero1)+np.count_nonzero(nonzero2))
+    genomewide=final_score([difference_per_node(d,nonzero_total) for d in block_diffs.sum(axis=(1,2))],args.tmin,args.tmax)
+    print("GenomeDISCO | "+strftime("%c")+" | Genome-wide score = "+'{:.3f}'.format(genomewide))
+
+    out=open(args.outpref+'.scores.txt','w')
+    out.write('#m1\tm2\tchromosome\tnonzero_nodes\tscore\n')
+    out.write(args.m1name+'\t'+args.m2name+'\tgenomewide\t'+str(nonzero_total)+'\t'+'{:.3f}'.format(genomewide)+'\n')
+    for chromo_idx in range(len(chromosomes)):
+        rows=slice(offsets[chromo_idx],offsets[chromo_idx+1])
+        nonzero_chromo=0.5*(np.count_nonzero(nonzero1[rows])+np.count_nonzero(nonzero2[rows]))
+        #the walks from the nodes of this chromosome, wherever they go
+        chromo_score=final_score([difference_per_node(d,nonzero_chromo) for d in block_diffs[:,chromo_idx,:].sum(axis=1)],args.tmin,args.tmax)
+        out.write(args.m1name+'\t'+args.m2name+'\t'+chromosomes[chromo_idx]+'\t'+str(nonzero_chromo)+'\t'+'{:.3f}'.format(chromo_score)+'\n')
+    out.close()
+
+    #share of 1-genomewide score in each chromosome pair (the shares add up to 1-genomewide score)
+    out=open(args.outpref+'.blocks.txt','w')
+    out.write('#chromosome1\tchromosome2\tdifference\n')
+    cis=0.0
+    for c1 in range(len(chromosomes)):
+        for c2 in range(c1,len(chromosomes)):
+            pair_diffs=block_diffs[:,c1,c2]
+            if c2!=c1:
+                pair_diffs=pair_diffs+block_diffs[:,c2,c1]
+            share=1.0-final_score([difference_per_node(d,nonzero_total) for d in pair_diffs],args.tmin,args.tmax)
+            if c1==c2:
+                cis+=share
+            out.write(chromosomes[c1]+'\t'+chromosomes[c2]+'\t'+'{:.5f}'.format(share)+'\n')
+    out.close()
+    print("GenomeDISCO | "+strftime("%c")+" | "+'{:.1%}'.format(cis/max(1.0-genomewide,1e-12))+" of the difference is within chromosomes. Scores in "+args.outpref+".scores.txt, differences by chromosome pair in "+args.outpref+".blocks.txt")
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,220 @@
+from __future__ import print_function
+import gzip
+import multiprocessing
+import os
+import struct
+import threading
+import zlib
+from distutils.spawn import find_executable
+from multiprocessing.pool import ThreadPool
+try:
+    from Queue import Queue, Full
+except ImportError:
+    from queue import Queue, Full
+
+#gzip files read and written with several threads. Files are written in the BGZF layout (as by bgzip): a series of gzip members
+#of at most 64KB each, with the compressed size of the member in its header. They are still ordinary gzip files for gzip/gunzip,
+#but their blocks can be compressed and decompressed independently. zlib releases the GIL, so the blocks are handled by threads.
+#Reading is done in a background thread, so that decompression overlaps with the parsing of the lines by the caller
+
+#threads per file, GENOMEDISCO_IO_THREADS or up to 4
+settings={'threads':int(os.environ.get('GENOMEDISCO_IO_THREADS',min(4,multiprocessing.cpu_count()))),'level':6}
+
+#uncompressed size of a block, so that a block that does not compress still fits in 64KB
+BLOCK_SIZE=0xff00
+#blocks handed to the threads at a time, per thread
+BLOCKS_PER_THREAD=16
+#empty block marking the end of a BGZF file
+EOF_BLOCK=b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00\x42\x43\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00'
+
+def open_text(f,mode='r',level=None,threads=None):
+    #lines of f (gzipped or not) for mode 'r', and a BGZF writer for mode 'w'
+    if mode=='w':
+        return BgzfWriter(f,level,threads)
+    return LineReader(f,threads)
+
+def compress_block(job):
+    data,level=job
+    compressor=zlib.compressobj(level,zlib.DEFLATED,-15)
+    compressed=compressor.compress(data)+compressor.flush()
+    #gzip header with the BC extra field holding the size of the member minus 1, then the deflated data, crc32 and size
+    header=struct.pack('<BBBBIBBHBBHH',31,139,8,4,0,0,255,6,66,67,2,len(compressed)+25)
+    return header+compressed+struct.pack('<II',zlib.crc32(data)&0xffffffff,len(data))
+
+def decompress_block(block):
+    #block is a whole BGZF member
+    return zlib.decompress(block[18:-8],-15)
+
+class BgzfWriter:
+
+    def __init__(self,f,level=None,threads=None):
+        self.level=settings['level'] if level is None else level
+        self.threads=settings['threads'] if threads is None else threads
+        self.out=open(f,'wb')
+        self.pool=ThreadPool(self.threads) if self.threads>1 else None
+        self.buffer=[]
+        self.buffered=0
+        self.blocks=[]
+
+    def write(self,data):
+        self.buffer.append(data)
+        self.buffered+=len(data)
+        if self.buffered>=BLOCK_SIZE:
+            data=b''.join(self.buffer)
+            cut=len(data)-len(data)%BLOCK_SIZE
+            self.blocks.extend([data[start:start+BLOCK_SIZE] for start in range(0,cut,BLOCK_SIZE)])
+            self.buffer=[data[cut:]]
+            self.buffered=len(data)-cut
+            if len(self.blocks)>=BLOCKS_PER_THREAD*self.threads:
+                self.flush_blocks()
+
+    def flush_blocks(self):
+        jobs=[(block,self.level) for block in self.blocks]
+        if self.pool is not None:
+            compressed=self.pool.map(compress_block,jobs)
+        else:
+            compressed=[compress_block(job) for job in jobs]
+        self.out.write(b''.join(compressed))
+        self.blocks=[]
+
+    def close(self):
+        if self.buffered>0:
+            self.blocks.append(b''.join(self.buffer))
+        self.buffer=[]
+        self.buffered=0
+        self.flush_blocks()
+        self.out.write(EOF_BLOCK)
+        self.out.close()
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        self.close()
+
+def is_bgzf(header):
+    #gzip magic, FEXTRA flag and a BC subfield first in the extra field
+    return len(header)>=18 and header[:4]==b'\x1f\x8b\x08\x04' and header[12:14]==b'BC'
+
+def bgzf_batches(handle,threads):
+    #decompressed data of the blocks of a BGZF file, BLOCKS_PER_THREAD*threads blocks at a time
+    pool=ThreadPool(threads) if threads>1 else None
+    try:
+        while True:
+            blocks=[]
+            while len(blocks)<BLOCKS_PER_THREAD*threads:
+                header=handle.read(18)
+                if len(header)==0:
+                    break
+                if not is_bgzf(header):
+                    raise IOError('not a BGZF block at offset '+str(handle.tell()-len(header))+' of '+handle.name)
+                block_size=struct.unpack('<H',header[16:18])[0]+1
+                blocks.append(header+handle.read(block_size-18))
+            if len(blocks)==0:
+                break
+            if pool is not None:
+                yield b''.join(pool.map(decompress_block,blocks))
+            else:
+                yield b''.join([decompress_block(block) for block in blocks])
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+def chunks(f,threads,chunk_size=1<<20):
+    #decompressed data of f: BGZF blocks in parallel, other gzip files with the gzip module, and other files as they are
+    handle=open(f,'rb')
+    header=handle.read(18)
+    handle.seek(0)
+    if is_bgzf(header):
+        for batch in bgzf_batches(handle,threads):
+            yield batch
+        handle.close()
+        return
+    if header[:2]==b'\x1f\x8b':
+        handle.close()
+        handle=gzip.open(f,'rb')
+    while True:
+        data=handle.read(chunk_size)
+        if len(data)==0:
+            break
+        yield data
+    handle.close()
+
+class LineReader:
+    #iterates over the lines of a file, decompressed in a background thread. The thread stops if the lines are not all read
+
+    def __init__(self,f,threads=None):
+        self.name=f
+        self.threads=settings['threads'] if threads is None else threads
+        self.queue=Queue(maxsize=4)
+        self.stopped=threading.Event()
+        self.thread=threading.Thread(target=self.produce)
+        self.thread.daemon=True
+        self.thread.start()
+
+    def put(self,item):
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item,timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def produce(self):
+        try:
+            for data in chunks(self.name,self.threads):
+                if not self.put(data):
+                    return
+        except Exception as error:
+            #raised again by the reading thread
+            self.put(error)
+            return
+        self.put(None)
+
+    def __iter__(self):
+        rest=b''
+        try:
+            while True:
+                data=self.queue.get()
+                if data is None:
+                    break
+                if isinstance(data,Exception):
+                    raise data
+                lines=(rest+data).split(b'\n')
+                rest=lines.pop()
+                for line in lines:
+                    yield line+b'\n'
+            if len(rest)>0:
+                yield rest
+        finally:
+            self.stopped.set()
+
+    def readlines(self):
+        return list(self)
+
+    def close(self):
+        self.stopped.set()
+
+def gzip_cmd(level=None,threads=None):
+    #shell command compressing stdin to stdout, with bgzip or pigz if they are installed
+    level=settings['level'] if level is None else level
+    threads=settings['threads'] if threads is None else threads
+    if find_executable('bgzip'):
+        return 'bgzip -@ '+str(threads)+' -l '+str(level)+' -c'
+    if find_executable('pigz'):
+        return 'pigz -p '+str(threads)+' -'+str(level)+' -c'
+    return 'gzip -'+str(level)+' -c'
+
+def gunzip_cmd(threads=None):
+    #shell command decompressing the files given after it to stdout
+    threads=settings['threads'] if threads is None else threads
+    if find_executable('bgzip'):
+        return 'bgzip -@ '+str(threads)+' -dc'
+    if find_executable('pigz'):
+        return 'pigz -dc'
+    return 'gunzip -c'
@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+import resource
+import contextlib
+from genomedisco import results_table
+
+#one row per (pair, chromosome, method, stage). Walk steps are recorded as separate stages (walk_t1, diff_t1, ...)
+columns=['sample1','sample2','chromosome','method','stage','wall_time','cpu_time','peak_rss_mb']
+
+def cpu_time(who=resource.RUSAGE_SELF):
+    usage=resource.getrusage(who)
+    return usage.ru_utime+usage.ru_stime
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    #ru_maxrss is in kilobytes on Linux, and in bytes on macOS. With RUSAGE_CHILDREN, it is the peak of the largest finished subprocess
+    peak=resource.getrusage(who).ru_maxrss
+    if sys.platform=='darwin':
+        return peak/(1024.0*1024.0)
+    return peak/1024.0
+
+class StageTimer:
+
+    def __init__(self,enabled=True):
+        self.stages=[]
+        self.enabled=enabled
+
+    @contextlib.contextmanager
+    def stage(self,name):
+        if not self.enabled:
+            yield
+            return
+        #peak RSS is the high-water mark of the process at the end of the stage
+        wall_start=time.time()
+        cpu_start=cpu_time()
+        yield
+        self.stages.append([name,time.time()-wall_start,cpu_time()-cpu_start,peak_rss_mb()])
+
+    def rows(self,sample1,sample2,chromosome,method):
+        return [[sample1,sample2,chromosome,method,name,'{:.4f}'.format(wall),'{:.4f}'.format(cpu),'{:.1f}'.format(rss)] for name,wall,cpu,rss in self.stages]
+
+def read_timings(tables):
+    #[(stage, wall_time, cpu_time, peak_rss_mb)] for all rows of the timing tables of the tasks
+    rows=results_table.read_rows(tables,len(columns),5)
+    return [(items[4],float(items[5]),float(items[6]),float(items[7])) for items in rows]
+
+def write_hotspots(timings,outname):
+    #total time per stage across all pairs and chromosomes, from the most to the least expensive stage
+    stages=sorted(set([timing[0] for timing in timings]))
+    wall=dict([(stage,0.0) for stage in stages])
+    cpu=dict([(stage,0.0) for stage in stages])
+    rss=dict([(stage,0.0) for stage in stages])
+    calls=dict([(stage,0) for stage in stages])
+    for stage,stage_wall,stage_cpu,stage_rss in timings:
+        wall[stage]+=stage_wall
+        cpu[stage]+=stage_cpu
+        rss[stage]=max(rss[stage],stage_rss)
+        calls[stage]+=1
+    total_wall=max(sum(wall.values()),1e-12)
+    out=open(outname,'w')
+    out.write('#stage\tcalls\twall_time\tcpu_time\tfraction_of_wall_time\tmax_peak_rss_mb\n')
+    for stage in sorted(stages,key=lambda s: -wall[s]):
+        out.write(stage+'\t'+str(calls[stage])+'\t'+'{:.3f}'.format(wall[stage])+'\t'+'{:.3f}'.format(cpu[stage])+'\t'+'{:.3f}'.format(wall[stage]/total_wall)+'\t'+'{:.1f}'.format(rss[stage])+'\n')
+    out.close()
@@ -0,0 +1,98 @@
+from __future__ import print_function
+import argparse
+import sys
+import multiprocessing
+from time import strftime
+import numpy as np
+
+from genomedisco import data_operations
+from genomedisco.scoring import score, subsample_pair, upper_triangular
+from genomedisco.processing import add_chr, read_bins
+from genomedisco.multiresolution import read_intrachromosomal_contacts
+
+def main():
+    parser = argparse.ArgumentParser(description='Score a pair of contact maps in windows sliding along the diagonal, to find the regions where they differ. Each chromosome is loaded once, and the contacts within each window are scored with GenomeDISCO.')
+    parser.add_argument('--m1',required=True,help='Contact map in the format "chr1 n1 chr2 n2 value", as in the metadata_samples files.')
+    parser.add_argument('--m2',required=True)
+    parser.add_argument('--bins',required=True,help='Bins of --m1 and --m2, in the format "chr start end name".')
+    parser.add_argument('--window',type=int,required=True,help='Window size (in bp).')
+    parser.add_argument('--step',type=int,required=True,help='Distance between the starts of consecutive windows (in bp).')
+    parser.add_argument('--chromosomes',default='NA',help='Comma-delimited list of chromosomes to score. DEFAULT: all chromosomes in --bins')
+    parser.add_argument('--m_subsample',type=str,default='lowest',help='"lowest" to subsample the deeper map of each chromosome to the depth of the other, before cutting it into windows, a sequencing depth to subsample the maps of each chromosome to, or "NA".')
+    parser.add_argument('--norm',type=str,default='sqrtvc',help='Normalization, applied to each window.')
+    parser.add_argument('--tmin',type=int,default=3)
+    parser.add_argument('--tmax',type=int,default=3)
+    parser.add_argument('--transition',action='store_true')
+    parser.add_argument('--remove_diagonal',action='store_true')
+    parser.add_argument('--min_nonzero_nodes',type=int,default=2,help='Windows where the maps have fewer nonzero nodes (on average) are not scored. DEFAULT: 2')
+    parser.add_argument('--processes',type=int,default=1,help='Number of processes scoring the windows. DEFAULT: 1')
+    parser.add_argument('--seed',type=int,default=7,help='Seed for the subsampling.')
+    parser.add_argument('--out',required=True,help='Output bedGraph, "chr start end score". Each window is reported over its central --step bp, so that the intervals do not overlap.')
+    args = parser.parse_args()
+    if args.step<=0 or args.step>args.window:
+        print("GenomeDISCO | "+strftime("%c")+" | Error: --step must be positive and at most --window")
+        sys.exit()
+    subsample=data_operations.subsample_option(args.m_subsample)
+
+    bins=read_bins(args.bins)
+    chromosomes=sorted(bins.keys())
+    if args.chromosomes!='NA':
+        chromosomes=[add_chr(c) for c in args.chromosomes.split(',')]
+    m1s=read_intrachromosomal_contacts(args.m1,bins,chromosomes)
+    m2s=read_intrachromosomal_contacts(args.m2,bins,chromosomes)
+
+    random_state=np.random.RandomState(args.seed)
+    params={'tmin':args.tmin,'tmax':args.tmax,'norm':args.norm,'transition':args.transition,'min_nonzero_nodes':args.min_nonzero_nodes}
+    pool=None
+    if args.processes>1:
+        pool=multiprocessing.Pool(args.processes)
+    out=open(args.out,'w')
+    for chromo in chromosomes:
+        m1,m2=prepare_chromosome(m1s[chromo],m2s[chromo],subsample,args.remove_diagonal,random_state)
+        jobs=[(chromo,start,end,m1[i:j,i:j],m2[i:j,i:j],params) for start,end,i,j in windows(bins[chromo],args.window,args.step)]
+        print("GenomeDISCO | "+strftime("%c")+" | "+chromo+" | scoring "+str(len(jobs))+" windows")
+        if pool is not None:
+            tile_scores=pool.imap(score_window,jobs,chunksize=max(1,len(jobs)//(4*args.processes)))
+        else:
+            tile_scores=(score_window(job) for job in jobs)
+        for chromo_name,start,end,tile_score in tile_scores:
+            if np.isnan(tile_score):
+                continue
+            #the central step bp of the window
+            center_start=start+(end-start-args.step)//2
+            out.write(chromo_name+'\t'+str(center_start)+'\t'+str(center_start+args.step)+'\t'+'{:.3f}'.format(tile_score)+'\n')
+    out.close()
+    if pool is not None:
+        pool.close()
+        pool.join()
+    print("GenomeDISCO | "+strftime("%c")+" | Local scores written to "+args.out)
+
+def prepare_chromosome(m1,m2,subsample,remove_diag,random_state):
+    #the whole chromosome is subsampled once, so that all its windows are compared at the same depth
+    m1=upper_triangular(m1,remove_diagonal=remove_diag)
+    m2=upper_triangular(m2,remove_diagonal=remove_diag)
+    return subsample_pair(m1,m2,subsample,random_state)
+
+def windows(chromo_bins,window,step):
+    #(start, end, first bin, last bin+1) of the windows, starting every step bp from the start of the first bin, up to the end of the chromosome
+    starts=chromo_bins['starts']
+    first=int(starts.min())
+    last=int(chromo_bins['ends'].max())
+    tiles=[]
+    for start in range(first,max(first,last-window)+1,step):
+        end=start+window
+        tiles.append((start,end,int(np.searchsorted(starts,start,'left')),int(np.searchsorted(starts,end,'left'))))
+    return tiles
+
+def score_window(job):
+    #(chromosome, start, end, score), with a nan score for windows that are too sparse
+    chromo,start,end,m1,m2,params=job
+    if m1.nnz==0 or m2.nnz==0:
+        return chromo,start,end,float('nan')
+    result=score(m1,m2,params['tmin'],params['tmax'],params['norm'],params['transition'],remove_diagonal=False,subsample=None)
+    if result['nonzero_nodes']<params['min_nonzero_nodes']:
+        return chromo,start,end,float('nan')
+    return chromo,start,end,result['score']
+
+if __name__=="__main__":
+    main()
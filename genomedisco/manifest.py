@@ -0,0 +1,56 @@
+import os
+
+#state of the tasks of a run (splitting a file by chromosome, comparing a pair on a chromosome).
+#a task is done once its marker exists. The marker is written by the script of the task, after all its outputs were renamed into place,
+#so a task interrupted midway is pending, and is run again from scratch by --resume
+def manifest_path(outdir):
+    return outdir+'/manifest.txt'
+
+def marker_dir(outdir):
+    return outdir+'/manifest'
+
+def marker(outdir,task):
+    return marker_dir(outdir)+'/'+task+'.done'
+
+def is_done(outdir,task):
+    return os.path.isfile(marker(outdir,task))
+
+def done_cmd(outdir,task):
+    #shell command marking the task as done
+    return 'mkdir -p '+marker_dir(outdir)+' && touch '+marker(outdir,task)
+
+def reset(outdir,task):
+    #a task that is run again is pending until it finishes
+    if is_done(outdir,task):
+        os.remove(marker(outdir,task))
+
+def task_cmds(outdir,task,cmds):
+    #the commands of a task run in a subshell that stops at the first error, and the task is marked as done only if all of them succeeded
+    shebang=[cmd for cmd in cmds if cmd.startswith('#!')]
+    cmds=[cmd for cmd in cmds if not cmd.startswith('#!')]
+    #set -e is ignored in a subshell followed by &&, so the exit status is checked separately. A failed task does not stop the other tasks of the script
+    return shebang+['(','set -e']+cmds+[')','if [ $? -eq 0 ]; then '+done_cmd(outdir,task)+'; else echo "task failed: '+task+'" >&2; fi']
+
+def read_manifest(outdir):
+    tasks=[]
+    if os.path.isfile(manifest_path(outdir)):
+        for line in open(manifest_path(outdir),'r'):
+            if line.startswith('#'):
+                continue
+            tasks.append(line.split('\t')[0])
+    return tasks
+
+def write_manifest(outdir,tasks):
+    #adds the tasks to outdir/manifest.txt, with the state of all tasks of the run, and returns the number of these tasks still pending. Only the driver writes this file
+    all_tasks=read_manifest(outdir)
+    for task in tasks:
+        if task not in all_tasks:
+            all_tasks.append(task)
+    tmp=manifest_path(outdir)+'.'+str(os.getpid())+'.tmp'
+    out=open(tmp,'w')
+    out.write('#task\tstate\n')
+    for task in all_tasks:
+        out.write(task+'\t'+('done' if is_done(outdir,task) else 'pending')+'\n')
+    out.close()
+    os.rename(tmp,manifest_path(outdir))
+    return len([task for task in tasks if not is_done(outdir,task)])
@@ -0,0 +1,111 @@
+from __future__ import print_function
+import argparse
+import sys
+from time import strftime
+import numpy as np
+import scipy.sparse as sps
+
+from genomedisco import data_operations, gzio
+from genomedisco.processing import add_chr, read_bins
+from genomedisco.scoring import score
+
+def main():
+    parser = argparse.ArgumentParser(description='Score a pair of contact maps at several resolutions. The contact maps are loaded once at the resolution of --bins, and coarsened in memory to each resolution in --resolutions.')
+    parser.add_argument('--m1',required=True,help='Contact map at the finest resolution, in the format "chr1 n1 chr2 n2 value", as in the metadata_samples files.')
+    parser.add_argument('--m2',required=True)
+    parser.add_argument('--m1name',default='m1')
+    parser.add_argument('--m2name',default='m2')
+    parser.add_argument('--bins',required=True,help='Bins of --m1 and --m2, in the format "chr start end name".')
+    parser.add_argument('--re_fragments',action='store_true',help='Add this flag if the bins are not uniform bins in the genome (e.g. restriction fragments). Each fragment is then assigned to the coarse bin containing its midpoint. By default, consecutive bins are merged, which requires each resolution to be a multiple of the resolution of --bins.')
+    parser.add_argument('--resolutions',required=True,help='Comma-delimited list of resolutions (in bp) to score, e.g. 50000,100000,500000.')
+    parser.add_argument('--chromosomes',default='NA',help='Comma-delimited list of chromosomes to score. DEFAULT: all chromosomes in --bins')
+    parser.add_argument('--m_subsample',type=str,default='lowest',help='"lowest" to subsample the deeper map to the depth of the other, a sequencing depth to subsample both maps to, or "NA". DEFAULT: lowest')
+    parser.add_argument('--norm',type=str,default='sqrtvc')
+    parser.add_argument('--tmin',type=int,default=3)
+    parser.add_argument('--tmax',type=int,default=3)
+    parser.add_argument('--transition',action='store_true')
+    parser.add_argument('--remove_diagonal',action='store_true')
+    parser.add_argument('--out',required=True,help='Output table, with one row per resolution and one column per chromosome, followed by the genomewide score (the average across chromosomes).')
+    args = parser.parse_args()
+    subsample=data_operations.subsample_option(args.m_subsample)
+
+    bins=read_bins(args.bins)
+    chromosomes=sorted(bins.keys())
+    if args.chromosomes!='NA':
+        chromosomes=[add_chr(c) for c in args.chromosomes.split(',')]
+    resolutions=[int(r) for r in args.resolutions.split(',')]
+    #all resolutions are checked before the contacts are read
+    parents={}
+    for chromo in chromosomes:
+        for resolution in resolutions:
+            parents[(resolution,chromo)]=parent_bins(bins[chromo],resolution,args.re_fragments)
+
+    m1s=read_intrachromosomal_contacts(args.m1,bins,chromosomes)
+    m2s=read_intrachromosomal_contacts(args.m2,bins,chromosomes)
+
+    scores={}
+    for chromo in chromosomes:
+        for resolution in resolutions:
+            m1=coarsen(m1s[chromo],parents[(resolution,chromo)],args.remove_diagonal)
+            m2=coarsen(m2s[chromo],parents[(resolution,chromo)],args.remove_diagonal)
+            print("GenomeDISCO | "+strftime("%c")+" | "+args.m1name+" vs "+args.m2name+" "+chromo+" at "+str(resolution)+" bp ("+str(m1.shape[0])+" bins)")
+            scores[(resolution,chromo)]=score(m1,m2,args.tmin,args.tmax,args.norm,args.transition,args.remove_diagonal,subsample)['score']
+
+    out=open(args.out,'w')
+    out.write('#resolution\t'+'\t'.join(chromosomes)+'\tgenomewide\n')
+    for resolution in resolutions:
+        chromo_scores=[scores[(resolution,chromo)] for chromo in chromosomes]
+        out.write(str(resolution)+'\t'+'\t'.join(['{:.3f}'.format(s) for s in chromo_scores])+'\t'+'{:.3f}'.format(np.mean(chromo_scores))+'\n')
+    out.close()
+    print("GenomeDISCO | "+strftime("%c")+" | Multi-resolution scores written to "+args.out)
+
+def read_intrachromosomal_contacts(f,bins,chromosomes):
+    #{chromosome: upper triangular csr matrix}, at the resolution of the bins, diagonal included. The file is read once for all chromosomes
+    print("GenomeDISCO | "+strftime("%c")+" | processing: Loading interaction data from "+f)
+    entries=dict([(chromo,([],[],[])) for chromo in chromosomes])
+    for line in gzio.open_text(f):
+        items=line.strip().split()
+        chromo=add_chr(items[0])
+        if chromo!=add_chr(items[2]) or chromo not in entries:
+            continue
+        n1=bins[chromo]['idx'][items[1]]
+        n2=bins[chromo]['idx'][items[3]]
+        i,j,v=entries[chromo]
+        i.append(min(n1,n2))
+        j.append(max(n1,n2))
+        v.append(float(items[4]))
+    matrices={}
+    for chromo in chromosomes:
+        n=len(bins[chromo]['starts'])
+        i,j,v=entries[chromo]
+        matrices[chromo]=sps.csr_matrix((v,(i,j)),shape=(n,n),dtype=float)
+    return matrices
+
+def parent_bins(chromo_bins,resolution,re_fragments=False):
+    #index of the coarse bin that each bin falls into
+    if resolution<=0:
+        print("GenomeDISCO | "+strftime("%c")+" | Error: resolutions must be positive, got "+str(resolution))
+        sys.exit(1)
+    if re_fragments:
+        midpoints=(chromo_bins['starts']+chromo_bins['ends'])//2
+        return midpoints//resolution
+    base_resolution=int(np.median(chromo_bins['ends']-chromo_bins['starts']))
+    if resolution%base_resolution!=0:
+        print("GenomeDISCO | "+strftime("%c")+" | Error: resolution "+str(resolution)+" is not a multiple of the resolution of the bins ("+str(base_resolution)+"). Use --re_fragments to assign bins to coarse bins by their midpoint instead.")
+        sys.exit(1)
+    return np.arange(len(chromo_bins['starts']))//(resolution//base_resolution)
+
+def coarsen(m,parents,remove_diag=True):
+    #sums the contacts of all bins with the same parent, and returns an upper triangular csr matrix over the parents
+    m=m.tocoo()
+    n=int(parents.max())+1
+    rows=parents[m.row]
+    cols=parents[m.col]
+    coarse=sps.csr_matrix((m.data,(np.minimum(rows,cols),np.maximum(rows,cols))),shape=(n,n),dtype=float)
+    if remove_diag:
+        coarse.setdiag(0)
+        coarse.eliminate_zeros()
+    return coarse
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,119 @@
+import os
+import numpy as np
+import scipy.sparse as sps
+
+#contact maps are stored as upper triangular matrices. They are symmetrized once here, and all normalizations
+#scale the entries of the symmetric matrix in place, so the result can go straight to the random walks
+
+def symmetrize(m):
+    #m+m.T, built from the coordinates of m in one pass. The diagonal is left out, as the random walks do not use it
+    m=sps.coo_matrix(m)
+    offdiag=m.row!=m.col
+    rows=np.concatenate([m.row[offdiag],m.col[offdiag]])
+    cols=np.concatenate([m.col[offdiag],m.row[offdiag]])
+    data=np.concatenate([m.data[offdiag],m.data[offdiag]]).astype(float)
+    m_sym=sps.csr_matrix((data,(rows,cols)),shape=m.shape)
+    m_sym.eliminate_zeros()
+    return m_sym
+
+def coverage_vector(m_sym):
+    return np.asarray(m_sym.sum(axis=1)).flatten()
+
+def entry_rows(m_sym):
+    #row index of each entry in m_sym.data
+    return np.repeat(np.arange(m_sym.shape[0]),np.diff(m_sym.indptr))
+
+def scale(m_sym,row_factors,col_factors):
+    #m_sym[i,j]*=row_factors[i]*col_factors[j], in place
+    m_sym.data*=row_factors[entry_rows(m_sym)]*col_factors[m_sym.indices]
+    return m_sym
+
+def safe_inverse(v):
+    #make the ones that are 0, so that we don't divide by 0
+    v=np.array(v,dtype=float)
+    v[v==0.0]=1.0
+    return 1.0/v
+
+def uniform(m_sym):
+    return m_sym
+
+def sqrtvc(m_sym):
+    factors=safe_inverse(np.sqrt(coverage_vector(m_sym)))
+    return scale(m_sym,factors,factors)
+
+def coverage_norm(m_sym):
+    factors=safe_inverse(coverage_vector(m_sym))
+    return scale(m_sym,factors,factors)
+
+def fill_diagonal(m_sym):
+    #sets the diagonal so that all nodes have the coverage of the most covered node, then divides each entry by the original coverage of its upper triangular row
+    #nodes without contacts are left empty, so that they do not count as nonzero nodes in the random walks
+    sums=coverage_vector(m_sym)
+    covered=np.where(sums>0)[0]
+    m=m_sym.tocoo()
+    rows=np.concatenate([m.row,covered])
+    cols=np.concatenate([m.col,covered])
+    data=np.concatenate([m.data,sums.max()-sums[covered]])
+    m_sym=sps.csr_matrix((data,(rows,cols)),shape=m.shape)
+    m_sym.eliminate_zeros()
+    factors=safe_inverse(sums)
+    m_sym.data*=factors[np.minimum(entry_rows(m_sym),m_sym.indices)]
+    return m_sym
+
+def ice_bias(m_sym,tol=1e-5,maxiter=200,min_coverage=0.1):
+    #iterative correction (ICE): the bias b is such that m[i,j]/(b[i]*b[j]) has the same coverage for all balanced rows
+    #rows with a coverage below min_coverage times the median coverage make the iterations oscillate, so they are left out, with a bias of 0
+    coverage=coverage_vector(m_sym)
+    balanced=(coverage>0)
+    if balanced.any():
+        balanced&=(coverage>=min_coverage*np.median(coverage[balanced]))
+    bias=balanced.astype(float)
+    m_sym=scale(m_sym.copy(),bias,bias)
+    for iteration in range(maxiter):
+        coverage=coverage_vector(m_sym)
+        balanced=coverage>0
+        if not balanced.any():
+            break
+        coverage=coverage/coverage[balanced].mean()
+        coverage[~balanced]=1.0
+        bias*=coverage
+        scale(m_sym,1.0/coverage,1.0/coverage)
+        if np.abs(coverage[balanced]-1.0).max()<tol:
+            break
+    return bias
+
+def cached_ice_bias(m_sym,cache_file='NA',tol=1e-5,maxiter=200):
+    #the bias is reused if it was computed for a matrix with the same depth and number of entries, with the same settings
+    signature=np.array([m_sym.sum(),m_sym.nnz,tol,maxiter],dtype=float)
+    if cache_file!='NA' and os.path.isfile(cache_file):
+        cached=np.load(cache_file)
+        if np.array_equal(cached['signature'],signature) and cached['bias'].shape[0]==m_sym.shape[0]:
+            return cached['bias']
+    bias=ice_bias(m_sym,tol,maxiter)
+    if cache_file!='NA':
+        #several comparisons can share a sample, so the cache is written to a temporary file and renamed into place
+        tmp_file=cache_file+'.'+str(os.getpid())+'.tmp.npz'
+        np.savez(tmp_file,bias=bias,signature=signature)
+        os.rename(tmp_file,cache_file)
+    return bias
+
+def ice(m_sym,bias=None,tol=1e-5,maxiter=200):
+    if bias is None:
+        bias=ice_bias(m_sym,tol,maxiter)
+    factors=np.zeros(len(bias))
+    factors[bias>0]=1.0/bias[bias>0]
+    m_sym=scale(m_sym,factors,factors)
+    m_sym.eliminate_zeros()
+    return m_sym
+
+normalizations={'uniform':uniform,
+                'sqrtvc':sqrtvc,
+                'coverage_norm':coverage_norm,
+                'fill_diagonal':fill_diagonal}
+
+def normalize(m,norm,bias=None,tol=1e-5,maxiter=200):
+    #takes an upper triangular matrix, and returns the normalized symmetric matrix
+    #for "ice", a precomputed bias can be given (e.g. from the full-depth matrix), otherwise it is computed from m
+    if norm=='ice':
+        return ice(symmetrize(m),bias,tol,maxiter)
+    return normalizations[norm](symmetrize(m))
@@ -0,0 +1,169 @@
+from __future__ import print_function
+import argparse
+import itertools
+import os
+import sys
+from time import strftime
+import numpy as np
+
+from genomedisco import gzio
+from genomedisco.processing import add_chr, read_bins
+
+#bins the read pairs of a 4DN .pairs(.gz) file (https://github.com/4dn-dcic/pairix/blob/master/pairs_format_specification.md) in one pass,
+#into the per-chromosome "node1 node2 count" files written by preprocess. Reads are binned a chunk of lines at a time, and the
+#counts of each chromosome are kept as coordinates (bin1*n+bin2) that are merged whenever too many have accumulated, so that the
+#memory depends on the number of distinct contacts and not on the number of reads
+
+def main():
+    parser = argparse.ArgumentParser(description='Bin the read pairs of a .pairs(.gz) file into the per-chromosome contact maps written by preprocess, in a single pass over the file.')
+    parser.add_argument('--pairs',required=True,help='File in the 4DN pairs format. The columns are taken from its "#columns:" header line, or are "readID chrom1 pos1 chrom2 pos2 ..." without it.')
+    parser.add_argument('--bins',required=True,help='Bins in the format "chr start end name".')
+    parser.add_argument('--re_fragments',action='store_true',help='Add this flag if the bins are not uniform (e.g. restriction fragments). Reads are then assigned to bins by binary search instead of by division.')
+    parser.add_argument('--chromosomes',default='NA',help='Comma-delimited list of chromosomes to write. DEFAULT: all chromosomes in --bins')
+    parser.add_argument('--outpref',required=True,help='The contacts of each chromosome are written to <outpref>.<chromosome>.gz')
+    parser.add_argument('--chunk_lines',type=int,default=1000000,help='Number of lines binned at a time. DEFAULT: 1000000')
+    parser.add_argument('--compression_level',type=int,default=6,help='gzip compression level of the outputs. DEFAULT: 6')
+    parser.add_argument('--max_pending',type=int,default=10000000,help='Number of binned contacts held per chromosome before they are merged. DEFAULT: 10000000')
+    args = parser.parse_args()
+
+    bins=read_bins(args.bins)
+    chromosomes=sorted(bins.keys())
+    if args.chromosomes!='NA':
+        chromosomes=[add_chr(c) for c in args.chromosomes.split(',') if add_chr(c) in bins]
+    if not args.re_fragments and not uniform_bins(bins,chromosomes):
+        print("GenomeDISCO | "+strftime("%c")+" | Error: the bins of "+args.bins+" do not all have the same size. Add --re_fragments for restriction-fragment bins.")
+        sys.exit()
+    counts=bin_pairs(args.pairs,bins,chromosomes,args.re_fragments,args.chunk_lines,args.max_pending)
+    for chromo in chromosomes:
+        write_contacts(counts[chromo],bins[chromo],args.outpref+'.'+chromo+'.gz',args.compression_level)
+    print("GenomeDISCO | "+strftime("%c")+" | Wrote "+str(len(chromosomes))+" chromosomes to "+args.outpref+".<chromosome>.gz")
+
+def is_pairs(f):
+    return f.endswith('.pairs') or f.endswith('.pairs.gz')
+
+def uniform_bins(bins,chromosomes):
+    #True if the bins of each chromosome follow each other with the same size (but for the last bin of the chromosome, which can be shorter)
+    for chromo in chromosomes:
+        if chromo not in bins or len(bins[chromo]['starts'])==0:
+            continue
+        starts=bins[chromo]['starts']
+        size=bins[chromo]['ends'][0]-starts[0]
+        if np.any(starts!=starts[0]+size*np.arange(len(starts))) or np.any(bins[chromo]['ends'][:-1]!=starts[1:]):
+            return False
+    return True
+
+def assign_bins(positions,chromo_bins,re_fragments=False):
+    #index of the bin containing each position (0-based), or -1 outside of the bins.
+    #uniform bins are found by division, and restriction fragments by binary search on their starts
+    starts=chromo_bins['starts']
+    if re_fragments:
+        idx=np.searchsorted(starts,positions,'right')-1
+    else:
+        idx=(positions-starts[0])//(chromo_bins['ends'][0]-starts[0])
+    inside=(idx>=0)&(idx<len(starts))
+    idx_clipped=np.clip(idx,0,len(starts)-1)
+    inside&=(positions>=starts[idx_clipped])&(positions<chromo_bins['ends'][idx_clipped])
+    return np.where(inside,idx,-1)
+
+def pairs_columns(header_lines):
+    #positions of chrom1, pos1, chrom2 and pos2, from the "#columns:" header line
+    columns=['readID','chrom1','pos1','chrom2','pos2']
+    for line in header_lines:
+        if line.startswith('#columns:'):
+            columns=line[len('#columns:'):].split()
+    missing=[name for name in ['chrom1','pos1','chrom2','pos2'] if name not in columns]
+    if len(missing)>0:
+        print("GenomeDISCO | "+strftime("%c")+" | Error: the #columns: header of the pairs file has no "+','.join(missing)+" column")
+        sys.exit()
+    return [columns.index(name) for name in ['chrom1','pos1','chrom2','pos2']]
+
+class ContactCounter:
+    #counts of the contacts of a chromosome, as sorted unique coordinates bin1*n+bin2 (bin1<=bin2) and their counts, plus the coordinates binned since the last merge
+
+    def __init__(self,n,max_pending):
+        self.n=n
+        self.max_pending=max_pending
+        self.keys=np.zeros(0,dtype=np.int64)
+        self.counts=np.zeros(0,dtype=np.int64)
+        self.pending=[]
+        self.num_pending=0
+
+    def add(self,bin1,bin2):
+        self.pending.append(np.minimum(bin1,bin2).astype(np.int64)*self.n+np.maximum(bin1,bin2))
+        self.num_pending+=len(bin1)
+        if self.num_pending>self.max_pending:
+            self.compact()
+
+    def compact(self):
+        if self.num_pending==0:
+            return
+        new_keys,new_counts=np.unique(np.concatenate(self.pending),return_counts=True)
+        keys=np.concatenate([self.keys,new_keys])
+        counts=np.concatenate([self.counts,new_counts])
+        self.keys,inverse=np.unique(keys,return_inverse=True)
+        self.counts=np.bincount(inverse,weights=counts).astype(np.int64)
+        self.pending=[]
+        self.num_pending=0
+
+    def contacts(self):
+        #(bin1, bin2, count), sorted by bin1 then bin2
+        self.compact()
+        return self.keys//self.n,self.keys%self.n,self.counts
+
+def bin_pairs(f,bins,chromosomes,re_fragments=False,chunk_lines=1000000,max_pending=10000000):
+    #{chromosome: ContactCounter} with the reads whose 2 ends fall in bins of the same chromosome
+    print("GenomeDISCO | "+strftime("%c")+" | processing: Binning read pairs from "+f)
+    counters=dict([(chromo,ContactCounter(len(bins[chromo]['starts']),max_pending)) for chromo in chromosomes])
+    handle=iter(gzio.open_text(f))
+    header=[]
+    first_line=None
+    for line in handle:
+        if not line.startswith('#'):
+            first_line=line
+            break
+        header.append(line)
+    chrom1_col,pos1_col,chrom2_col,pos2_col=pairs_columns(header)
+    lines=handle
+    if first_line is not None:
+        lines=itertools.chain([first_line],handle)
+    total=0
+    kept=0
+    while True:
+        chunk=list(itertools.islice(lines,chunk_lines))
+        if len(chunk)==0:
+            break
+        items=[line.split() for line in chunk]
+        chrom1=np.array([add_chr(x[chrom1_col]) for x in items],dtype=object)
+        chrom2=np.array([add_chr(x[chrom2_col]) for x in items],dtype=object)
+        #the positions of .pairs files are 1-based, and the starts of the bins are 0-based
+        pos1=np.array([x[pos1_col] for x in items],dtype=np.int64)-1
+        pos2=np.array([x[pos2_col] for x in items],dtype=np.int64)-1
+        cis=chrom1==chrom2
+        for chromo in set(chrom1[cis]):
+            if chromo not in counters:
+                continue
+            in_chromo=cis&(chrom1==chromo)
+            bin1=assign_bins(pos1[in_chromo],bins[chromo],re_fragments)
+            bin2=assign_bins(pos2[in_chromo],bins[chromo],re_fragments)
+            binned=(bin1>=0)&(bin2>=0)
+            counters[chromo].add(bin1[binned],bin2[binned])
+            kept+=int(np.count_nonzero(binned))
+        total+=len(chunk)
+        print("GenomeDISCO | "+strftime("%c")+" | processing: "+str(total)+" read pairs, "+str(kept)+" within a chromosome")
+    return counters
+
+def write_contacts(counter,chromo_bins,outname,level=None):
+    #"node1 node2 count" file, written to a temporary file and renamed once complete
+    bin1,bin2,counts=counter.contacts()
+    names=chromo_bins['names']
+    tmp=outname+'.'+str(os.getpid())+'.tmp'
+    out=gzio.open_text(tmp,'w',level)
+    chunk_size=500000
+    for chunk_start in range(0,len(counts),chunk_size):
+        chunk=slice(chunk_start,chunk_start+chunk_size)
+        out.write(''.join([n1+'\t'+n2+'\t'+str(c)+'\n' for n1,n2,c in zip(names[bin1[chunk]],names[bin2[chunk]],counts[chunk])]))
+    out.close()
+    os.rename(tmp,outname)
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,140 @@
+from __future__ import print_function
+import numpy as np
+from genomedisco import instrumentation, results_table, gzio
+from genomedisco.comparison_types.disco_random_walks import band
+
+#memory planning for the random walks. The walk matrices fill in quickly with t, so the walks, and not the inputs, set the peak memory.
+#the number of entries of the walk matrices is estimated, and the first engine that fits in the memory budget is used:
+#"exact" (float64), "float32", "banded" (contacts further than --band bins apart are dropped, only if a band is given, as it changes the score) and "chunked" (exact, a block of rows at a time)
+columns=['sample1','sample2','chromosome','engine','chunk_rows','n','nnz','walk_nnz','budget_mb','estimated_peak_mb','measured_peak_mb']
+engines=['exact','float32','banded','chunked']
+#live copies of the walk matrices during a step: rw1, rw2, the new product, and the difference and its absolute value
+walk_copies=5
+#python lists built while parsing a contact map, per entry
+parse_bytes_per_entry=100
+#the plot stage, after the walks: copies of the walk matrices as coo while they are binned, and dense images of the figure
+plot_sparse_copies=3
+plot_image_copies=5
+#matplotlib and its figure, and the copies of the images made while rendering them
+render_mb=60.0
+render_image_copies=6
+
+def entry_bytes(engine):
+    #value and column index of a csr entry
+    if engine=='float32':
+        return 4+4
+    return 8+4
+
+def sampled_walk_nnz(m,tmax,sample_rows=200,seed=0):
+    #number of entries of m^t (max over t<=tmax), extrapolated from the walks started at a random sample of rows
+    n=m.shape[0]
+    rows=np.random.RandomState(seed).choice(n,min(n,sample_rows),replace=False)
+    rw=m[rows,:]
+    row_nnz=rw.nnz
+    for t in range(2,tmax+1):
+        rw=rw.dot(m)
+        row_nnz=max(row_nnz,rw.nnz)
+    return int(float(n)*row_nnz/len(rows))
+
+def analytic_walk_nnz(n,nnz_sym,tmax):
+    #bound on the number of entries of m^tmax from the average number of entries per row, when the matrices are not loaded
+    per_row=max(float(nnz_sym)/max(n,1),1.0)
+    return int(n*min(float(n),per_row**tmax))
+
+def walk_mb(nnz_sym,walk_nnz,engine,n=1,chunk_rows=None):
+    #the 2 transition matrices, and the walk matrices (only chunk_rows rows of them for "chunked")
+    if engine=='chunked':
+        walk_nnz=float(walk_nnz)*chunk_rows/max(n,1)
+    return entry_bytes(engine)*(2.0*nnz_sym+walk_copies*walk_nnz)/(1024.0*1024.0)
+
+def plot_mb(n,nnz_sym,walk_nnz,engine,max_pixels=2000,render=True):
+    #the transition and last walk matrices are still held while their differences are binned into images of at most max_pixels per side.
+    #the figure is rendered after the images are saved, so rendering adds to the images and not to the binning
+    binsize=max(1,int(np.ceil(1.0*n/max_pixels)))
+    image_bytes=8.0*np.ceil(1.0*n/binsize)**2
+    held=entry_bytes(engine)*(2.0*nnz_sym+2.0*walk_nnz)
+    binning=plot_sparse_copies*(entry_bytes(engine)+4)*walk_nnz+plot_image_copies*image_bytes
+    rendering=0.0
+    if render:
+        rendering=render_mb*1024*1024+render_image_copies*image_bytes
+    return (held+max(binning,rendering))/(1024.0*1024.0)
+
+def plan(m1,m2,tmax,budget_mb='NA',engine='auto',band_bins='NA',baseline_mb=None,plots=False,max_pixels=2000,render=True):
+    #returns {'engine','chunk_rows','walk_nnz','estimated_peak_mb'}, with engine "refused" if nothing fits in the budget.
+    #with plots, the plot stage is part of the estimate; the chunked engine makes no plots, so it is still chosen when only the plots do not fit
+    if baseline_mb is None:
+        baseline_mb=instrumentation.peak_rss_mb()
+    n=m1.shape[0]
+    nnz_sym=max(m1.nnz,m2.nnz)
+    candidates=[engine]
+    if engine=='auto':
+        candidates=['exact','float32']
+        if band_bins!='NA':
+            candidates.append('banded')
+        candidates.append('chunked')
+    refused={'engine':'refused','chunk_rows':'NA','walk_nnz':'NA','estimated_peak_mb':'NA'}
+    for candidate in candidates:
+        if candidate=='banded':
+            walk_nnz=max(sampled_walk_nnz(band(m1,int(band_bins)),tmax),sampled_walk_nnz(band(m2,int(band_bins)),tmax))
+        else:
+            walk_nnz=max(sampled_walk_nnz(m1,tmax),sampled_walk_nnz(m2,tmax))
+        chunk_rows=n
+        if candidate=='chunked' and budget_mb!='NA':
+            #largest block of rows that fits
+            per_row_mb=walk_mb(0,walk_nnz,candidate,n,1)
+            chunk_rows=int(min(n,(float(budget_mb)-baseline_mb-walk_mb(nnz_sym,0,candidate,n,0))/max(per_row_mb,1e-12)))
+            if chunk_rows<1:
+                refused['walk_nnz']=walk_nnz
+                continue
+        estimated=baseline_mb+walk_mb(nnz_sym,walk_nnz,candidate,n,chunk_rows)
+        if plots and candidate!='chunked':
+            estimated=max(estimated,baseline_mb+plot_mb(n,nnz_sym,walk_nnz,candidate,max_pixels,render))
+        refused['walk_nnz']=walk_nnz
+        refused['estimated_peak_mb']=estimated
+        if budget_mb=='NA' or estimated<=float(budget_mb):
+            return {'engine':candidate,'chunk_rows':chunk_rows,'walk_nnz':walk_nnz,'estimated_peak_mb':estimated}
+    return refused
+
+def count_entries(f):
+    #number of lines of a gzipped contact map
+    c=0
+    for line in gzio.open_text(f):
+        c+=1
+    return c
+
+def estimate_job_mb(n,nnz1,nnz2,tmax,base_mb=100.0,plots=False):
+    #estimate of the peak memory of compute_reproducibility.py with the exact engine, from the sizes of the input files, with the plot data saved but not rendered if plots
+    #the inputs are upper triangular, so the symmetric matrices have about twice as many entries
+    nnz_sym=2*max(nnz1,nnz2)
+    parse=parse_bytes_per_entry*max(nnz1,nnz2)/(1024.0*1024.0)
+    walk_nnz=analytic_walk_nnz(n,nnz_sym,tmax)
+    walks=walk_mb(nnz_sym,walk_nnz,'exact')
+    if plots:
+        walks=max(walks,plot_mb(n,nnz_sym,walk_nnz,'exact',render=False))
+    return base_mb+max(parse,walks)
+
+def write_validation(tables,outname):
+    #measured vs estimated peak memory, by engine, from the memory plan tables of the tasks.
+    #an engine fails if any comparison used more memory than estimated. Returns the failed engines, or None if there is no table
+    by_engine={}
+    for items in results_table.read_rows(tables,len(columns),3):
+        if items[3]=='refused':
+            continue
+        engine=items[3]
+        if engine not in by_engine:
+            by_engine[engine]=[]
+        by_engine[engine].append(float(items[10])/float(items[9]))
+    if len(by_engine)==0:
+        return None
+    failed=[]
+    out=open(outname,'w')
+    out.write('#engine\truns\tmedian_measured_over_estimated\tmax_measured_over_estimated\tstatus\n')
+    for engine in sorted(by_engine.keys()):
+        ratios=np.array(by_engine[engine])
+        status='pass'
+        if ratios.max()>1.0:
+            status='fail'
+            failed.append(engine)
+        out.write(engine+'\t'+str(len(ratios))+'\t'+'{:.3f}'.format(np.median(ratios))+'\t'+'{:.3f}'.format(ratios.max())+'\t'+status+'\n')
+    out.close()
+    return failed
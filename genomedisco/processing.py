@@ -1,8 +1,12 @@
+from __future__ import print_function
+import os
+import sys
 import numpy as np
-import gzip
+import scipy.sparse as sps
 from scipy.sparse import csr_matrix
 from scipy.sparse import coo_matrix
 from time import gmtime, strftime
+from genomedisco import normalization, gzio
 
 #===== MATRIX IO
 #from http://stackoverflow.com/questions/8955448/save-load-scipy-sparse-csr-matrix-in-portable-data-format
@@ -15,24 +19,103 @@ def load_sparse_csr(filename):
     return csr_matrix((  loader['data'], loader['indices'], loader['indptr']),
                          shape = loader['shape'])
 
+def write_columns(out,columns,line_format,chunk_size=500000):
+    #writes lines whose fields are taken from columns (arrays of the same length, or a single value repeated on every line)
+    #lines are formatted a chunk at a time, instead of one write per line
+    length=max([len(column) for column in columns if not np.isscalar(column)]+[0])
+    for start in range(0,length,chunk_size):
+        stop=min(start+chunk_size,length)
+        chunk=np.empty((stop-start,len(columns)),dtype=object)
+        for column_idx in range(len(columns)):
+            if np.isscalar(columns[column_idx]):
+                chunk[:,column_idx]=columns[column_idx]
+            else:
+                chunk[:,column_idx]=columns[column_idx][start:stop].tolist()
+        out.write((line_format*(stop-start)) % tuple(chunk.ravel()))
+
+def write_bins_track(values,nodes,nodes_idx,outname,output_format='bed',level=None,chunk_size=500000):
+    #one value per node, in node index order
+    values=np.asarray(values,dtype=float).flatten()
+    if output_format=='npy':
+        np.save(outname,values.astype(np.float32))
+        return
+    #the fields of the nodes, indexed by node index
+    names=np.array([nodes_idx[i] for i in range(len(values))],dtype=object)
+    chrs=np.array([nodes[node]['chr'] for node in names],dtype=object)
+    starts=np.array([nodes[node]['start'] for node in names],dtype=np.int64)
+    ends=np.array([nodes[node]['end'] for node in names],dtype=np.int64)
+    out=gzio.open_text(outname,'w',level)
+    write_columns(out,[chrs,starts,ends,names,values],'%s\t%d\t%d\t%s\t%.6g\n',chunk_size)
+    out.close()
+
+def write_sparse_matrix_text(m,outname,node_names,chromo='NA',k=0,chunk_size=500000,level=None):
+    #writes the upper triangle (diagonals >= k) of a sparse matrix as "n1 n2 v", or as "chr n1 chr n2 v" if chromo is given
+    coo_m=sps.triu(m,k=k,format='coo')
+    keep=coo_m.data>0.0
+    rows,cols,vals=coo_m.row[keep],coo_m.col[keep],coo_m.data[keep]
+    order=np.lexsort((cols,rows))
+    rows,cols,vals=rows[order],cols[order],vals[order]
+    names=np.asarray(node_names,dtype=object)
+
+    if chromo=='NA':
+        columns=[names[rows],names[cols],vals]
+    else:
+        columns=[chromo,names[rows],chromo,names[cols],vals]
+    out=gzio.open_text(outname,'w',level)
+    write_columns(out,columns,'\t'.join(['%s']*len(columns))+'\n',chunk_size)
+    out.close()
+
+def write_sparse_matrix(m,outname,node_names,chromo='NA',k=0,output_format='text',level=None):
+    #output_format='npz' writes the upper triangle straight into the binary matrix store read by construct_csr_matrix_from_data_and_nodes
+    if output_format=='npz':
+        save_sparse_csr(outname,sps.triu(m,k=k,format='csr'))
+    else:
+        write_sparse_matrix_text(m,outname,node_names,chromo,k,level=level)
+
+def add_chr(chromo):
+    #same chromosome names as preprocess
+    if chromo.startswith('chr'):
+        return chromo
+    return 'chr'+chromo
+
+def read_bins(bedfile):
+    #{chromosome: {'starts','ends','names','idx'}}, with the bins of each chromosome sorted by start, as in the node files written by preprocess.
+    #'names' holds the name of each bin, and 'idx' the index of each name
+    print("GenomeDISCO | "+strftime("%c")+" | processing: Loading genomic regions from "+bedfile)
+    by_chromo={}
+    for line in gzio.open_text(bedfile):
+        items=line.strip().split('\t')
+        chromo=add_chr(items[0])
+        if chromo not in by_chromo:
+            by_chromo[chromo]=[]
+        by_chromo[chromo].append((int(items[1]),int(items[2]),items[3]))
+    bins={}
+    for chromo in by_chromo:
+        regions=sorted(by_chromo[chromo])
+        bins[chromo]={'starts':np.array([r[0] for r in regions],dtype=np.int64),
+                      'ends':np.array([r[1] for r in regions],dtype=np.int64),
+                      'names':np.array([r[2] for r in regions],dtype=object),
+                      'idx':dict([(regions[i][2],i) for i in range(len(regions))])}
+    return bins
+
 def read_nodes_from_bed(bedfile,blacklistfile='NA'):
     
     blacklist={}
     if blacklistfile!='NA':
-        for line in gzip.open(blacklistfile):
+        for line in gzio.open_text(blacklistfile):
             items=line.strip().split('\t')
             chromo,start,end=items[0],int(items[1]),int(items[2])
             if chromo not in blacklist:
                 blacklist[chromo]=[]
             blacklist[chromo].append((start,end))
     
-    print "GenomeDISCO | "+strftime("%c")+" | processing: Loading genomic regions from "+bedfile
+    print("GenomeDISCO | "+strftime("%c")+" | processing: Loading genomic regions from "+bedfile)
 
     nodes={}
     nodes_idx={}
     node_c=0
     blacklisted_nodes=[]
-    for line in gzip.open(bedfile,'r'):
+    for line in gzio.open_text(bedfile):
         items=line.strip().split('\t')
         chromo=items[0]
         start=int(items[1])
@@ -43,7 +126,7 @@ def read_nodes_from_bed(bedfile,blacklistfile='NA'):
             include=items[4]
         
         if node in nodes.keys():
-            print "GenomeDISCO | "+strftime("%c")+" | Error: Genomic region appears multiple times in your file. One such example is "+node+". Please make sure all genomic regions are unique and re-run"
+            print("GenomeDISCO | "+strftime("%c")+" | Error: Genomic region appears multiple times in your file. One such example is "+node+". Please make sure all genomic regions are unique and re-run")
             sys.exit()
         if node not in nodes.keys():
             nodes[node]={}
@@ -63,6 +146,10 @@ def read_nodes_from_bed(bedfile,blacklistfile='NA'):
             node_c+=1
             
     return nodes,nodes_idx,blacklisted_nodes
+
+def get_resolution(nodes):
+    #median size of the genomic regions, computed the same way as the resolution.txt written by preprocess
+    return int(np.median(np.array([nodes[node]['end']-nodes[node]['start'] for node in nodes])))
         
 def filter_nodes(m,to_remove):
     
@@ -81,17 +168,34 @@ def filter_nodes(m,to_remove):
     return csr_matrix((coo_mat.data[keep],(coo_mat.row[keep],coo_mat.col[keep])),shape=m.get_shape(),dtype=float) 
     
 
-def construct_csr_matrix_from_data_and_nodes(f,nodes,blacklisted_nodes=[],remove_diag=True):
-    print "GenomeDISCO | "+strftime("%c")+" | processing: Loading interaction data from "+f
-
+def construct_csr_matrix_from_data_and_nodes(f,nodes,blacklisted_nodes=[],remove_diag=True,chromosome='NA'):
+    #cooler_io reads the bins with this module, so it is imported when needed
+    from genomedisco import cooler_io
     total_nodes=len(nodes.keys())
+    if cooler_io.is_cooler(f):
+        csr_m=construct_csr_matrix_from_cooler(f,nodes,chromosome)
+        if remove_diag:
+            csr_m.setdiag(0)
+        return filter_nodes(csr_m,blacklisted_nodes)
+
+    print("GenomeDISCO | "+strftime("%c")+" | processing: Loading interaction data from "+f)
+
+    if f.endswith('.npz'):
+        csr_m=csr_matrix(load_sparse_csr(f),dtype=float)
+        if csr_m.shape!=(total_nodes,total_nodes):
+            print("GenomeDISCO | "+strftime("%c")+" | Error: the matrix in "+f+" has shape "+str(csr_m.shape)+", while the nodes give a shape of "+str((total_nodes,total_nodes)))
+            sys.exit()
+        if remove_diag:
+            csr_m.setdiag(0)
+        return filter_nodes(csr_m,blacklisted_nodes)
+
     i=[]
     j=[]
     v=[]
 
     #print strftime("%c")
     c=0
-    for line in gzip.open(f):
+    for line in gzio.open_text(f):
         items=line.strip().split('\t')
         n1,n2,val=nodes[items[0]]['idx'],nodes[items[1]]['idx'],float(items[2])
         mini=min(n1,n2)
@@ -106,14 +210,60 @@ def construct_csr_matrix_from_data_and_nodes(f,nodes,blacklisted_nodes=[],remove
         csr_m.setdiag(0)
     return filter_nodes(csr_m,blacklisted_nodes)
 
-def write_matrix_from_csr_and_nodes(csr_m,nodes_idx,outname):
+def construct_csr_matrix_from_cooler(f,nodes,chromosome='NA'):
+    #contacts of a chromosome of a cooler file, on the nodes of that chromosome (matched by start). Only this chromosome is read from the file
+    from genomedisco import cooler_io
+    node_chromosomes=sorted(set([add_chr(nodes[node]['chr']) for node in nodes]))
+    if chromosome=='NA':
+        if len(node_chromosomes)!=1:
+            print("GenomeDISCO | "+strftime("%c")+" | Error: the nodes cover several chromosomes. Give the chromosome to read from "+f)
+            sys.exit()
+        chromosome=node_chromosomes[0]
+    chromo_nodes=[node for node in nodes if add_chr(nodes[node]['chr'])==add_chr(chromosome)]
+    chromo_nodes.sort(key=lambda node: nodes[node]['start'])
+    node_starts=np.array([nodes[node]['start'] for node in chromo_nodes],dtype=int)
+    node_idx=np.array([nodes[node]['idx'] for node in chromo_nodes],dtype=int)
+    starts1,starts2,counts=cooler_io.read_chromosome(f,chromosome)
+    i=node_idx[cooler_io.match_starts(starts1,node_starts,f,chromosome)]
+    j=node_idx[cooler_io.match_starts(starts2,node_starts,f,chromosome)]
+    total_nodes=len(nodes.keys())
+    return csr_matrix((counts,(np.minimum(i,j),np.maximum(i,j))),shape=(total_nodes,total_nodes),dtype=float)
+
+#===== PER-SAMPLE STATS
+def nonzero_nodes(m_sym):
+    #mask of the nodes with at least one contact, in a symmetric matrix
+    return np.asarray(m_sym.sum(axis=1)).flatten()>0.0
+
+def matrix_stats(m):
+    #stats of an upper triangular contact map that do not depend on the sample it is compared to
+    coverage=normalization.coverage_vector(normalization.symmetrize(m))
+    return {'depth':float(m.sum()),'coverage':coverage,'nonzero_nodes':int(np.count_nonzero(coverage>0.0))}
+
+def cached_matrix_stats(m,matrix_file,cache_file='NA',signature=[]):
+    #the stats are reused by all comparisons of a sample, as long as the matrix file (its path and modification time) and the loading options (signature) do not change
+    source=matrix_file.split('::')[0]
+    if cache_file=='NA' or not os.path.isfile(source):
+        return matrix_stats(m)
+    signature=np.array([os.path.getmtime(source)]+list(signature),dtype=float)
+    if os.path.isfile(cache_file):
+        cached=np.load(cache_file)
+        if str(cached['source'])==os.path.abspath(matrix_file) and np.array_equal(cached['signature'],signature) and cached['coverage'].shape[0]==m.shape[0]:
+            return {'depth':float(cached['depth']),'coverage':cached['coverage'],'nonzero_nodes':int(cached['nonzero_nodes'])}
+    stats=matrix_stats(m)
+    #several comparisons can share a sample, so the cache is written to a temporary file and renamed into place
+    tmp_file=cache_file+'.'+str(os.getpid())+'.tmp.npz'
+    np.savez(tmp_file,depth=stats['depth'],coverage=stats['coverage'],nonzero_nodes=stats['nonzero_nodes'],source=os.path.abspath(matrix_file),signature=signature)
+    os.rename(tmp_file,cache_file)
+    return stats
+
+def write_matrix_from_csr_and_nodes(csr_m,nodes_idx,outname,level=None):
 
     coo_m=coo_matrix(csr_m)
     i=coo_m.row
     j=coo_m.col
     v=coo_m.data
 
-    out=gzip.open(outname,'w')
+    out=gzio.open_text(outname,'w',level)
 
     #convert i, j into node names
     for idx in range(len(i)):
@@ -122,7 +272,7 @@ def write_matrix_from_csr_and_nodes(csr_m,nodes_idx,outname):
     out.close()
 
 def old_construct_csr_matrix_from_data_and_nodes(f,nodes,blacklisted_nodes,remove_diag=True):
-    print "GenomeDISCO | "+strftime("%c")+" | processing: Loading interaction data from "+f
+    print("GenomeDISCO | "+strftime("%c")+" | processing: Loading interaction data from "+f)
 
     total_nodes=len(nodes.keys())
     mdata=np.loadtxt(f)
@@ -146,7 +296,7 @@ def old_construct_csr_matrix_from_data_and_nodes(f,nodes,blacklisted_nodes,remov
     rows=[tuple(row) for row in mini_maxi_ij]
     #- if the original set of rows is larger than the unique set of rows, flag an error
     if len(rows)>len(set(rows)):
-        print "=============== Warning: Your file contains duplicate interactions! Please ensure that each interaction is listed once, then re-run. In the meantime, we will run this analysis using the sum of all counts encountered per interaction"
+        print("=============== Warning: Your file contains duplicate interactions! Please ensure that each interaction is listed once, then re-run. In the meantime, we will run this analysis using the sum of all counts encountered per interaction")
     
     csr_m=csr_matrix( (mdata[:,2],(mini_maxi_ij[:,0],mini_maxi_ij[:,1])), shape=(total_nodes,total_nodes),dtype=float )
     if remove_diag:
@@ -0,0 +1,109 @@
+from __future__ import print_function
+import os
+import glob
+import numpy as np
+
+#one row per (pair, chromosome, method, t). t is the random walk step for per-step scores, and "final" for the reported score
+columns=['sample1','sample2','chromosome','method','t','score','nonzero_nodes','depth1','depth2','subsampled_depth1','subsampled_depth2']
+numeric_columns=['score','nonzero_nodes','depth1','depth2','subsampled_depth1','subsampled_depth2']
+key_columns=['sample1','sample2','chromosome','method','t']
+
+def results_table_path(outdir):
+    return outdir+'/results/scores.table.txt'
+
+def task_table_path(outdir,sample1,sample2,chromosome,method,kind='scores'):
+    #each task writes its rows to its own table, so concurrent tasks never write to the same file
+    return outdir+'/results/tables/'+sample1+'.vs.'+sample2+'.'+chromosome+'.'+method+'.'+kind+'.txt'
+
+def task_tables(outdir,kind='scores'):
+    return sorted(glob.glob(outdir+'/results/tables/*.'+kind+'.txt'))
+
+def write_rows(table,rows,header=columns):
+    #the rows are written to a temporary file that is then renamed, so the table is either complete or absent, and a rerun replaces it
+    if not os.path.exists(os.path.dirname(os.path.abspath(table))):
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(table)))
+        except OSError:
+            pass
+    tmp=table+'.'+str(os.getpid())+'.tmp'
+    out=open(tmp,'w')
+    out.write('#'+'\t'.join(header)+'\n')
+    for row in rows:
+        out.write('\t'.join([str(x) for x in row])+'\n')
+    out.close()
+    os.rename(tmp,table)
+
+def read_rows(tables,n_columns=len(columns),n_keys=len(key_columns)):
+    #rows of one table or a list of tables. If a key was written more than once, the last row wins
+    if isinstance(tables,str):
+        tables=[tables]
+    latest={}
+    for table in tables:
+        if not os.path.isfile(table):
+            continue
+        for line in open(table,'r'):
+            if line.startswith('#'):
+                continue
+            items=line.rstrip('\n').split('\t')
+            if len(items)!=n_columns:
+                continue
+            latest[tuple(items[:n_keys])]=items
+    return list(latest.values())
+
+def read_table(table):
+    #returns the table (or list of tables) as a dict of columns
+    rows=read_rows(table)
+    results={}
+    for col_idx in range(len(columns)):
+        col=columns[col_idx]
+        values=[row[col_idx] for row in rows]
+        if col in numeric_columns:
+            results[col]=np.array([float(v) if v!='NA' else np.nan for v in values],dtype=float)
+        else:
+            results[col]=np.array(values,dtype=object)
+    return results
+
+def results_tables(outdir):
+    #the compiled table of an earlier run first, so that the rows of the task tables win
+    return [results_table_path(outdir)]+task_tables(outdir,'scores')
+
+def compile_table(outdir):
+    #all scores of the run in a single table, outdir/results/scores.table.txt
+    rows=read_rows(results_tables(outdir))
+    rows.sort()
+    write_rows(results_table_path(outdir),rows)
+    return len(rows)
+
+def select(results,**conditions):
+    keep=np.ones(len(results['score']),dtype=bool)
+    for col in conditions:
+        keep&=(results[col]==conditions[col])
+    return dict([(col,results[col][keep]) for col in columns])
+
+def chromosome_scores(results,method,t='final'):
+    #{(sample1,sample2): {chromosome: score}}
+    subset=select(results,method=method,t=str(t))
+    scores={}
+    for i in range(len(subset['score'])):
+        pair=(subset['sample1'][i],subset['sample2'][i])
+        if pair not in scores:
+            scores[pair]={}
+        scores[pair][subset['chromosome'][i]]=subset['score'][i]
+    return scores
+
+def genomewide_scores(results,method,t='final',chromosomes=None,weight_by_nonzero_nodes=False):
+    #{(sample1,sample2): genomewide score}, as the mean across chromosomes, or weighted by the number of nonzero nodes per chromosome
+    subset=select(results,method=method,t=str(t))
+    if chromosomes is not None:
+        keep=np.array([c in chromosomes for c in subset['chromosome']],dtype=bool)
+        subset=dict([(col,subset[col][keep]) for col in columns])
+    scores={}
+    for pair in set(zip(subset['sample1'],subset['sample2'])):
+        in_pair=(subset['sample1']==pair[0])&(subset['sample2']==pair[1])
+        pair_scores=subset['score'][in_pair]
+        weights=subset['nonzero_nodes'][in_pair]
+        if weight_by_nonzero_nodes and np.all(np.isfinite(weights)) and weights.sum()>0:
+            scores[pair]=float((pair_scores*weights).sum()/weights.sum())
+        else:
+            scores[pair]=float(pair_scores.mean())
+    return scores
@@ -0,0 +1,65 @@
+import numpy as np
+import scipy.sparse as sps
+
+from genomedisco import data_operations
+from genomedisco.comparison_types.disco_random_walks import random_walk_differences, final_score, final_differences
+
+#in-memory scoring, for calling GenomeDISCO from other code: no files are read or written, and nothing is printed
+#the defaults are those of example_parameters.txt
+
+def score(m1,m2,tmin=3,tmax=3,norm='sqrtvc',transition=True,remove_diagonal=True,subsample='lowest',shape=None,symmetric=False,engine='exact',band=None,chunk_rows=None,bias1=None,bias2=None,random_state=None):
+    #m1 and m2 are scipy sparse matrices, numpy arrays, or (rows, cols, values) coordinates with a shape.
+    #by default, each contact is listed once, as in the contact map files (entries (i,j) and (j,i) are added up).
+    #with symmetric=True, m1 and m2 are full symmetric matrices, and only their upper triangle is used.
+    #subsample is "lowest" (the deeper map is subsampled to the depth of the other), a depth, or None. random_state is a seed or a numpy RandomState.
+    #returns {'score', 'scores' ({t: score at t}), 'diff_vector' (difference by bin, averaged over t like the score), 'nonzero_nodes' (average of the 2 maps)}
+    m1=upper_triangular(m1,shape,symmetric,remove_diagonal)
+    m2=upper_triangular(m2,shape,symmetric,remove_diagonal)
+    if m1.shape!=m2.shape:
+        raise ValueError('m1 and m2 have different shapes: '+str(m1.shape)+' and '+str(m2.shape))
+    m1,m2=subsample_pair(m1,m2,subsample,random_state)
+
+    m1_norm=data_operations.process_matrix(m1,norm,bias1)
+    m2_norm=data_operations.process_matrix(m2,norm,bias2)
+    walks=random_walk_differences(m1_norm,m2_norm,tmin,tmax,transition,engine,band,chunk_rows)
+    scores=walks['scores']
+    return {'score':final_score(scores,tmin,tmax),
+            'scores':dict([(tmin+t_idx,1.0-scores[t_idx]) for t_idx in range(len(scores))]),
+            'diff_vector':np.asarray(final_differences(walks['diff_vector'],tmin,tmax)).flatten(),
+            'nonzero_nodes':walks['nonzero_total']}
+
+def subsample_pair(m1,m2,subsample='lowest',random_state=None):
+    #m1 and m2 subsampled as by score, for callers that subsample before cutting the maps into pieces
+    if random_state is None or isinstance(random_state,int):
+        random_state=np.random.RandomState(random_state)
+    if subsample is not None:
+        desired_depth=subsample
+        if subsample=='lowest':
+            desired_depth=min(m1.sum(),m2.sum())
+        if m1.sum()>desired_depth:
+            m1=data_operations.subsample_to_depth(m1,desired_depth,random_state)
+        if m2.sum()>desired_depth:
+            m2=data_operations.subsample_to_depth(m2,desired_depth,random_state)
+    return m1,m2
+
+def upper_triangular(m,shape=None,symmetric=False,remove_diagonal=True):
+    #upper triangular csr matrix with the contacts of m, in the layout of the contact maps read from files
+    if isinstance(m,tuple):
+        rows,cols,values=[np.asarray(x) for x in m]
+        if shape is None:
+            n=int(max(rows.max(),cols.max()))+1 if len(rows)>0 else 0
+            shape=(n,n)
+        m=sps.coo_matrix((values.astype(float),(rows,cols)),shape=shape)
+    else:
+        m=sps.coo_matrix(m,dtype=float)
+    if m.shape[0]!=m.shape[1]:
+        raise ValueError('contact maps must be square, got shape '+str(m.shape))
+    keep=np.ones(len(m.data),dtype=bool)
+    if symmetric:
+        keep&=(m.row<=m.col)
+    if remove_diagonal:
+        keep&=(m.row!=m.col)
+    rows,cols=m.row[keep],m.col[keep]
+    m=sps.csr_matrix((m.data[keep],(np.minimum(rows,cols),np.maximum(rows,cols))),shape=m.shape,dtype=float)
+    m.eliminate_zeros()
+    return m
@@ -1,15 +1,16 @@
-
+from __future__ import print_function
 import matplotlib
 matplotlib.use('Agg')
 from matplotlib.backends.backend_pdf import PdfPages
 import matplotlib.pyplot as plt
 import pybedtools
 import numpy as np
+from scipy.sparse import csr_matrix
 import argparse
 import os
 import processing
 import data_operations
-import gzip
+import gzio
 import re
 import copy
 from random import randint
@@ -32,13 +33,16 @@ def main():
     parser.add_argument('--numsim',type=int)
     parser.add_argument('--distance_dep_data',default='NA')
     parser.add_argument('--distance_dep_tads',default='NA')
+    parser.add_argument('--output_format',default='text',help='Format of the simulated matrices. "text" (default) writes gzipped "n1 n2 value" files, "npz" writes the binary sparse matrix store that can be read directly by compute_reproducibility.py.')
+    parser.add_argument('--compression_level',type=int,default=6,help='gzip compression level of the simulated matrices written as text. DEFAULT: 6')
+    parser.add_argument('--distance_dep_plot',default='NA',help='If set, plot the intra/inter-TAD distance dependence curves of the real data to this file.')
     args = parser.parse_args()
 
     simulate(args)
 
 def read_bed_into_interval(bed):
     regions=[]
-    for line in gzip.open(bed):
+    for line in gzio.open_text(bed):
         items=line.strip().split('\t')
         regions.append(pybedtools.Interval(items[0], int(items[1]), int(items[2])))
     return regions
@@ -54,7 +58,7 @@ def simulate(args):
 
     original_tad_boundary_var=0
     original_tadmatrix=tadfile_to_tadmatrix(args.tadfile,original_tad_boundary_var,args.resolution,args.nodefile)
-    dd=get_2_distance_dependence_curves(real_data,maxdist_in_nodes,original_tadmatrix)
+    dd=get_2_distance_dependence_curves(real_data,maxdist_in_nodes,original_tadmatrix,args.distance_dep_plot)
     dds={}
     if args.distance_dep_data!='NA':
         ddfiles=args.distance_dep_data.split(',')
@@ -65,7 +69,7 @@ def simulate(args):
             ddtad=ddtads[ddfile_idx]
             ddtad_matrix=tadfile_to_tadmatrix(ddtad,original_tad_boundary_var,args.resolution,args.nodefile)
             ddata=processing.construct_csr_matrix_from_data_and_nodes(ddfile,nodes,blacklist_nodes,True)
-            print 'done'
+            print('done')
             dds[ddfile_idx]=get_2_distance_dependence_curves(ddata,maxdist_in_nodes,ddtad_matrix)
     
     for i in range(args.numsim):
@@ -74,7 +78,7 @@ def simulate(args):
         simulate_tadfile(args.tadmeansize,args.intertadmeandistance,args.resolution,args.nodefile,simulatedtadfile,'simulated')
         simulated_tad_matrix=tadfile_to_tadmatrix(simulatedtadfile,original_tad_boundary_var,args.resolution,args.nodefile)
         #this tad matrix will be used for the noise simulations for node and edge noise
-        print i
+        print(i)
         for edgenoise in args.edgenoise.split(','):
             for nodenoise in args.nodenoise.split(','):
                 for boundarynoise in args.boundarynoise.split(','):
@@ -89,26 +93,22 @@ def simulate(args):
                             for ddfile_idx in dds.keys():
                                 prob_matrix=get_probability_matrix(simulated_tad_matrix,dds[ddfile_idx],maxdist_in_nodes,float(edgenoise),args.eps,float(nodenoise))
                                 sampled_matrix=sample_interactions(prob_matrix,args.depth)
-                                ftowrite=intro+'.EN_'+str(edgenoise)+'_eps_'+str(args.eps)+'.NN_'+str(nodenoise)+'.BN_'+str(boundarynoise)+'.'+ab+'.dd_'+str(ddfile_idx)+'.gz'
+                                ftowrite=intro+'.EN_'+str(edgenoise)+'_eps_'+str(args.eps)+'.NN_'+str(nodenoise)+'.BN_'+str(boundarynoise)+'.'+ab+'.dd_'+str(ddfile_idx)+matrix_suffix(args)
                                 write_matrix(sampled_matrix,ftowrite,args)
                         else:
                             prob_matrix=get_probability_matrix(simulated_tad_matrix,dd,maxdist_in_nodes,float(edgenoise),args.eps,float(nodenoise))
                             sampled_matrix=sample_interactions(prob_matrix,args.depth)
-                            ftowrite=intro+'.EN_'+str(edgenoise)+'_eps_'+str(args.eps)+'.NN_'+str(nodenoise)+'.BN_'+str(boundarynoise)+'.'+ab+'.gz'
+                            ftowrite=intro+'.EN_'+str(edgenoise)+'_eps_'+str(args.eps)+'.NN_'+str(nodenoise)+'.BN_'+str(boundarynoise)+'.'+ab+matrix_suffix(args)
                             write_matrix(sampled_matrix,ftowrite,args)
 
-def write_matrix(sampled_matrix,fname,args):
-    f=gzip.open(fname,'w')
-    for i in range(sampled_matrix.shape[0]):
-        for j in range(i,sampled_matrix.shape[0]):
-            v=sampled_matrix[i,j]
-            if v>0.0:
-                n1=i*args.resolution#+int(args.resolution/2)
-                n2=j*args.resolution#+int(args.resolution/2)
-                f.write(str(n1)+'\t'+str(n2)+'\t'+str(v)+'\n')
-    f.close()
+def matrix_suffix(args):
+    if args.output_format=='npz':
+        return '.npz'
+    return '.gz'
 
-    
+def write_matrix(sampled_matrix,fname,args):
+    node_names=np.arange(sampled_matrix.shape[0])*args.resolution
+    processing.write_sparse_matrix(sampled_matrix,fname,node_names,'NA',0,args.output_format,args.compression_level)
 
 def get_median_size_of_intervals(intervals,resolution):
     vals=[]
@@ -129,7 +129,7 @@ def simulate_tadfile(tad_size,tad_distance,resolution,nodefile,outfile,chrname='
     tad_distance_n=int(1.0*tad_distance/resolution)
     
     tad_intervals=[]
-    out=gzip.open(outfile,'w')
+    out=gzio.open_text(outfile,'w')
     
     current_n=0
     while current_n<n:
@@ -172,14 +172,11 @@ def tadfile_to_tadmatrix(tadfile,var_boundary_diff_init,resolution,nodefile):
     return tad_matrix
 
 def sample_interactions(prob_matrix,depth):
-    new_m=np.zeros(prob_matrix.shape)
-    for i in range(new_m.shape[0]):
-        for j in range(i,new_m.shape[0]):
-            p=prob_matrix[i,j]
-            reads=np.random.binomial(depth, p, size=1)[0]
-            new_m[i,j]=reads
-            new_m[j,i]=reads
-    return new_m
+    #sample the upper triangle in one call (same row-major order as sampling entry by entry), and keep it sparse
+    rows,cols=np.triu_indices(prob_matrix.shape[0])
+    reads=np.random.binomial(depth,prob_matrix[rows,cols])
+    keep=reads>0
+    return csr_matrix((reads[keep].astype(float),(rows[keep],cols[keep])),shape=prob_matrix.shape)
 
 
 def get_probability_matrix(tad_matrix,dd_dict,maxdist,prob_noise,eps,prob_node):
@@ -215,67 +212,67 @@ def get_probability_matrix(tad_matrix,dd_dict,maxdist,prob_noise,eps,prob_node):
     return prob_m/total_probs
 
 
-def get_2_distance_dependence_curves(m,maxdist,tad_matrix):
+def get_2_distance_dependence_curves(m,maxdist,tad_matrix,plotfile='NA'):
     n=tad_matrix.shape[0]
-    tadmeans=[]
-    nontadmeans=[]
-    tad_sd=[]
-    nontad_sd=[]
-    total=0.0
-    for d in range(maxdist+1):
-        tad_values=[]
-        nontad_values=[]
-        for i in range(n):
-            if (i+d)<n:
-                v=m[i,i+d]
-            else:
-                continue
-            total+=v
-            is_tad=False
-            if tad_matrix[i,i+d]==1.0:
-                is_tad=True
-            if is_tad:
-                tad_values.append(v)
-            else:
-                nontad_values.append(v)
-        tadmeans.append(np.nan_to_num(np.nanmean(np.array(tad_values))))
-        nontadmeans.append(np.nan_to_num(np.nanmean(np.array(nontad_values))))
-        tad_sd.append(np.nan_to_num(np.nanstd(np.array(tad_values))))
-        nontad_sd.append(np.nan_to_num(np.nanstd(np.array(nontad_values))))
+    nd=maxdist+1
+
+    #number of (i,i+d) positions per distance, split by whether they fall inside a TAD
+    positions=np.zeros(nd)
+    positions[:min(nd,n)]=n-np.arange(min(nd,n))
+    tad_rows,tad_cols=np.nonzero(np.triu(tad_matrix==1.0))
+    tad_d=tad_cols-tad_rows
+    tad_d=tad_d[tad_d<nd]
+    tad_positions=np.bincount(tad_d,minlength=nd).astype(float)
+    nontad_positions=positions-tad_positions
+
+    #pull the upper diagonals 0..maxdist out of the sparse matrix in one go
+    m_coo=m.tocoo()
+    d=m_coo.col-m_coo.row
+    keep=(d>=0)&(d<nd)
+    rows,cols,d,v=m_coo.row[keep],m_coo.col[keep],d[keep],np.asarray(m_coo.data[keep],dtype=float)
+    is_tad=(tad_matrix[rows,cols]==1.0)
+    total=v.sum()
+
+    #grouped sums per distance; the zero entries count towards the means through the position counts
+    tad_sums=np.bincount(d[is_tad],weights=v[is_tad],minlength=nd)
+    tad_sqsums=np.bincount(d[is_tad],weights=v[is_tad]**2,minlength=nd)
+    nontad_sums=np.bincount(d[~is_tad],weights=v[~is_tad],minlength=nd)
+    nontad_sqsums=np.bincount(d[~is_tad],weights=v[~is_tad]**2,minlength=nd)
+
+    def grouped_mean_sd(sums,sqsums,counts):
+        means=np.zeros(nd)
+        sds=np.zeros(nd)
+        has=counts>0
+        means[has]=sums[has]/counts[has]
+        sds[has]=np.sqrt(np.maximum(sqsums[has]/counts[has]-means[has]**2,0.0))
+        return means,sds
+
+    tadmeans,tad_sd=grouped_mean_sd(tad_sums,tad_sqsums,tad_positions)
+    nontadmeans,nontad_sd=grouped_mean_sd(nontad_sums,nontad_sqsums,nontad_positions)
+
     #now, divide by total to get probabilities
-    tadprobs=[]
-    nontadprobs=[]
-    tadprobs_sd=[]
-    nontadprobs_sd=[]
+    tadprobs=tadmeans/total
+    nontadprobs=nontadmeans/total
+    tadprobs_sd=tad_sd/total
+    nontadprobs_sd=nontad_sd/total
+    tadprobs[0]=nontadprobs[0]=tadprobs_sd[0]=nontadprobs_sd[0]=0.0
     dd={}
-    dd['intraTAD']={}
-    dd['interTAD']={}
+    dd['intraTAD']=dict(enumerate(tadprobs))
+    dd['interTAD']=dict(enumerate(nontadprobs))
     sd={}
-    sd['intraTAD']={}
-    sd['interTAD']={}
-    for d in range(maxdist+1):
-        if d==0:
-            dd['intraTAD'][d]=0.0
-            dd['interTAD'][d]=0.0
-            sd['intraTAD'][d]=0.0
-            sd['interTAD'][d]=0.0
-        else:
-            dd['intraTAD'][d]=tadmeans[d]/total
-            dd['interTAD'][d]=nontadmeans[d]/total
-            sd['intraTAD'][d]=tad_sd[d]/total
-            sd['interTAD'][d]=nontad_sd[d]/total
-        tadprobs.append(dd['intraTAD'][d])
-        nontadprobs.append(dd['interTAD'][d])
-        tadprobs_sd.append(sd['intraTAD'][d])
-        nontadprobs_sd.append(sd['interTAD'][d])
-        
-    plt.plot(np.log(tadprobs)/np.log(10),label='Intra-TAD',color='red')
-    plt.plot(np.log(nontadprobs)/np.log(10),label='Inter-TAD',color='blue')
-    plt.xlabel('Distance (in nodes)')
-    plt.ylabel('Log10(probability of contact)')
-    plt.axvline(25,linewidth=1, color = 'lightgray') ### this is 1Mb
-    plt.legend()
-    plt.show()
+    sd['intraTAD']=dict(enumerate(tadprobs_sd))
+    sd['interTAD']=dict(enumerate(nontadprobs_sd))
+
+    if plotfile!='NA':
+        plt.close('all')
+        plt.plot(np.log(tadprobs)/np.log(10),label='Intra-TAD',color='red')
+        plt.plot(np.log(nontadprobs)/np.log(10),label='Inter-TAD',color='blue')
+        plt.xlabel('Distance (in nodes)')
+        plt.ylabel('Log10(probability of contact)')
+        plt.axvline(25,linewidth=1, color = 'lightgray') ### this is 1Mb
+        plt.legend()
+        plt.savefig(plotfile)
+        plt.close()
 
     dd_and_sd={}
     dd_and_sd['dd']=dd
@@ -1,3 +1,4 @@
+from __future__ import print_function
 import argparse
 import copy
 import re
@@ -5,7 +6,9 @@ import os
 import gzip
 from time import gmtime, strftime
 import numpy as np
+import scipy.sparse as sps
 from scipy.sparse import csr_matrix
+from scipy.sparse import coo_matrix
 
 from genomedisco import data_operations, processing, visualization
 
@@ -23,6 +26,8 @@ def main():
     parser.add_argument('--resolution',type=int,default=40000)
     parser.add_argument('--mini',type=int,default=-1)
     parser.add_argument('--maxi',type=int,default=-1)
+    parser.add_argument('--output_format',default='text',help='Format of the simulated matrices. "text" (default) writes gzipped "chr n1 chr n2 value" files, "npz" writes the binary sparse matrix store that can be read directly by compute_reproducibility.py.')
+    parser.add_argument('--compression_level',type=int,default=6,help='gzip compression level of the simulated matrices written as text. DEFAULT: 6')
     args = parser.parse_args()
 
     #setup nodes
@@ -61,93 +66,72 @@ def main():
                             
                             intro=args.outdir+'/Depth_'+str(args.depth)+'.'+mname
                             sampled_matrix=sample_interactions(copy.deepcopy(prob_matrix),args.depth,np.random.RandomState(s))
-                            ftowrite=intro+'.EN_'+str(edgenoise)+'.NN_'+str(nodenoise)+'.BN_'+str(boundarynoise)+'.'+ab+'.dd_'+str(ddfile_idx)+'.gz'
-                            print ftowrite
+                            ftowrite=intro+'.EN_'+str(edgenoise)+'.NN_'+str(nodenoise)+'.BN_'+str(boundarynoise)+'.'+ab+'.dd_'+str(ddfile_idx)+matrix_suffix(args)
+                            print(ftowrite)
                             write_matrix(sampled_matrix,ftowrite,args)
                             
 def sample_interactions(prob_matrix1,depth,pet_random):
-    new_m=np.zeros(prob_matrix1.shape)
-    for i in range(new_m.shape[0]):
-        for j in range(i,new_m.shape[0]):
-            p=prob_matrix1[i,j]
-            reads=pet_random.binomial(depth, p, size=1)[0]
-            new_m[i,j]=reads
-            new_m[j,i]=reads
-    return new_m
+    #sample the upper triangle in one call (same row-major order as sampling entry by entry), and keep it sparse
+    rows,cols=np.triu_indices(prob_matrix1.shape[0])
+    reads=pet_random.binomial(depth,prob_matrix1[rows,cols])
+    keep=reads>0
+    return csr_matrix((reads[keep].astype(float),(rows[keep],cols[keep])),shape=prob_matrix1.shape)
 
 def get_probability_matrix(my_matrix,ddmat,edge_noise,node_noise,mini,maxi,pet_random):#,maxdist=2000):
 
     #0 out diagonal of our matrix #==========
-    for i in range(my_matrix.shape[0]):
-        my_matrix[i,i]=0.0
+    np.fill_diagonal(my_matrix,0.0)
 
     #convert matrix to probabilities
-    total_probs=np.triu(copy.deepcopy(my_matrix)).sum()
-    mat=copy.deepcopy(my_matrix)/total_probs #this is the probability matrix
-    mat_dd=data_operations.get_distance_dep(csr_matrix(mat))
+    total_probs=np.triu(my_matrix).sum()
+    mat=my_matrix/total_probs #this is the probability matrix
     #0 out diagonal of the ddmat #================
-    for i in range(ddmat.shape[0]):
-        ddmat[i,i]=0.0
-    desired_dd=data_operations.get_distance_dep(csr_matrix(ddmat))
+    np.fill_diagonal(ddmat,0.0)
     
     #rescale the values to obey the distance curve given
-    new_mat=np.zeros(mat.shape)
-    mat_ddsums={}
-    desired_ddsums={}
+    n=mat.shape[0]
+    mat_ddsums=np.zeros(n)
+    desired_ddsums=np.zeros(n)
     mat_total=0.0
     desired_total=0.0
-    for i in range(new_mat.shape[0]-1):
+    for i in range(n-1):
         mat_ddsums[i]=np.diagonal(mat,i).sum()
         desired_ddsums[i]=np.diagonal(ddmat,i).sum()
         mat_total+=mat_ddsums[i]
         desired_total+=desired_ddsums[i]
-    for i in range(new_mat.shape[0]-1):
-        for j in range(i,new_mat.shape[0]):#,i+maxdist+1)):
-            d=abs(i-j)   
-            if d not in mat_ddsums:
-                continue
-            if desired_total*mat_ddsums[d]==0.0:
-                val=0.0
-            else:
-                val=1.0*mat[i,j]*mat_total*desired_ddsums[d]/(desired_total*mat_ddsums[d])
-            new_mat[i,j]=val
-            new_mat[j,i]=val
-
+    #the longest diagonal (d=n-1) is never rescaled, so it ends up at 0
+    d=np.triu(np.subtract.outer(np.arange(n),np.arange(n)).T)
+    denom=desired_total*mat_ddsums
+    denom[n-1]=0.0
+    rescalable=(denom!=0.0)
+    new_mat=np.zeros(mat.shape)
+    upper=np.triu(rescalable[d])
+    new_mat[upper]=1.0*mat[upper]*mat_total*desired_ddsums[d[upper]]/denom[d[upper]]
         
     #0 out things that are not within mini<->maxi
-    for i in range(new_mat.shape[0]):
-        if i>=mini and i<=maxi:
-            continue
-        new_mat[i,:]=0.0
-        new_mat[:,i]=0.0        
+    outside=np.ones(n,dtype=bool)
+    outside[max(mini,0):maxi+1]=False
+    new_mat[outside,:]=0.0
+    new_mat[:,outside]=0.0
 
     #rescale the new matrix to be a probability matrix
-    total_probs=np.triu(copy.deepcopy(new_mat)).sum()
-    new_mat=np.triu(copy.deepcopy(new_mat))/total_probs
-    
+    total_probs=new_mat.sum()
+    new_mat=new_mat/total_probs
 
     #edge noise
     #pet_random = np.random.RandomState()
-    new_mat2=np.zeros(new_mat.shape)
+    #draws are made in the same (row-major, upper triangle) order as sampling entry by entry
     new_mat2=new_mat
-    
-    for i in range(new_mat.shape[0]):
-        for j in range(min(i,new_mat.shape[0]),new_mat.shape[0]): 
-            pij=new_mat[i,j]
-            pij_final=pij
-            if edge_noise!=0.0:
-                boink = float(pet_random.binomial(1, edge_noise, size=1)[0]) #(pet_random.rand(1)[0] <= edge_noise)
-                if (boink>0.0):
-                    pij_final=0.0
-            new_mat2[i,j]=pij_final
+    if edge_noise!=0.0:
+        rows,cols=np.triu_indices(n)
+        boink=pet_random.binomial(1,edge_noise,size=len(rows))>0
+        new_mat2[rows[boink],cols[boink]]=0.0
     
     #node noise
-    for i in range(new_mat2.shape[0]):
-        remove_node=float(pet_random.binomial(1, node_noise, size=1)[0])
-        if remove_node>0.0:
-            new_mat2[i,:]=0.0
-            new_mat2[:,i]=0.0
-    total_probs=np.triu(copy.deepcopy(new_mat2)).sum()
+    remove_node=pet_random.binomial(1,node_noise,size=n)>0
+    new_mat2[remove_node,:]=0.0
+    new_mat2[:,remove_node]=0.0
+    total_probs=np.triu(new_mat2).sum()
     return np.triu(new_mat2)/total_probs
     
 def read_in_data(mname_full,nodes):
@@ -155,18 +139,18 @@ def read_in_data(mname_full,nodes):
     mat=mat + mat.T
     return mat
 
+def matrix_suffix(args):
+    if args.output_format=='npz':
+        return '.npz'
+    return '.gz'
+
 def write_matrix(sampled_matrix,fname,args,chromo='chr21'):
-    mini=args.mini
-    maxi=args.maxi
-    f=gzip.open(fname,'w')
-    for i in range(mini,min(maxi,sampled_matrix.shape[0])):
-        for j in range(min(i+1,sampled_matrix.shape[0]),min(maxi,sampled_matrix.shape[0])):
-            v=sampled_matrix[i,j]
-            if v>0.0:
-                n1=i*args.resolution
-                n2=j*args.resolution
-                f.write(chromo+'\t'+str(n1)+'\t'+chromo+'\t'+str(n2)+'\t'+str(v)+'\n')
-    f.close()
+    #only write entries i<j with both nodes in [mini,maxi)
+    m=sps.triu(sampled_matrix,k=1,format='coo')
+    keep=(m.row>=args.mini)&(m.col<args.maxi)
+    m=coo_matrix((m.data[keep],(m.row[keep],m.col[keep])),shape=m.shape)
+    node_names=np.arange(m.shape[0])*args.resolution
+    processing.write_sparse_matrix(m,fname,node_names,chromo,1,args.output_format,args.compression_level)
 
 def shift_dataset(m,boundarynoise):
     if boundarynoise==0:
@@ -175,13 +159,13 @@ def shift_dataset(m,boundarynoise):
     small_m=copy.deepcopy(m)
     small_m=small_m[nonzero_rows,:]
     small_m=small_m[:,nonzero_rows]
-    print small_m
-    print 'roll'
+    print(small_m)
+    print('roll')
     small_m=np.roll(small_m,boundarynoise,axis=0)
-    print small_m
-    print 'roll2'
+    print(small_m)
+    print('roll2')
     small_m=np.roll(small_m,boundarynoise,axis=1)
-    print small_m
+    print(small_m)
     outm=np.zeros(m.shape)
     for i_idx in range(len(nonzero_rows)):
         i=nonzero_rows[i_idx]
@@ -191,7 +175,8 @@ def shift_dataset(m,boundarynoise):
             outm[j,i]=outm[i,j]
     return outm
 
-main()
+if __name__=="__main__":
+    main()
 
         
 
@@ -1,12 +1,197 @@
 
-import matplotlib
-matplotlib.use('Agg') # Must be before importing matplotlib.pyplot or pylab!
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_pdf import PdfPages
+import hashlib
 import numpy as np
-from pylab import rcParams
+import scipy.sparse as sps
+#matplotlib is only imported when plotting, so that importing this module stays cheap
+
+def sparse_to_image(m,region_start=0,region_end=None,max_pixels=2000):
+    #bins the region [region_start,region_end) of a sparse matrix into at most max_pixels x max_pixels pixels
+    #each pixel holds the mean of the block of entries it covers. Returns the image and the number of nodes per pixel
+    if region_end is None:
+        region_end=m.shape[0]
+    size=region_end-region_start
+    binsize=max(1,int(np.ceil(1.0*size/max_pixels)))
+    npixels=int(np.ceil(1.0*size/binsize))
+    region=sps.csr_matrix(m)[region_start:region_end,region_start:region_end].tocoo()
+    image=sps.coo_matrix((region.data,(region.row//binsize,region.col//binsize)),shape=(npixels,npixels)).toarray()
+    return image/(1.0*binsize*binsize),binsize
+
+def vector_to_image(v,region_start,region_end,binsize):
+    #bins a per-node vector the same way as sparse_to_image, averaging the nodes in each pixel
+    v=np.asarray(v).flatten()[region_start:region_end]
+    pixel=np.arange(len(v))//binsize
+    return np.bincount(pixel,weights=v)/np.bincount(pixel)
+
+def write_genomedisco_plotdata(plotdata_file,m1,m2,rw1,rw2,diff_vector,resolution,plot_region='NA',max_pixels=2000):
+    #saves the binned images behind the GenomeDISCO figure, so that the figure can be rendered separately from scoring
+    nnodes=m1.shape[0]
+    region_start,region_end=0,nnodes
+    if plot_region!='NA':
+        region_bp=plot_region.split('-')
+        region_start=max(0,min(nnodes,int(float(region_bp[0])/resolution)))
+        region_end=max(region_start+1,min(nnodes,int(np.ceil(float(region_bp[1])/resolution))))
+    originals,binsize=sparse_to_image(sps.triu(m1)-sps.triu(m2).T,region_start,region_end,max_pixels)
+    rw,binsize=sparse_to_image(sps.triu(rw1)-sps.triu(rw2).T,region_start,region_end,max_pixels)
+    diff_mat,binsize=sparse_to_image(rw1-rw2,region_start,region_end,max_pixels)
+    diff_image=vector_to_image(diff_vector,region_start,region_end,binsize)
+    np.savez(plotdata_file,originals=originals,rw=rw,diff_mat=diff_mat,diff_vector=diff_image,region=np.array([region_start,region_end,binsize]),resolution=np.array([resolution]))
+
+def plotdata_key(plotdata_file):
+    #hash of the arrays in a plot data file, so that rewriting the same data does not count as a change
+    plotdata=np.load(plotdata_file)
+    key=hashlib.md5()
+    for name in sorted(plotdata.files):
+        key.update(name.encode('utf-8'))
+        key.update(np.ascontiguousarray(plotdata[name]).tobytes())
+    return key.hexdigest()
+
+def genome_ticks(region_start,region_end,binsize,resolution,ticksize=10000000):
+    #one tick every ticksize bp, plus one at the end of the region, in pixel coordinates
+    resolution_mb=0.000001*resolution
+    tick_nodes=[]
+    first_tick=int(np.ceil(1.0*region_start*resolution/ticksize))
+    last_tick=int(np.floor(1.0*region_end*resolution/ticksize))
+    for tick in range(first_tick,last_tick+1):
+        tick_node=int(round(1.0*tick*ticksize/resolution))
+        if region_start<=tick_node<=region_end:
+            tick_nodes.append(tick_node)
+    if len(tick_nodes)==0 or tick_nodes[-1]!=region_end:
+        tick_nodes.append(region_end)
+    ticklist=[1.0*(tick_node-region_start)/binsize for tick_node in tick_nodes]
+    ticknames=[str(1.0*(tick_node*resolution_mb))+' Mb' for tick_node in tick_nodes]
+    return ticklist,ticknames
+
+def plot_genomedisco(plotdata_file,fname):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from mpl_toolkits.axes_grid1 import make_axes_locatable
+    from matplotlib.ticker import MultipleLocator
+
+    plotdata=np.load(plotdata_file)
+    originals,rw,diff_mat,diff_vector=plotdata['originals'],plotdata['rw'],plotdata['diff_mat'],plotdata['diff_vector']
+    region_start,region_end,binsize=[int(x) for x in plotdata['region']]
+    resolution=float(plotdata['resolution'][0])
+    #==================
+    figwidth=40
+    figheight=8
+    range_originals=[-0.01,0.01]
+    range_rw=[-0.01,0.01]
+    range_diff_mat=[-0.01,0.01]
+    #==================
+
+    #set ticks
+    ticklist,ticknames=genome_ticks(region_start,region_end,binsize,resolution)
+
+    fig, plots = plt.subplots(1,3)
+    fig.set_size_inches(figwidth,figheight)
+    
+    #original data
+    #=============
+    colorbar_ticks=[range_originals[0],0,range_originals[1]]
+    im1 = plots[0].matshow(originals,vmin=range_originals[0],vmax=range_originals[1],cmap='bwr')
+    plots[0].set_title('Original data')
+    # Create divider for existing axes instance
+    divider = make_axes_locatable(plots[0])
+    cax = divider.append_axes("right", size="10%", pad=1.5)
+    cbar = plt.colorbar(im1, cax=cax, ticks=MultipleLocator(0.2), format="%.3f",orientation='vertical')
+    cax = divider.append_axes("right", size="20%", pad=0.7)
+    plt.yticks([])
+    plt.xticks([])
+    cax.spines['right'].set_visible(False)
+    cax.spines['top'].set_visible(False)
+    cax.spines['left'].set_visible(False)
+    cax.spines['bottom'].set_visible(False)
+    cbar.set_ticks(colorbar_ticks)
+    cbar.set_ticklabels(colorbar_ticks)
+    cbar.ax.tick_params(labelsize=15)
+    plots[0].set_xticks([])
+    plots[0].set_yticks(ticklist)
+    plots[0].set_xticklabels([],size=15)
+    plots[0].set_yticklabels(ticknames,size=15)
+    plots[0].yaxis.tick_right()
+    
+    #random walk data
+    #================
+    colorbar_ticks=[range_rw[0],0,range_rw[1]]
+    im1 = plots[1].matshow(rw,vmin=range_rw[0],vmax=range_rw[1],cmap='bwr')
+    plots[1].set_title('Smoothed data')
+    # Create divider for existing axes instance
+    divider = make_axes_locatable(plots[1])
+    cax = divider.append_axes("right", size="10%", pad=1.5)
+    cbar = plt.colorbar(im1, cax=cax, ticks=MultipleLocator(0.2), format="%.3f",orientation='vertical')
+    cax = divider.append_axes("right", size="20%", pad=0.7)
+    plt.yticks([])
+    plt.xticks([])
+    cax.spines['right'].set_visible(False)
+    cax.spines['top'].set_visible(False)
+    cax.spines['left'].set_visible(False)
+    cax.spines['bottom'].set_visible(False)
+    cbar.set_ticks(colorbar_ticks)
+    cbar.set_ticklabels(colorbar_ticks)
+    cbar.ax.tick_params(labelsize=15)
+    plots[1].set_xticks([])
+    plots[1].set_yticks(ticklist)
+    plots[1].set_xticklabels([],size=15)
+    plots[1].set_yticklabels(ticknames,size=15)
+    plots[1].yaxis.tick_right()
+    
+    #random walk data differences
+    #============================
+    colorbar_ticks=[range_diff_mat[0],0,range_diff_mat[1]]
+    im1 = plots[2].matshow(diff_mat,vmin=range_diff_mat[0],vmax=range_diff_mat[1],cmap='bwr')
+    plots[2].set_title('Diff matrix (smoothed data)')
+    # Create divider for existing axes instance
+    divider = make_axes_locatable(plots[2])
+    cax = divider.append_axes("right", size="20%", pad=1.5)
+    plt.plot(diff_vector,range(len(diff_vector)))
+    plt.ylim(0,len(diff_vector))
+    plt.xlim(0,1.5)
+    plt.gca().invert_yaxis()
+    plt.yticks(ticklist,[])
+    cax = divider.append_axes("right", size="10%", pad=0.7)
+    cbar = plt.colorbar(im1, cax=cax, ticks=MultipleLocator(0.2), format="%.3f",orientation='vertical')
+    cbar.set_ticks(colorbar_ticks)
+    cbar.set_ticklabels(colorbar_ticks)
+    cbar.ax.tick_params(labelsize=15)
+    plots[2].set_xticks([])
+    plots[2].set_yticks(ticklist)
+    plots[2].set_xticklabels([],size=15)
+    plots[2].set_yticklabels(ticknames,size=15)
+    plots[2].yaxis.tick_right()
+    plt.savefig(fname)
+    plt.close(fig)
+
+def plot_chromosome_scores(chromos,scores,fname,topscores=0.85):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from matplotlib import rcParams
+
+    plt.close("all")
+    widthfactor=3
+    rcParams['figure.figsize'] = 10*widthfactor,10
+    rcParams['xtick.labelsize'] = 20
+    rcParams['ytick.labelsize'] = 20
+    plt.scatter(range(len(chromos)),np.array(scores),s=100)
+    plt.xticks(range(len(chromos)),chromos,rotation='vertical')
+    plt.xlabel('chromosome',fontsize=30)
+    plt.ylim(0.4,1.0)
+    plt.axhline(topscores, color='r', linestyle='dashed',linewidth=2,label='threshold for high-quality datasets')
+    plt.axhline(np.array(scores).mean(), color='b', linewidth=2,label='genomewide reproducibility for these datasets')
+    plt.yticks([0.4,0.5,0.6,0.7,0.8,0.9,1.0])
+    plt.ylabel('reproducibility',fontsize=30)
+    plt.gcf().subplots_adjust(bottom=0.25)
+    plt.gcf().subplots_adjust(left=0.25)
+    plt.legend(loc=3,fontsize=25)
+    plt.savefig(fname)
+    plt.close()
 
 def plot_dds(dd_list,dd_names,out,approximation=10000):
+    import matplotlib
+    matplotlib.use('Agg') # Must be before importing matplotlib.pyplot or pylab!
+    import matplotlib.pyplot as plt
+    from matplotlib import rcParams
     assert len(dd_list)==len(dd_names)
 
     rcParams['figure.figsize'] = 7,7
@@ -1,4 +1,4 @@
-
+from __future__ import print_function
 import argparse
 import copy
 import re
@@ -6,38 +6,32 @@ import os
 from time import gmtime, strftime
 import gzip
 import numpy as np
+from genomedisco import results_table
 
 def main():
     parser = argparse.ArgumentParser(description='')
-    parser.add_argument('--scores_by_chromosome',default='/ifs/scratch/oursu/paper_2017-12-20/results/rao/res50000.final/compiled_scores/GenomeDISCO.scores.multiple_t.by_chromosome.txt.gz')
+    parser.add_argument('--results_table',default='/ifs/scratch/oursu/paper_2017-12-20/results/rao/res50000.final/results/scores.table.txt')
+    parser.add_argument('--method',default='GenomeDISCO')
+    parser.add_argument('--weight_by_nonzero_nodes',action='store_true')
     parser.add_argument('--out',default='/ifs/scratch/oursu/paper_2017-12-20/results/rao/res50000.final/compiled_scores/GenomeDISCO.scores.multiple_t.genomewide.txt.gz')
     args = parser.parse_args()
 
-    score_dict={}
-    for line in gzip.open(args.scores_by_chromosome):
-        items=line.strip().split('\t')
-        chromo,m1,m2=items[0],items[1],items[2]
-        print chromo
-        comparison=m1+'\t'+m2
-        if comparison not in score_dict:
-            score_dict[comparison]={}
+    results=results_table.read_table(args.results_table)
+    ts=sorted(set(results_table.select(results,method=args.method)['t'])-set(['final']),key=int)
+    genomewide_by_t=[results_table.genomewide_scores(results,args.method,t,None,args.weight_by_nonzero_nodes) for t in ts]
+
+    #comparisons with no score at a t (or no per-t scores at all) get NA there
+    comparisons=set(results_table.genomewide_scores(results,args.method,'final',None,args.weight_by_nonzero_nodes).keys())
+    for genomewide in genomewide_by_t:
+        comparisons|=set(genomewide.keys())
 
-        score_cols=range(3,len(items))
-        for score_col in score_cols:
-            if score_col not in score_dict[comparison]:
-                score_dict[comparison][score_col]=[]
-            score=float(items[score_col])
-            score_dict[comparison][score_col].append(score)
-    
     out=gzip.open(args.out,'w')
-    for comparison in score_dict:
-        scores=[]
-        for score_col_idx in range(len(score_cols)):
-            score_col=score_cols[score_col_idx]
-            genomewide=np.mean(np.array(score_dict[comparison][score_col]))
-            scores.append(str(genomewide))
-        out.write('genomewide'+'\t'+comparison+'\t'+'\t'.join(scores)+'\n')
+    for comparison in sorted(comparisons):
+        scores=[str(genomewide.get(comparison,'NA')) for genomewide in genomewide_by_t]
+        if len(scores)==0:
+            scores=['NA']
+        out.write('genomewide'+'\t'+'\t'.join(comparison)+'\t'+'\t'.join(scores)+'\n')
     out.close()
-    print args.out
+    print(args.out)
 
 main()
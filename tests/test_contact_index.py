@@ -0,0 +1,58 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from genomedisco import contact_index, processing
+
+#chr1 has 4 bins of 100bp and chr2 has 2. The contacts are out of order, and two of them have the same bins
+bins_lines=['chr1\t0\t100\tchr1:0','chr1\t100\t200\tchr1:100','chr1\t200\t300\tchr1:200','chr1\t300\t400\tchr1:300',
+            'chr2\t0\t100\tchr2:0','chr2\t100\t200\tchr2:100']
+contacts_lines=['chr1\tchr1:300\tchr1\tchr1:300\t1','chr2\tchr2:100\tchr1\tchr1:0\t2','chr1\tchr1:0\tchr1\tchr1:200\t3',
+                'chr1\tchr1:100\tchr1\tchr1:200\t4','chr1\tchr1:0\tchr1\tchr1:200\t5','chr2\tchr2:0\tchr2\tchr2:100\t6',
+                'chr1\tchr1:200\tchr1\tchr1:100\t7','chr1\tchr1:0\tchr1\tchr1:100\t8']
+
+class ContactIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir=tempfile.mkdtemp()
+        self.bins=os.path.join(self.tmpdir,'bins.bed.gz')
+        self.contacts=os.path.join(self.tmpdir,'contacts.gz')
+        for f,lines in [(self.bins,bins_lines),(self.contacts,contacts_lines)]:
+            out=gzip.open(f,'w')
+            out.write('\n'.join(lines)+'\n')
+            out.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def indexed(self,chunk_lines,fan_in):
+        out=os.path.join(self.tmpdir,'sorted.'+str(chunk_lines)+'.'+str(fan_in)+'.gz')
+        contact_index.write_index(self.contacts,processing.read_bins(self.bins),out,6,chunk_lines,fan_in)
+        return out,contact_index.read_index(out)
+
+    def test_sorted_with_ties_in_file_order(self):
+        out,index=self.indexed(1000,64)
+        lines=contact_index.read_lines(out,index,'chr1','chr1')
+        self.assertEqual([line.split('\t')[4] for line in lines],['8','3','5','4','7','1'])
+        self.assertEqual(contact_index.read_lines(out,index,'chr2','chr1'),['chr1\tchr1:0\tchr2\tchr2:100\t2'])
+        self.assertEqual(contact_index.read_lines(out,index,'chr1','chrX'),[])
+
+    def test_merge_passes(self):
+        #runs of 1 line, merged 2 at a time, give the same file as a single sort
+        out,index=self.indexed(1000,64)
+        merged_out,merged_index=self.indexed(1,2)
+        self.assertEqual(open(out,'rb').read(),open(merged_out,'rb').read())
+        self.assertEqual(open(contact_index.index_path(out)).read(),open(contact_index.index_path(merged_out)).read())
+
+    def test_write_chromosome(self):
+        out,index=self.indexed(2,2)
+        outname=os.path.join(self.tmpdir,'chr1.gz')
+        contact_index.write_chromosome(out,index,'1',outname)
+        lines=gzip.open(outname).read().splitlines()
+        self.assertEqual(lines[0],'chr1:0\tchr1:100\t8')
+        self.assertEqual(len(lines),6)
+
+if __name__=='__main__':
+    unittest.main()
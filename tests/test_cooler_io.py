@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from genomedisco import cooler_io, processing
+
+try:
+    import h5py
+except ImportError:
+    h5py=None
+
+#chr1 has 5 bins of 100bp (0-4) and chr2 has 3 (5-7). (2,6) and (4,5) are contacts between the 2 chromosomes
+chromosomes=['chr1','chr2']
+lengths=[500,300]
+bin1=[0,0,1,2,4,5,6]
+bin2=[0,2,4,6,5,7,6]
+counts=[1,3,2,7,9,4,5]
+
+def make_nodes(chromo_starts,resolution):
+    #nodes in the format of processing.read_nodes_from_bed, numbered in the order given
+    nodes={}
+    for chromo,starts in chromo_starts:
+        for start in starts:
+            node=chromo+':'+str(start)
+            nodes[node]={'idx':len(nodes),'chr':chromo,'start':start,'end':start+resolution}
+    return nodes
+
+@unittest.skipIf(h5py is None,'h5py is not installed')
+class CoolerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir=tempfile.mkdtemp()
+        self.cool=os.path.join(self.tmpdir,'test.cool')
+        cooler_io.write_cooler(self.cool,chromosomes,lengths,100,bin1,bin2,counts)
+        #the same contacts at 100bp, and summed into bins of 200bp
+        self.mcool=os.path.join(self.tmpdir,'test.mcool')
+        cooler_io.write_cooler(self.mcool,chromosomes,lengths,100,bin1,bin2,counts,'/resolutions/100')
+        cooler_io.write_cooler(self.mcool,chromosomes,lengths,200,[0,0,1,3],[0,1,2,4],[4,2,9,4],'/resolutions/200')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_read_chromosome_drops_trans_contacts(self):
+        starts1,starts2,values=cooler_io.read_chromosome(self.cool,'chr1')
+        self.assertEqual(list(starts1),[0,0,100])
+        self.assertEqual(list(starts2),[0,200,400])
+        self.assertEqual(list(values),[1,3,2])
+        starts1,starts2,values=cooler_io.read_chromosome(self.cool,'2')
+        self.assertEqual(list(starts1),[0,100])
+        self.assertEqual(list(starts2),[200,100])
+        self.assertEqual(list(values),[4,5])
+
+    def test_read_chromosome_missing(self):
+        self.assertRaises(SystemExit,cooler_io.read_chromosome,self.cool,'chrX')
+
+    def test_mcool_resolutions(self):
+        starts1,starts2,values=cooler_io.read_chromosome(self.mcool+'::/resolutions/100','chr1')
+        self.assertEqual(list(values),[1,3,2])
+        starts1,starts2,values=cooler_io.read_chromosome(self.mcool+'::/resolutions/200','chr1')
+        self.assertEqual(list(starts1),[0,0,200])
+        self.assertEqual(list(starts2),[0,200,400])
+        self.assertEqual(list(values),[4,2,9])
+
+    def test_mcool_without_resolution(self):
+        self.assertRaises(SystemExit,cooler_io.read_chromosome,self.mcool,'chr1')
+
+    def test_construct_csr_matrix(self):
+        #the nodes of chr2 come first, so that the node indices differ from the bins of the file
+        nodes=make_nodes([('chr2',[0,100,200]),('chr1',[0,100,200,300,400])],100)
+        m=processing.construct_csr_matrix_from_cooler(self.cool,nodes,'chr1').toarray()
+        self.assertEqual(m.shape,(8,8))
+        self.assertEqual(m.sum(),6)
+        self.assertEqual(m[nodes['chr1:0']['idx'],nodes['chr1:0']['idx']],1)
+        self.assertEqual(m[nodes['chr1:0']['idx'],nodes['chr1:200']['idx']],3)
+        self.assertEqual(m[nodes['chr1:100']['idx'],nodes['chr1:400']['idx']],2)
+        self.assertTrue(np.all(np.tril(m,-1)==0))
+
+    def test_construct_csr_matrix_one_chromosome(self):
+        nodes=make_nodes([('chr2',[0,100,200])],100)
+        m=processing.construct_csr_matrix_from_cooler(self.mcool+'::/resolutions/100',nodes).toarray()
+        self.assertEqual(m[0,2],4)
+        self.assertEqual(m[1,1],5)
+        self.assertEqual(m.sum(),9)
+
+    def test_construct_csr_matrix_resolution_mismatch(self):
+        #nodes of 200bp, while the bins of the file are 100bp
+        nodes=make_nodes([('chr1',[0,200,400])],200)
+        self.assertRaises(SystemExit,processing.construct_csr_matrix_from_cooler,self.cool,nodes,'chr1')
+
+    def test_construct_csr_matrix_several_chromosomes(self):
+        nodes=make_nodes([('chr1',[0,100,200,300,400]),('chr2',[0,100,200])],100)
+        self.assertRaises(SystemExit,processing.construct_csr_matrix_from_cooler,self.cool,nodes)
+
+if __name__=='__main__':
+    unittest.main()
@@ -0,0 +1,18 @@
+import subprocess
+import sys
+import unittest
+
+#the scoring script is started once per chromosome, so the plotting and reporting modules are only imported when they are used
+lazy_modules=['matplotlib','pylab','sklearn','psutil','scipy.stats','mpl_toolkits.axes_grid1']
+
+class ImportTest(unittest.TestCase):
+
+    def test_compute_reproducibility_imports(self):
+        #in a new interpreter, as other tests may have imported these modules already
+        code='import sys; import genomedisco.compute_reproducibility; print("\\n".join(sys.modules))'
+        modules=subprocess.check_output([sys.executable,'-c',code]).decode().split()
+        loaded=[module for module in modules if any([module==lazy or module.startswith(lazy+'.') for lazy in lazy_modules])]
+        self.assertEqual(loaded,[])
+
+if __name__=='__main__':
+    unittest.main()
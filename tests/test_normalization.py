@@ -0,0 +1,45 @@
+import os
+import unittest
+import numpy as np
+import scipy.sparse as sps
+
+from genomedisco import multiresolution, normalization, processing, scoring
+
+examples=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),'examples')
+
+def original_fill_diagonal(m):
+    #dense version of data_operations.hichip_add_diagonal and of the symmetrization of the random walks, before the normalizations moved to genomedisco.normalization
+    m=np.triu(m,1)
+    mtogether=m+m.T
+    sums=mtogether.sum(axis=1)
+    np.fill_diagonal(mtogether,sums.max()-sums)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        up=np.triu(mtogether/sums[:,None])
+    #the diagonal of the empty rows is infinite, and these rows are then empty in the transition matrix
+    up[:,sums==0]=0.0
+    up[sums==0,:]=0.0
+    return up+np.triu(up,1).T
+
+class FillDiagonalTest(unittest.TestCase):
+
+    def test_matches_original(self):
+        #node 3 has no contacts
+        m=np.array([[0,2,0,0,1],
+                    [0,0,5,0,0],
+                    [0,0,0,0,3],
+                    [0,0,0,0,0],
+                    [0,0,0,0,0]],dtype=float)
+        m_sym=normalization.fill_diagonal(normalization.symmetrize(sps.csr_matrix(m)))
+        self.assertTrue(np.allclose(m_sym.toarray(),original_fill_diagonal(m)))
+        self.assertEqual(m_sym[3].nnz,0)
+
+    def test_example_score(self):
+        #score of the example chr21 maps with the original code, without subsampling
+        bins=processing.read_bins(os.path.join(examples,'Bins.w50000.bed.gz'))
+        m1=multiresolution.read_intrachromosomal_contacts(os.path.join(examples,'HIC001.res50000.gz'),bins,['chr21'])['chr21']
+        m2=multiresolution.read_intrachromosomal_contacts(os.path.join(examples,'HIC002.res50000.gz'),bins,['chr21'])['chr21']
+        result=scoring.score(m1,m2,tmin=3,tmax=3,norm='fill_diagonal',transition=True,remove_diagonal=True,subsample=None)
+        self.assertEqual('{:.3f}'.format(result['score']),'0.686')
+
+if __name__=='__main__':
+    unittest.main()